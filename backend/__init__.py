@@ -0,0 +1,2 @@
+# Backend version, part of the key of every persistent cache entry (see result_cache)
+__version__ = "1.0.0"
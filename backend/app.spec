@@ -14,7 +14,8 @@ a = Analysis(
     ['ipc_server.py'],
     pathex=[],
     binaries=[] + numpy_binaries + scipy_binaries + mpl_binaries,
-    datas=[] + numpy_datas + scipy_datas + mpl_datas,
+    # numba only caches compiled kernels for functions whose source file exists on disk
+    datas=[('jit.py', 'backend')] + numpy_datas + scipy_datas + mpl_datas,
     hiddenimports=[
         # keep your explicit ones
         'IPython',
@@ -0,0 +1,96 @@
+"""
+Dense vs sparse Jacobian scaling on random gene networks.
+
+Run from the repository root:
+    python -m backend.benchmarks.jacobian_scaling [--sizes 100 1000 10000]
+
+For every size N a random circuit is built in which each protein has one or two gates
+reading randomly chosen regulators, so the number of edges grows linearly with N.
+The benchmark reports Jacobian assembly time and memory, and the wall time of a BDF
+integration using the sparse analytical Jacobian. The dense variants are skipped above
+--max-dense proteins since an N x N float64 matrix for 10k proteins is 800 MB.
+"""
+import argparse
+import time
+
+import numpy as np
+import scipy.integrate
+
+from backend.compiler import compile_circuit
+from backend.protein import Gate, Protein
+from backend.simulate import integrate_circuit, x_pulse
+
+GATE_CHOICES = ("act_hill", "rep_hill", "aa_and", "aa_or", "ar_and", "rr_or", "ar_or_single", "rr_and_single")
+
+
+def random_circuit(n, seed=0, num_inputs=2):
+    """Random sparse network of n proteins. The first num_inputs proteins are pulse-driven inputs."""
+    rng = np.random.default_rng(seed)
+    proteins = []
+    for i in range(n):
+        if i < num_inputs:
+            proteins.append(Protein(i, f"P{i}", 0.0, 1.0, [], x_pulse, (0, 30, 10, 2.0, 0.5)))
+            continue
+        gates = []
+        for _ in range(rng.integers(1, 3)):
+            gate_type = GATE_CHOICES[rng.integers(len(GATE_CHOICES))]
+            first, second = rng.integers(0, n, 2)
+            gates.append(Gate(gate_type, firstInput=int(first), secondInput=int(second),
+                              firstHill=float(rng.integers(1, 5)), secondHill=float(rng.integers(1, 5))))
+        proteins.append(Protein(i, f"P{i}", float(rng.random()), float(0.5 + rng.random()), gates,
+                                beta=float(1 + 3 * rng.random())))
+    return proteins
+
+
+def time_call(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def run(sizes, max_dense, duration, repeat):
+    header = f"{'N':>7} {'nnz':>8} {'dense MB':>9} {'sparse MB':>9} {'dense jac ms':>12} {'sparse jac ms':>13} {'BDF dense s':>11} {'BDF sparse s':>12}"
+    print(header)
+    print("-" * len(header))
+    t = np.linspace(0, duration, 200)
+    for n in sizes:
+        circuit = compile_circuit(random_circuit(n))
+        x = circuit.getInitialConcentrations()
+
+        sparse_ms, sparse = time_call(lambda: circuit.calcSparseJacobian(x, 1.0), repeat)
+        sparse_mb = (sparse.data.nbytes + sparse.indices.nbytes + sparse.indptr.nbytes) / 1e6
+        bdf_sparse_s, _ = time_call(lambda: integrate_circuit(circuit, t, method="BDF"), 1)
+
+        if n <= max_dense:
+            dense_ms, _ = time_call(lambda: circuit.calcJacobian(x, 1.0), repeat)
+            dense_ms = f"{1e3 * dense_ms:12.2f}"
+            bdf_dense_s, _ = time_call(lambda: _integrate_bdf_dense(circuit, t), 1)
+            bdf_dense_s = f"{bdf_dense_s:11.2f}"
+        else:
+            dense_ms = f"{'skipped':>12}"
+            bdf_dense_s = f"{'skipped':>11}"
+
+        print(f"{n:7d} {sparse.nnz:8d} {8 * n * n / 1e6:9.1f} {sparse_mb:9.3f} {dense_ms} "
+              f"{1e3 * sparse_ms:13.2f} {bdf_dense_s} {bdf_sparse_s:12.2f}")
+
+
+def _integrate_bdf_dense(circuit, t):
+    return scipy.integrate.solve_ivp(
+        lambda time, y: circuit.calcRates(y, time),
+        (t[0], t[-1]),
+        circuit.getInitialConcentrations(),
+        method="BDF",
+        t_eval=t,
+        jac=lambda time, y: circuit.calcJacobian(y, time),
+    )
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[100, 300, 1000, 3000, 10000])
+    ap.add_argument("--max-dense", type=int, default=3000, help="Largest N for which dense Jacobians are timed")
+    ap.add_argument("--duration", type=float, default=20.0)
+    ap.add_argument("--repeat", type=int, default=5, help="Repetitions for Jacobian assembly timings")
+    args = ap.parse_args()
+    run(args.sizes, args.max_dense, args.duration, args.repeat)
@@ -0,0 +1,770 @@
+import hashlib
+from collections import defaultdict
+
+import numpy as np
+import scipy.sparse
+import scipy.sparse.csgraph
+
+from . import hill, jit
+from .inputs import InputSchedule, TableInput, input_edges
+
+
+# Gate types that only read mFirstInput
+SINGLE_INPUT_GATES = ("act_hill", "rep_hill")
+
+# Gate types that read both mFirstInput and mSecondInput
+DOUBLE_INPUT_GATES = (
+    "act_hill_mult",
+    "rep_hill_mult",
+    "aa_and",
+    "aa_or",
+    "aa_or_single",
+    "rr_and",
+    "rr_or",
+    "rr_and_single",
+    "ar_and",
+    "ar_or",
+    "ar_and_single",
+    "ar_or_single",
+)
+
+GATE_TYPES = SINGLE_INPUT_GATES + DOUBLE_INPUT_GATES
+
+# Up to this many distinct Hill coefficients are raised one coefficient at a time, which lets
+# hill.hill_power use multiplication for integer ones; with more, one pow covers all terms
+MAX_HILL_BLOCKS = 8
+
+
+class GateGroup:
+    """All gates of one type in a circuit, stored as parallel index/parameter arrays."""
+
+    def __init__(self, type, targets, firstInputs, secondInputs, firstHills, secondHills):
+        if type not in GATE_TYPES:
+            raise ValueError(f"Unknown regulatory function type: {type}")
+        self.mType = type
+        self.mTargets = np.asarray(targets, dtype=np.intp)
+        self.mFirstInputs = np.asarray(firstInputs, dtype=np.intp)
+        self.mSecondInputs = np.asarray(secondInputs, dtype=np.intp)
+        self.mFirstHills = np.asarray(firstHills, dtype=float)
+        self.mSecondHills = np.asarray(secondHills, dtype=float)
+
+    def __len__(self):
+        return len(self.mTargets)
+
+    def evaluate(self, conc):
+        """Evaluate every gate in the group for total concentrations conc with shape (..., N)."""
+        x = conc[..., self.mFirstInputs]
+        y = x if self.mType in SINGLE_INPUT_GATES else conc[..., self.mSecondInputs]
+        return hill.evaluate(self.mType, x, y, self.mFirstHills, self.mSecondHills)
+
+    def derivatives(self, conc):
+        """
+        Partial derivatives of every gate in the group with respect to its first and second input.
+        Returns (d/dx, d/dy); d/dy is all zeros for single-input gate types.
+        """
+        ax, px, sx = _occupancy_slopes(conc[self.mFirstInputs], self.mFirstHills)
+        if self.mType == "act_hill":
+            return sx, np.zeros_like(sx)
+        if self.mType == "rep_hill":
+            return -sx, np.zeros_like(sx)
+
+        ay, py, sy = _occupancy_slopes(conc[self.mSecondInputs], self.mSecondHills)
+        # Chain rule through the occupancies, as in hill.combine; d(px)/dx = -sx
+        if self.mType in ("act_hill_mult", "aa_and"):
+            return sx * ay, ax * sy
+        if self.mType in ("rep_hill_mult", "rr_and"):
+            return -sx * py, -px * sy
+        if self.mType == "aa_or":
+            return sx * py, px * sy
+        if self.mType == "rr_or":
+            return -sx * ay, -ax * sy
+        if self.mType == "ar_and":
+            return sx * py, -ax * sy
+        if self.mType == "ar_or":
+            return sx * ay, -px * sy
+
+        # Single occupancy types divide by px + ax py = (1 + u + v) / ((1 + u) (1 + v))
+        denom = px + ax * py
+        if self.mType == "aa_or_single":
+            return sx * (py / denom) ** 2, sy * (px / denom) ** 2
+        if self.mType == "rr_and_single":
+            return -sx * (py / denom) ** 2, -sy * (px / denom) ** 2
+        if self.mType == "ar_and_single":
+            return sx * py / denom ** 2, -sy * ax * px / denom ** 2
+        # ar_or_single
+        return sx * ay * py / denom ** 2, -sy * px / denom ** 2
+
+
+def _occupancy_slopes(x, n):
+    """
+    (ax, px, d(ax)/dx) for inputs x with Hill coefficients n. The slope n ax px / x stays finite
+    where x**n overflows; at x = 0 it takes the one-sided limit (1 for n == 1, otherwise 0).
+    """
+    ax, px = hill.occupancies(x, n)
+    safe_x = np.where(x > 0, x, 1.0)
+    return ax, px, np.where(x > 0, n * ax * px / safe_x, np.where(n == 1, 1.0, 0.0))
+
+
+class CompiledCircuit:
+    """
+    Flat, array-based form of a parsed protein array.
+
+    The right-hand side only touches NumPy arrays: gates are grouped by type so each
+    group is evaluated with one vectorized call, and the results are scattered onto
+    their target proteins with np.bincount. When numba is installed (or useJit=True),
+    the rates and Jacobians are instead computed by the native kernels in jit.py.
+
+    Only the first numStates proteins are integrated. The others are input-only slots: their
+    internal concentration is always zero, they carry no gates, and gates read their inputs.
+    constProd is a fixed production added to every protein's gate sum (see fold_constants).
+    """
+
+    def __init__(self, names, initConc, degrad, beta, gateGroups, inputs, useJit=None, numStates=None,
+                 constProd=None):
+        self.mNames = list(names)
+        self.mInitConc = np.asarray(initConc, dtype=float)
+        self.mDegradation = np.asarray(degrad, dtype=float)
+        self.mBeta = np.asarray(beta, dtype=float)
+        self.mGateGroups = list(gateGroups)
+        # List of (protein index, function, args) for proteins driven by an external input
+        self.mInputs = list(inputs)
+        # Piecewise-constant inputs are looked up in one compiled schedule, the others called directly
+        edges = [input_edges(func, args) for _, func, args in self.mInputs]
+        scheduled = [k for k, e in enumerate(edges) if e is not None]
+        self.mSchedule = InputSchedule([self.mInputs[k][1:] for k in scheduled], [edges[k] for k in scheduled])
+        self.mScheduleColumns = np.array([self.mInputs[k][0] for k in scheduled], dtype=np.intp)
+        self.mDirectInputs = [entry for entry, e in zip(self.mInputs, edges) if e is None]
+        self.mNumStates = len(self.mInitConc) if numStates is None else int(numStates)
+        self.mConstProd = np.zeros(len(self.mInitConc)) if constProd is None else np.asarray(constProd, dtype=float)
+        # CSR structure of the Jacobian, built on first use by _buildSparseStructure
+        self.mJacIndices = None
+        self.mJacIndptr = None
+        self.mJacEntryMap = None
+        self.mUseJit = jit.AVAILABLE if useJit is None else bool(useJit)
+        if self.mUseJit and not jit.AVAILABLE:
+            raise ValueError("useJit=True requires numba")
+        # All gate groups as one flat table, in group order, for the jit kernels
+        self.mGateTable = _gate_table(self.mGateGroups)
+        # The same gates with identical Hill terms and identical gates shared, for the right-hand side
+        self.mTermTable = _term_table(self.mGateTable)
+        self.mHillBlocks = _blocks(self.mTermTable[1], MAX_HILL_BLOCKS)
+        self.mCodeBlocks = _blocks(self.mTermTable[2])
+        self.mHash = None
+
+    def getNumProteins(self):
+        """Number of proteins, including input-only slots."""
+        return len(self.mInitConc)
+
+    def getNumStates(self):
+        """Length of the state vector."""
+        return self.mNumStates
+
+    def getNames(self):
+        return self.mNames
+
+    def getHash(self):
+        """
+        Hex digest identifying the circuit: equal for circuits with the same proteins, parameters,
+        inputs and gates in the same order.
+        """
+        if self.mHash is None:
+            digest = hashlib.sha256("\0".join(self.mNames).encode())
+            digest.update(str(self.mNumStates).encode())
+            for array in (self.mInitConc, self.mDegradation, self.mBeta, self.mConstProd) + self.mGateTable:
+                digest.update(np.ascontiguousarray(array).tobytes())
+            for idx, func, args in self.mInputs:
+                digest.update(f"{idx}:{func.__module__}.{func.__qualname__}".encode())
+                for arg in args:
+                    digest.update(arg.getHash().encode() if isinstance(arg, TableInput) else np.asarray(arg).tobytes())
+            self.mHash = digest.hexdigest()
+        return self.mHash
+
+    def getInitialConcentrations(self):
+        return self.mInitConc[:self.mNumStates].copy()
+
+    def getExternalConcentrations(self, t):
+        """External concentrations at time t. Returns shape (N,) for scalar t, (len(t), N) for arrays."""
+        t = np.asarray(t, dtype=float)
+        ext = np.zeros(t.shape + (len(self.mNames),))
+        if len(self.mScheduleColumns):
+            ext[..., self.mScheduleColumns] = self.mSchedule.at(float(t)) if t.ndim == 0 else self.mSchedule(t)
+        for idx, func, args in self.mDirectInputs:
+            ext[..., idx] = func(t, *args)
+        return ext
+
+    def calcProdRates(self, conc):
+        """
+        Summed gate output for each protein, for total concentrations conc with shape (N,) or (..., N).
+        Every distinct (input, Hill coefficient) term and every distinct gate is evaluated once.
+        """
+        conc = np.asarray(conc, dtype=float)
+        if self.mUseJit and conc.ndim == 1:
+            return jit.prod_rates(conc, self.mConstProd, *self.mTermTable)
+        term_inputs, _, codes, first_terms, second_terms, targets, gate_index = self.mTermTable
+        batch = conc.shape[:-1]
+        active = np.empty(batch + (len(term_inputs),))
+        repressed = np.empty(batch + (len(term_inputs),))
+        for hills, start, stop in self.mHillBlocks:
+            active[..., start:stop], repressed[..., start:stop] = hill.occupancies(conc[..., term_inputs[start:stop]], hills)
+        values = np.empty(batch + (len(codes),))
+        for code, start, stop in self.mCodeBlocks:
+            first, second = first_terms[start:stop], second_terms[start:stop]
+            values[..., start:stop] = hill.combine(
+                code, active[..., first], repressed[..., first], active[..., second], repressed[..., second]
+            )
+        if conc.ndim == 1:
+            return np.bincount(targets, weights=values[gate_index], minlength=self.getNumProteins()) + self.mConstProd
+        prod = np.zeros(conc.shape) + self.mConstProd
+        np.add.at(prod, (Ellipsis, targets), values[..., gate_index])
+        return prod
+
+    def calcRates(self, internal, t, ext=None):
+        """
+        odeint-compatible right-hand side: d(internal concentration)/dt. internal may also be
+        (len(t), N) to evaluate the rates along a trajectory. ext optionally overrides the external
+        concentrations at t, e.g. with values that are known to be constant over the current
+        integration segment.
+        """
+        ext = self.getExternalConcentrations(t) if ext is None else ext
+        if self.mUseJit and np.ndim(internal) == 1:
+            return jit.rates(
+                np.asarray(internal, dtype=float), np.asarray(ext, dtype=float), self.mBeta, self.mDegradation,
+                self.mConstProd, *self.mTermTable
+            )
+        conc = self._totalConcentrations(internal, ext)
+        ns = self.mNumStates
+        return self.mBeta[:ns] * self.calcProdRates(conc)[..., :ns] - self.mDegradation[:ns] * internal
+
+    def calcJacobian(self, internal, t, ext=None):
+        """odeint-compatible Dfun: J[i, j] = d(rate of protein i)/d(internal concentration of protein j)."""
+        ext = self.getExternalConcentrations(t) if ext is None else ext
+        if self.mUseJit:
+            return jit.jacobian(
+                np.asarray(internal, dtype=float), np.asarray(ext, dtype=float), self.mBeta, self.mDegradation,
+                *self.mGateTable
+            )
+        conc = self._totalConcentrations(internal, ext)
+        n = self.getNumProteins()
+        jac = np.zeros((n, n))
+        for group in self.mGateGroups:
+            d_first, d_second = group.derivatives(conc)
+            np.add.at(jac, (group.mTargets, group.mFirstInputs), d_first)
+            if group.mType not in SINGLE_INPUT_GATES:
+                np.add.at(jac, (group.mTargets, group.mSecondInputs), d_second)
+        jac *= self.mBeta[:, np.newaxis]
+        jac[np.diag_indices(n)] -= self.mDegradation
+        ns = self.mNumStates
+        return jac if ns == n else jac[:ns, :ns]
+
+    def _totalConcentrations(self, internal, ext):
+        """
+        Total concentrations of all proteins, input-only slots included, for internal states with
+        shape (..., numStates).
+        """
+        if self.mNumStates == self.getNumProteins():
+            return internal + ext
+        internal = np.asarray(internal, dtype=float)
+        if internal.ndim == 1:
+            conc = np.array(ext, dtype=float)
+        else:
+            conc = np.array(np.broadcast_to(ext, internal.shape[:-1] + (self.getNumProteins(),)))
+        conc[..., :self.mNumStates] += internal
+        return conc
+
+    def calcGateDerivatives(self, conc):
+        """Partial derivatives (d/dx, d/dy) of every gate with respect to its inputs, in mGateTable order."""
+        if self.mUseJit:
+            codes, _, first_inputs, second_inputs, first_hills, second_hills = self.mGateTable
+            return jit.gate_derivatives(conc, codes, first_inputs, second_inputs, first_hills, second_hills)
+        derivatives = [group.derivatives(conc) for group in self.mGateGroups]
+        return (
+            np.concatenate([d_first for d_first, _ in derivatives] + [np.empty(0)]),
+            np.concatenate([d_second for _, d_second in derivatives] + [np.empty(0)]),
+        )
+
+    def getBandwidth(self):
+        """(lower, upper) Jacobian bandwidth if the integrator should treat it as banded, otherwise None."""
+        return None
+
+    def calcBandedJacobian(self, internal, t, ext=None):
+        """
+        odeint-compatible banded Dfun for use with ml/mu = getBandwidth():
+        J[i, j] is stored at [i - j + upper, j].
+        """
+        lower, upper = self.getBandwidth()
+        jac = self.calcSparseJacobian(internal, t, ext).tocoo()
+        band = np.zeros((lower + upper + 1, self.getNumStates()))
+        band[jac.row - jac.col + upper, jac.col] = jac.data
+        return band
+
+    def getJacobianSparsity(self):
+        """Sparsity pattern of the Jacobian (diagonal plus one entry per gate input) as a CSR matrix."""
+        self._buildSparseStructure()
+        n = self.getNumStates()
+        ones = np.ones(len(self.mJacIndices), dtype=bool)
+        return scipy.sparse.csr_matrix((ones, self.mJacIndices, self.mJacIndptr), shape=(n, n))
+
+    def calcSparseJacobian(self, internal, t, ext=None):
+        """Same values as calcJacobian, returned as a CSR matrix with storage proportional to the number of edges."""
+        self._buildSparseStructure()
+        conc = np.asarray(
+            self._totalConcentrations(internal, self.getExternalConcentrations(t) if ext is None else ext), dtype=float
+        )
+        all_first, all_second = self.calcGateDerivatives(conc)
+        entries = []
+        start = 0
+        for group in self.mGateGroups:
+            d_first, d_second = all_first[start:start + len(group)], all_second[start:start + len(group)]
+            start += len(group)
+            beta = self.mBeta[group.mTargets]
+            entries.append(beta * d_first)
+            if group.mType not in SINGLE_INPUT_GATES:
+                entries.append(beta * d_second)
+        entries.append(-self.mDegradation)
+        # Entries for input-only columns land in one extra slot past the end, which is dropped
+        data = np.bincount(self.mJacEntryMap, weights=np.concatenate(entries), minlength=len(self.mJacIndices) + 1)
+        data = data[:len(self.mJacIndices)]
+        n = self.getNumStates()
+        return scipy.sparse.csr_matrix((data, self.mJacIndices, self.mJacIndptr), shape=(n, n))
+
+    def getComponents(self):
+        """
+        Strongly connected components of the regulatory graph (an edge j -> i for every gate of
+        protein i reading protein j), as arrays of protein indices in topological order: every
+        component only reads proteins of earlier components and its own.
+        """
+        graph = self.getJacobianSparsity().T
+        num_components, labels = scipy.sparse.csgraph.connected_components(graph, directed=True, connection="strong")
+        # Kahn's algorithm on the condensation
+        edges = graph.tocoo()
+        between = labels[edges.row] != labels[edges.col]
+        sources, targets = labels[edges.row[between]], labels[edges.col[between]]
+        condensation = scipy.sparse.csr_matrix(
+            (np.ones(len(sources), dtype=bool), (sources, targets)), shape=(num_components, num_components)
+        )
+        indegree = np.bincount(condensation.indices, minlength=num_components)
+        ready = list(np.flatnonzero(indegree == 0))
+        order = []
+        while ready:
+            c = ready.pop()
+            order.append(c)
+            for d in condensation.indices[condensation.indptr[c]:condensation.indptr[c + 1]]:
+                indegree[d] -= 1
+                if indegree[d] == 0:
+                    ready.append(d)
+        return [np.flatnonzero(labels == c) for c in order]
+
+    def getDownstream(self, proteins):
+        """
+        Boolean mask of proteins and every protein that reads one of them, directly or through
+        other gates: the proteins whose trajectories can change when those proteins change.
+        """
+        graph = self.getJacobianSparsity()
+        reached = np.zeros(self.getNumStates(), dtype=bool)
+        reached[np.asarray(proteins, dtype=np.intp)] = True
+        frontier = reached.copy()
+        while frontier.any():
+            # Row i of the sparsity pattern lists the proteins read by the gates of protein i
+            frontier = (graph @ frontier.astype(np.int64) > 0) & ~reached
+            reached |= frontier
+        return reached
+
+    def _buildSparseStructure(self):
+        """
+        Precompute the CSR layout of the Jacobian and, for every (row, col) entry produced by
+        calcSparseJacobian (in the same order), the slot of the CSR data array it adds into.
+        Entries in input-only columns map to the slot just past the end.
+        """
+        if self.mJacEntryMap is not None:
+            return
+        n = self.getNumStates()
+        rows, cols = [], []
+        for group in self.mGateGroups:
+            rows.append(group.mTargets)
+            cols.append(group.mFirstInputs)
+            if group.mType not in SINGLE_INPUT_GATES:
+                rows.append(group.mTargets)
+                cols.append(group.mSecondInputs)
+        rows.append(np.arange(self.getNumProteins()))
+        cols.append(np.arange(self.getNumProteins()))
+        rows = np.concatenate(rows).astype(np.intp)
+        cols = np.concatenate(cols).astype(np.intp)
+        state = (rows < n) & (cols < n)
+
+        # Unique (row, col) pairs in row-major order give the CSR structure
+        keys = rows[state] * n + cols[state]
+        unique_keys, entry_map = np.unique(keys, return_inverse=True)
+        self.mJacIndices = (unique_keys % n).astype(np.intp)
+        self.mJacIndptr = np.searchsorted(unique_keys // n, np.arange(n + 1)).astype(np.intp)
+        self.mJacEntryMap = np.full(len(rows), len(unique_keys), dtype=np.intp)
+        self.mJacEntryMap[state] = entry_map.ravel()
+
+
+def _term_table(gateTable):
+    """
+    Common subexpressions of a gate table: (term inputs, term Hills, gate codes, gate first terms,
+    gate second terms, targets, gate index).
+
+    A term is a distinct (input, Hill coefficient) pair, whose occupancies every gate reading it
+    shares; terms are sorted by Hill coefficient. A gate is a distinct (type, first term, second
+    term) triple, sorted by type and evaluated once for all of its targets: gate gateIndex[k]
+    adds to protein targets[k].
+    """
+    codes, targets, first, second, first_hills, second_hills = gateTable
+    single = (codes == jit.ACT_HILL) | (codes == jit.REP_HILL)
+    # Single-input gates carry an unused second input and Hill coefficient; point them at the first
+    second = np.where(single, first, second)
+    second_hills = np.where(single, first_hills, second_hills)
+
+    hills, hill_ids = np.unique(np.concatenate((first_hills, second_hills)), return_inverse=True)
+    num_inputs = max(int(np.max(first, initial=0)), int(np.max(second, initial=0))) + 1
+    term_keys, term_index = np.unique(hill_ids.ravel() * num_inputs + np.concatenate((first, second)), return_inverse=True)
+    term_index = term_index.ravel()
+    num_gates, num_terms = len(codes), len(term_keys)
+    gate_keys, gate_index = np.unique(
+        (codes * num_terms + term_index[:num_gates]) * num_terms + term_index[num_gates:], return_inverse=True
+    )
+    return (
+        (term_keys % num_inputs).astype(np.intp),
+        hills[term_keys // num_inputs],
+        (gate_keys // (num_terms * num_terms)).astype(np.int64),
+        (gate_keys // num_terms % num_terms).astype(np.intp),
+        (gate_keys % num_terms).astype(np.intp),
+        targets,
+        gate_index.ravel().astype(np.intp),
+    )
+
+
+def _blocks(values, maxBlocks=None):
+    """
+    (value, start, stop) for every run of equal entries of the sorted array values. With more than
+    maxBlocks runs, a single (values, 0, len(values)) block instead.
+    """
+    starts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]]) if len(values) else np.empty(0, dtype=np.intp)
+    if maxBlocks is not None and len(starts) > maxBlocks:
+        return [(values, 0, len(values))]
+    stops = np.append(starts[1:], len(values))
+    return [(values[start], int(start), int(stop)) for start, stop in zip(starts, stops)]
+
+
+def _gate_table(groups):
+    """(type codes, targets, first inputs, second inputs, first Hills, second Hills) of all groups, concatenated."""
+    codes = [np.full(len(group), GATE_TYPES.index(group.mType), dtype=np.int64) for group in groups]
+    return (
+        np.concatenate(codes + [np.empty(0, dtype=np.int64)]),
+        np.concatenate([group.mTargets for group in groups] + [np.empty(0, dtype=np.intp)]),
+        np.concatenate([group.mFirstInputs for group in groups] + [np.empty(0, dtype=np.intp)]),
+        np.concatenate([group.mSecondInputs for group in groups] + [np.empty(0, dtype=np.intp)]),
+        np.concatenate([group.mFirstHills for group in groups] + [np.empty(0)]),
+        np.concatenate([group.mSecondHills for group in groups] + [np.empty(0)]),
+    )
+
+
+def changed_proteins(old, new):
+    """
+    Indices of the proteins of new whose initial concentration, loss rate, beta, external input
+    or set of incoming gates differ from old. Both circuits must list the same proteins in the same
+    order; gates are compared as (type, inputs, Hill coefficients) regardless of their order.
+    """
+    if old.getNames() != new.getNames():
+        raise ValueError("changed_proteins needs two circuits with the same proteins")
+    changed = (old.mInitConc != new.mInitConc) | (old.mDegradation != new.mDegradation) | (old.mBeta != new.mBeta)
+
+    old_inputs = {i: (func, args) for i, func, args in old.mInputs}
+    new_inputs = {i: (func, args) for i, func, args in new.mInputs}
+    for i in old_inputs.keys() | new_inputs.keys():
+        if not _same_input(old_inputs.get(i), new_inputs.get(i)):
+            changed[i] = True
+
+    # Count every distinct gate row in both circuits; a row whose counts differ changes its target
+    rows = np.concatenate((_gate_rows(old), _gate_rows(new)))
+    unique, inverse = np.unique(rows, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    num_old = len(rows) - len(new.mGateTable[0])
+    counts_old = np.bincount(inverse[:num_old], minlength=len(unique))
+    counts_new = np.bincount(inverse[num_old:], minlength=len(unique))
+    changed[unique[counts_old != counts_new, 0].astype(np.intp)] = True
+    return np.flatnonzero(changed)
+
+
+def _gate_rows(circuit):
+    """One (target, type code, first input, second input, first Hill, second Hill) row per gate."""
+    codes, targets, first, second, first_hills, second_hills = circuit.mGateTable
+    return np.column_stack((targets, codes, first, second, first_hills, second_hills)).astype(float)
+
+
+def _same_input(a, b):
+    if a is None or b is None:
+        return a is b
+    (func_a, args_a), (func_b, args_b) = a, b
+    return func_a is func_b and len(args_a) == len(args_b) and all(
+        np.array_equal(x, y) for x, y in zip(args_a, args_b)
+    )
+
+
+def component_circuit(circuit, members, upstreamInputs, constants=None):
+    """
+    The sub-circuit of the proteins members, with every other protein they read turned into an input.
+
+    upstreamInputs maps each such protein index to a (function, args) pair giving its total
+    concentration over time. The sub-circuit lists the members first, in order, as its states,
+    followed by the upstream proteins as input-only slots. Gates that only read upstream proteins
+    listed in constants are folded (see fold_constants). Returns (sub-circuit, upstream indices).
+    """
+    members = np.asarray(members, dtype=np.intp)
+    is_member = np.zeros(circuit.getNumProteins(), dtype=bool)
+    is_member[members] = True
+
+    kept = []
+    read = set()
+    for group in circuit.mGateGroups:
+        mask = is_member[group.mTargets]
+        if mask.any():
+            kept.append((group, mask))
+            read.update(group.mFirstInputs[mask].tolist())
+            if group.mType not in SINGLE_INPUT_GATES:
+                read.update(group.mSecondInputs[mask].tolist())
+    upstream = np.array(sorted(i for i in read if not is_member[i]), dtype=np.intp)
+
+    local = np.full(circuit.getNumProteins(), -1, dtype=np.intp)
+    local[members] = np.arange(len(members))
+    local[upstream] = len(members) + np.arange(len(upstream))
+    groups = [
+        GateGroup(group.mType, local[group.mTargets[mask]], local[group.mFirstInputs[mask]],
+                  local[group.mSecondInputs[mask]], group.mFirstHills[mask], group.mSecondHills[mask])
+        for group, mask in kept
+    ]
+    inputs = [(local[i], func, args) for i, func, args in circuit.mInputs if is_member[i]]
+    inputs += [(local[i], *upstreamInputs[i]) for i in upstream]
+
+    padding = np.zeros(len(upstream))
+    const_prod = np.concatenate((circuit.mConstProd[members], padding))
+    if constants:
+        values = {local[i]: value for i, value in constants.items() if i in upstreamInputs and local[i] >= 0}
+        groups, _ = _fold_groups(groups, values, const_prod)
+    sub = CompiledCircuit(
+        [circuit.mNames[i] for i in np.concatenate((members, upstream))],
+        np.concatenate((circuit.mInitConc[members], padding)),
+        np.concatenate((circuit.mDegradation[members], padding)),
+        np.concatenate((circuit.mBeta[members], padding)),
+        groups,
+        inputs,
+        useJit=circuit.mUseJit,
+        numStates=len(members),
+        constProd=const_prod,
+    )
+    return sub, upstream
+
+
+def fold_constants(circuit, constants):
+    """
+    Evaluate the gates that only read proteins of known constant total concentration once.
+
+    constants maps protein indices to their total concentrations. Every gate whose inputs are all
+    listed is removed and its value added to the constant production of its target. Returns the
+    folded circuit, or circuit itself when no gate can be folded.
+    """
+    const_prod = circuit.mConstProd.copy()
+    groups, folded = _fold_groups(circuit.mGateGroups, constants, const_prod)
+    if not folded:
+        return circuit
+    return CompiledCircuit(
+        circuit.mNames, circuit.mInitConc, circuit.mDegradation, circuit.mBeta, groups, circuit.mInputs,
+        useJit=circuit.mUseJit, numStates=circuit.getNumStates(), constProd=const_prod
+    )
+
+
+def _fold_groups(groups, constants, constProd):
+    """
+    The gate groups without the gates whose inputs are all in constants, whose values are added to
+    constProd in place. Returns (groups, whether any gate was folded).
+    """
+    if not constants:
+        return list(groups), False
+    known = np.zeros(len(constProd), dtype=bool)
+    conc = np.zeros(len(constProd))
+    for i, value in constants.items():
+        known[i] = True
+        conc[i] = value
+
+    kept = []
+    folded = False
+    for group in groups:
+        fixed = known[group.mFirstInputs] & known[group.mSecondInputs]
+        if fixed.any():
+            folded = True
+            values = GateGroup(
+                group.mType, group.mTargets[fixed], group.mFirstInputs[fixed], group.mSecondInputs[fixed],
+                group.mFirstHills[fixed], group.mSecondHills[fixed]
+            ).evaluate(conc)
+            constProd += np.bincount(group.mTargets[fixed], weights=values, minlength=len(constProd))
+        if not fixed.all():
+            keep = ~fixed
+            kept.append(GateGroup(
+                group.mType, group.mTargets[keep], group.mFirstInputs[keep], group.mSecondInputs[keep],
+                group.mFirstHills[keep], group.mSecondHills[keep]
+            ))
+    return kept, folded
+
+
+def compile_circuit(protein_array, use_jit=None):
+    """
+    Turn the protein array produced by parse_circuit into a CompiledCircuit.
+    use_jit selects the numba kernels; None uses them whenever numba is installed.
+    """
+    n = len(protein_array)
+    names = [None] * n
+    init_conc = np.zeros(n)
+    degrad = np.zeros(n)
+    beta = np.zeros(n)
+    inputs = []
+    tables = defaultdict(lambda: defaultdict(list))
+
+    for protein in protein_array:
+        i = protein.mID
+        names[i] = protein.mName
+        init_conc[i] = protein.mInternalConc
+        degrad[i] = protein.mDegradation
+        beta[i] = protein.mBeta
+        if protein.mExtConcFunc is not None:
+            args = tuple(protein.mExtConcFuncArgs) if protein.mExtConcFuncArgs is not None else ()
+            inputs.append((i, protein.mExtConcFunc, args))
+
+        for gate in protein.mGates:
+            if gate.mType not in GATE_TYPES:
+                raise ValueError(f"Unknown regulatory function type: {gate.mType}")
+            second = gate.mSecondInput if gate.mSecondInput is not None else gate.mFirstInput
+            table = tables[gate.mType]
+            table["targets"].append(i)
+            table["firstInputs"].append(int(gate.mFirstInput))
+            table["secondInputs"].append(int(second))
+            table["firstHills"].append(gate.mFirstHill)
+            table["secondHills"].append(gate.mSecondHill)
+
+    groups = [GateGroup(gate_type, **tables[gate_type]) for gate_type in GATE_TYPES if gate_type in tables]
+    return CompiledCircuit(names, init_conc, degrad, beta, groups, inputs, useJit=use_jit)
+
+
+class EnsembleCircuit(CompiledCircuit):
+    """
+    M copies of a compiled circuit with per-member parameters, integrated as one block-diagonal system.
+
+    The state vector is the members' internal concentrations laid end to end (member-major), and
+    every gate group indexes into it, so the right-hand side and Jacobians of CompiledCircuit apply
+    unchanged. External inputs are shared by all members.
+    """
+
+    def __init__(self, base, initConc, degrad, beta, firstHills, secondHills):
+        numMembers, memberSize = initConc.shape
+        offsets = memberSize * np.arange(numMembers)[:, np.newaxis]
+        groups = []
+        for group, first_hills, second_hills in zip(base.mGateGroups, firstHills, secondHills):
+            groups.append(GateGroup(
+                group.mType,
+                (offsets + group.mTargets).ravel(),
+                (offsets + group.mFirstInputs).ravel(),
+                (offsets + group.mSecondInputs).ravel(),
+                first_hills.ravel(),
+                second_hills.ravel(),
+            ))
+        super().__init__(
+            base.mNames, initConc.ravel(), degrad.ravel(), beta.ravel(), groups, base.mInputs, useJit=base.mUseJit
+        )
+        self.mNumMembers = numMembers
+        self.mMemberSize = memberSize
+        # Bandwidth of a single member's Jacobian; the block-diagonal system has the same bandwidth
+        pattern = base.getJacobianSparsity().tocoo()
+        self.mBandwidth = (int(max(0, np.max(pattern.row - pattern.col))), int(max(0, np.max(pattern.col - pattern.row))))
+
+    def getNumMembers(self):
+        return self.mNumMembers
+
+    def getExternalConcentrations(self, t):
+        return np.tile(super().getExternalConcentrations(t), self.mNumMembers)
+
+    def getBandwidth(self):
+        return self.mBandwidth
+
+
+# Per-protein parameters that can be varied, keyed by their circuit JSON field name
+PROTEIN_PARAMETERS = ("beta", "lossRate", "initialConcentration")
+
+# Hill coefficients are addressed like the circuit JSON hillCoefficients ids: "<source>-<target>"
+HILL_PARAMETER = "hill"
+
+
+def parameter_slots(circuit, target, parameter):
+    """
+    Locate a named parameter of a compiled circuit.
+
+    (target, parameter) is (protein name, one of PROTEIN_PARAMETERS) or ("<source>-<target>", "hill").
+    Returns ("protein", protein index) or ("hill", [(group index, "first" | "second", entry indices)]).
+    """
+    if parameter in PROTEIN_PARAMETERS:
+        if target not in circuit.mNames:
+            raise ValueError(f"Unknown protein '{target}' for parameter '{parameter}'")
+        return "protein", circuit.mNames.index(target)
+
+    if parameter != HILL_PARAMETER:
+        raise ValueError(f"Unknown parameter '{parameter}', expected one of {PROTEIN_PARAMETERS + (HILL_PARAMETER,)}")
+
+    names = np.asarray(circuit.mNames, dtype=object)
+    slots = []
+    for g, group in enumerate(circuit.mGateGroups):
+        target_names = names[group.mTargets]
+        for which, inputs in (("first", group.mFirstInputs), ("second", group.mSecondInputs)):
+            if which == "second" and group.mType in SINGLE_INPUT_GATES:
+                continue
+            ids = names[inputs] + "-" + target_names
+            entries = np.flatnonzero(ids == target)
+            if len(entries):
+                slots.append((g, which, entries))
+    if not slots:
+        raise ValueError(f"No gate uses Hill coefficient '{target}'")
+    return "hill", slots
+
+
+def parameter_value(circuit, target, parameter, slot=None):
+    """Current value of a named parameter (see parameter_slots); slot may pass its already located slot."""
+    kind, where = parameter_slots(circuit, target, parameter) if slot is None else slot
+    if kind == "protein":
+        field = {"beta": circuit.mBeta, "lossRate": circuit.mDegradation, "initialConcentration": circuit.mInitConc}
+        return float(field[parameter][where])
+    g, which, entries = where[0]
+    group = circuit.mGateGroups[g]
+    return float((group.mFirstHills if which == "first" else group.mSecondHills)[entries[0]])
+
+
+def make_ensemble(circuit, parameters, values):
+    """
+    Build an EnsembleCircuit with one member per row of values.
+
+    parameters is a list of (target, parameter) pairs (see parameter_slots) naming the columns of
+    the (M, P) matrix values. Parameters that are not listed keep the base circuit's value.
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    if values.shape[1] != len(parameters):
+        raise ValueError(f"Expected {len(parameters)} parameter columns, got {values.shape[1]}")
+    num_members = values.shape[0]
+
+    fields = {
+        "beta": np.tile(circuit.mBeta, (num_members, 1)),
+        "lossRate": np.tile(circuit.mDegradation, (num_members, 1)),
+        "initialConcentration": np.tile(circuit.mInitConc, (num_members, 1)),
+    }
+    hills = {
+        "first": [np.tile(group.mFirstHills, (num_members, 1)) for group in circuit.mGateGroups],
+        "second": [np.tile(group.mSecondHills, (num_members, 1)) for group in circuit.mGateGroups],
+    }
+
+    for column, (target, parameter) in enumerate(parameters):
+        kind, where = parameter_slots(circuit, target, parameter)
+        if kind == "protein":
+            fields[parameter][:, where] = values[:, column]
+        else:
+            for g, which, entries in where:
+                hills[which][g][:, entries] = values[:, column, np.newaxis]
+
+    return EnsembleCircuit(
+        circuit, fields["initialConcentration"], fields["lossRate"], fields["beta"], hills["first"], hills["second"]
+    )
@@ -1,13 +1,25 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Literal, Optional, TypedDict, Union
+from typing import Any, Dict, List, Literal, NotRequired, Optional, TypedDict, Union
 
 
 # ----- Request -----
 
+SolverName = Literal["odeint", "LSODA", "BDF", "Radau", "RK45", "DOP853"]
+
+
 class CircuitSettings(TypedDict, total=False):
     simulationDuration: float
     numTimePoints: int
+    # Integrator selection; omitted fields fall back to odeint and the solver's default tolerances.
+    solver: SolverName
+    rtol: float
+    atol: float
+    maxStep: float
+    # Integrate the strongly connected components of the regulatory graph one after another.
+    decompose: bool
+    # Serve and store results in the on-disk result cache (default true).
+    cacheResults: bool
 
 
 class SimulationRequest(TypedDict, total=False):
@@ -31,10 +43,25 @@ class SimulationDataPayload(TypedDict):
     concentrations: List[List[float]]
 
 
+class SolverInfo(TypedDict):
+    solver: SolverName
+    nfev: int
+    njev: int
+    # Strongly connected components integrated one after another (decompose only).
+    components: NotRequired[int]
+    # Proteins integrated again; fewer than all of them when a previous run of the circuit was reused.
+    reintegrated: NotRequired[int]
+    # States left in the integrated system after pruning proteins without gates.
+    states: NotRequired[int]
+
+
 class SimulationSuccessResponse(TypedDict):
     success: Literal[True]
     image: str
     data: SimulationDataPayload
+    solver: SolverInfo
+    # True when the result was read from the on-disk result cache instead of simulated.
+    cached: bool
     requestId: str
 
 
@@ -0,0 +1,252 @@
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.optimize
+
+from .compiler import compile_circuit, make_ensemble, parameter_slots, parameter_value
+from .parser import parse_circuit
+from .sensitivity import run_sensitivity
+from .simulate import run_ensemble
+from .sweep import default_workers, latin_hypercube_samples, redirect_stdout
+
+FIT_METHODS = ("least_squares", "differential_evolution")
+
+# Number of parameter vectors whose simulations a FitObjective keeps
+FIT_CACHE_SIZE = 64
+
+# Objective owned by each worker process, set once by _init_worker
+_worker_objective = None
+
+
+class FitObjective:
+    """
+    Residuals of a compiled circuit against measured time series, as a function of a parameter vector.
+
+    data maps protein names to {"time": [...], "values": [...]}; NaN values are skipped. The circuit
+    is simulated from time 0 on the union of all measurement times. residuals integrates the
+    forward sensitivities along (see sensitivity.run_sensitivity) and the results of the last
+    cacheSize parameter vectors are kept, so the jacobian least_squares asks for next at the same
+    point needs no second integration. cost, used by the global search, only simulates the circuit.
+    Every simulation appends (cost, seconds) to mHistory.
+    """
+
+    def __init__(self, circuit, parameters, data, cacheSize=FIT_CACHE_SIZE, **solverOptions):
+        self.mCircuit = circuit
+        self.mParameters = [tuple(pair) for pair in parameters]
+        for target, parameter in self.mParameters:
+            parameter_slots(circuit, target, parameter)
+        if not data:
+            raise ValueError("Fitting needs data for at least one protein")
+
+        names = circuit.getNames()
+        self.mSeries = []
+        times, values, columns = [], [], []
+        for name, series in data.items():
+            if name not in names:
+                raise ValueError(f"Data given for unknown protein '{name}'")
+            t = np.asarray(series["time"], dtype=float)
+            v = np.asarray(series["values"], dtype=float)
+            if t.ndim != 1 or t.shape != v.shape:
+                raise ValueError(f"Data for '{name}' needs 'time' and 'values' of the same length")
+            if np.any(t < 0):
+                raise ValueError(f"Data for '{name}' has negative times")
+            measured = np.isfinite(v)
+            self.mSeries.append((name, len(t), measured))
+            times.append(t[measured])
+            values.append(v[measured])
+            columns.append(np.full(measured.sum(), names.index(name)))
+        times = np.concatenate(times)
+        self.mTime = np.union1d([0.0], times)
+        self.mRows = np.searchsorted(self.mTime, times)
+        self.mColumns = np.concatenate(columns)
+        self.mObserved = np.concatenate(values)
+
+        self.mSolverOptions = solverOptions
+        self.mCache = OrderedDict()
+        self.mCacheSize = cacheSize
+        self.mCacheHits = 0
+        self.mHistory = []
+
+    def residuals(self, x):
+        return self._evaluate(x, jacobian=True)[0]
+
+    def jacobian(self, x):
+        return self._evaluate(x, jacobian=True)[1]
+
+    def cost(self, x):
+        residuals = self._evaluate(x, jacobian=False)[0]
+        return 0.5 * float(residuals @ residuals)
+
+    def splitResiduals(self, residuals):
+        """Residuals per protein as {name: list}, aligned with its data and None where a value was skipped."""
+        out = {}
+        start = 0
+        for name, length, measured in self.mSeries:
+            series = [None] * length
+            for k, r in zip(np.flatnonzero(measured), residuals[start:start + measured.sum()]):
+                series[k] = float(r)
+            out[name] = series
+            start += measured.sum()
+        return out
+
+    def _evaluate(self, x, jacobian):
+        """(residuals, Jacobian) at x; the Jacobian is None unless requested."""
+        x = np.asarray(x, dtype=float)
+        key = x.tobytes()
+        cached = self.mCache.get(key)
+        if cached is not None and (cached[1] is not None or not jacobian):
+            self.mCache.move_to_end(key)
+            self.mCacheHits += 1
+            return cached
+
+        start = time.perf_counter()
+        if jacobian:
+            result = run_sensitivity(
+                self.mTime, make_ensemble(self.mCircuit, self.mParameters, x[np.newaxis]), self.mParameters,
+                **self.mSolverOptions
+            )
+            concentrations = result["concentrations"]
+            jac = result["sensitivities"][self.mRows, self.mColumns]
+        else:
+            concentrations = run_ensemble(self.mTime, self.mCircuit, self.mParameters, x[np.newaxis], **self.mSolverOptions)[0]
+            jac = None
+        residuals = concentrations[self.mRows, self.mColumns] - self.mObserved
+        self.mHistory.append((0.5 * float(residuals @ residuals), time.perf_counter() - start))
+
+        self.mCache[key] = (residuals, jac)
+        self.mCache.move_to_end(key)
+        while len(self.mCache) > self.mCacheSize:
+            self.mCache.popitem(last=False)
+        return residuals, jac
+
+
+def fit_bounds(circuit, bounds):
+    """
+    (parameters, lower, upper, initial) from a list of {"target", "parameter", "min", "max"} dicts.
+    The initial value is the dict's "initial" or the circuit's current value, clipped to the bounds.
+    """
+    if not bounds:
+        raise ValueError("Fitting needs at least one parameter")
+    parameters, lower, upper, initial = [], [], [], []
+    for bound in bounds:
+        target, parameter = bound["target"], bound["parameter"]
+        low, high = float(bound["min"]), float(bound["max"])
+        if not low < high:
+            raise ValueError(f"Bounds of {target}/{parameter} need min < max, got {low} and {high}")
+        value = float(bound["initial"]) if bound.get("initial") is not None else parameter_value(circuit, target, parameter)
+        parameters.append((target, parameter))
+        lower.append(low)
+        upper.append(high)
+        initial.append(min(max(value, low), high))
+    return parameters, np.array(lower), np.array(upper), np.array(initial)
+
+
+def fit_parameters(circuit_json, data, bounds, method="least_squares", starts=4, workers=None, seed=None,
+                   max_evaluations=200, **solver_options):
+    """
+    Fit parameters of circuit_json to measured time series.
+
+    data is as for FitObjective, bounds as for fit_bounds; parameter is beta, lossRate,
+    initialConcentration or hill, as for run_ensemble. solver_options are the run_simulation
+    solver arguments.
+
+    method is one of
+      "least_squares": bounded trust-region least squares from `starts` points, the initial values
+        followed by Latin hypercube samples of the bounds. The starts run in parallel worker
+        processes, each of which compiles the circuit once, and the lowest cost wins.
+      "differential_evolution": a global search whose population is evaluated across the worker
+        processes, polished by least squares from its best point.
+
+    Returns a dict with the fitted "parameters" and "values", the "cost" (half the sum of squared
+    residuals), the "residuals" per protein, "success" and "message", one summary per start under
+    "starts", the "history" of (cost, seconds) per simulation of the best start, and the total
+    "seconds".
+    """
+    if method not in FIT_METHODS:
+        raise ValueError(f"Unknown fit method '{method}', expected one of {list(FIT_METHODS)}")
+    t0 = time.perf_counter()
+    circuit = compile_circuit(parse_circuit(circuit_json))
+    parameters, lower, upper, initial = fit_bounds(circuit, bounds)
+    # Fail on bad data here rather than inside every worker
+    objective = FitObjective(circuit, parameters, data, **solver_options)
+
+    starts = max(1, int(starts))
+    workers = max(1, int(workers or default_workers()))
+    pool = None
+    if workers > 1 and (method == "differential_evolution" or starts > 1):
+        pool = ProcessPoolExecutor(
+            max_workers=workers if method == "differential_evolution" else min(workers, starts),
+            initializer=_init_worker, initargs=(circuit_json, parameters, data, solver_options)
+        )
+
+    try:
+        if method == "least_squares":
+            points = [initial]
+            if starts > 1:
+                axes = [{"min": low, "max": high} for low, high in zip(lower, upper)]
+                points += list(latin_hypercube_samples(axes, starts - 1, seed=seed))
+            if pool is None:
+                fits = [_local_fit(objective, x0, lower, upper, max_evaluations) for x0 in points]
+            else:
+                fits = list(pool.map(_worker_fit, points, [lower] * starts, [upper] * starts, [max_evaluations] * starts))
+        else:
+            search = scipy.optimize.differential_evolution(
+                objective.cost if pool is None else _worker_cost, list(zip(lower, upper)), x0=initial, seed=seed,
+                maxiter=max(1, max_evaluations // (15 * len(parameters))), polish=False, updating="deferred",
+                workers=1 if pool is None else pool.map,
+            )
+            fits = [_local_fit(objective, search.x, lower, upper, max_evaluations)]
+            fits[0]["globalEvaluations"] = int(search.nfev)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    best = min(fits, key=lambda fit: fit["cost"])
+    residuals = objective.residuals(best["values"])
+    return {
+        "parameters": parameters,
+        "values": best["values"],
+        "cost": best["cost"],
+        "residuals": objective.splitResiduals(residuals),
+        "success": best["success"],
+        "message": best["message"],
+        "starts": [{key: value for key, value in fit.items() if key != "history"} for fit in fits],
+        "history": best["history"],
+        "seconds": time.perf_counter() - t0,
+    }
+
+
+def _local_fit(objective, x0, lower, upper, max_evaluations):
+    """One bounded least-squares run from x0, with the simulations it caused."""
+    start = time.perf_counter()
+    first = len(objective.mHistory)
+    result = scipy.optimize.least_squares(
+        objective.residuals, np.clip(x0, lower, upper), jac=objective.jacobian, bounds=(lower, upper),
+        method="trf", x_scale="jac", max_nfev=max_evaluations,
+    )
+    return {
+        "initial": np.asarray(x0, dtype=float),
+        "values": result.x,
+        "cost": float(result.cost),
+        "success": bool(result.success),
+        "message": result.message,
+        "evaluations": int(result.nfev),
+        "history": objective.mHistory[first:],
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def _init_worker(circuit_json, parameters, data, solver_options):
+    global _worker_objective
+    redirect_stdout()
+    _worker_objective = FitObjective(compile_circuit(parse_circuit(circuit_json)), parameters, data, **solver_options)
+
+
+def _worker_fit(x0, lower, upper, max_evaluations):
+    return _local_fit(_worker_objective, x0, lower, upper, max_evaluations)
+
+
+def _worker_cost(x):
+    return _worker_objective.cost(x)
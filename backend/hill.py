@@ -0,0 +1,167 @@
+"""
+Vectorized Hill-function kernels for every gate type.
+
+Every gate is written in terms of the activator and repressor occupancies of its inputs,
+a = x**n / (1 + x**n) and p = 1 / (1 + x**n), which are computed once per input and shared by the
+act and rep forms. Each expression is a sum of products of numbers in [0, 1], so nothing cancels
+for small x, and x**n is capped so that large x and n saturate instead of producing inf / inf.
+
+The functions take floats or arrays of any broadcastable shape and agree with the biocircuits
+functions of the same name. With numba installed they run as one compiled ufunc (jit.gate_values);
+otherwise the NumPy versions below are used.
+"""
+import numpy as np
+
+from . import jit
+
+# Integer Hill coefficients up to this value are raised by repeated multiplication instead of pow
+MAX_INTEGER_HILL = 8
+
+# Type code of every gate type, as used by the jit kernels
+GATE_CODES = {
+    "act_hill": jit.ACT_HILL,
+    "rep_hill": jit.REP_HILL,
+    "act_hill_mult": jit.ACT_HILL_MULT,
+    "rep_hill_mult": jit.REP_HILL_MULT,
+    "aa_and": jit.AA_AND,
+    "aa_or": jit.AA_OR,
+    "aa_or_single": jit.AA_OR_SINGLE,
+    "rr_and": jit.RR_AND,
+    "rr_or": jit.RR_OR,
+    "rr_and_single": jit.RR_AND_SINGLE,
+    "ar_and": jit.AR_AND,
+    "ar_or": jit.AR_OR,
+    "ar_and_single": jit.AR_AND_SINGLE,
+    "ar_or_single": jit.AR_OR_SINGLE,
+}
+
+
+def hill_power(x, n):
+    """x**n, with a multiplication-only fast path when n is a small positive integer (or an array of one)."""
+    n = np.asarray(n, dtype=float)
+    if n.ndim > 0 and n.size > 0 and np.all(n == n.flat[0]):
+        n = n.flat[0]
+    if n.ndim == 0 and n == int(n) and 1 <= n <= MAX_INTEGER_HILL:
+        # Exponentiation by squaring
+        k = int(n)
+        result = None
+        square = x
+        while k:
+            if k & 1:
+                result = square if result is None else result * square
+            k >>= 1
+            if k:
+                square = square * square
+        return result
+    return np.power(x, n)
+
+
+def occupancies(x, n):
+    """(x**n / (1 + x**n), 1 / (1 + x**n)), the activator and repressor occupancies of x."""
+    with np.errstate(over="ignore"):
+        u = hill_power(np.asarray(x, dtype=float), n)
+    # Capped, 1 / (1 + u) is still a normal float, so both occupancies stay exact once x**n overflows
+    u = np.minimum(u, jit.MAX_POWER)
+    p = 1.0 / (1.0 + u)
+    return u * p, p
+
+
+def _single_denominator(ax, px, py):
+    """(1 + x**nx + y**ny) / ((1 + x**nx) (1 + y**ny)), which equals 1 - ax ay and is at least px."""
+    return px + ax * py
+
+
+# Gate output from the occupancies (ax, px, ay, py) of its inputs, per type code
+_NUMPY_GATES = {
+    jit.ACT_HILL: lambda ax, px, ay, py: ax,
+    jit.REP_HILL: lambda ax, px, ay, py: px,
+    jit.ACT_HILL_MULT: lambda ax, px, ay, py: ax * ay,
+    jit.REP_HILL_MULT: lambda ax, px, ay, py: px * py,
+    jit.AA_AND: lambda ax, px, ay, py: ax * ay,
+    jit.AA_OR: lambda ax, px, ay, py: ax * py + ay,
+    jit.AA_OR_SINGLE: lambda ax, px, ay, py: (ax * py + ay * px) / _single_denominator(ax, px, py),
+    jit.RR_AND: lambda ax, px, ay, py: px * py,
+    jit.RR_OR: lambda ax, px, ay, py: px + ax * py,
+    jit.RR_AND_SINGLE: lambda ax, px, ay, py: px * py / _single_denominator(ax, px, py),
+    jit.AR_AND: lambda ax, px, ay, py: ax * py,
+    jit.AR_OR: lambda ax, px, ay, py: ax + px * py,
+    jit.AR_AND_SINGLE: lambda ax, px, ay, py: ax * py / _single_denominator(ax, px, py),
+    jit.AR_OR_SINGLE: lambda ax, px, ay, py: py / _single_denominator(ax, px, py),
+}
+
+
+def combine(code, ax, px, ay, py):
+    """Output of gates with type code from the occupancies of their first (ax, px) and second (ay, py) inputs."""
+    return _NUMPY_GATES[code](ax, px, ay, py)
+
+
+def evaluate(type, x, y, nx, ny):
+    """
+    Output of gates of one type for inputs x, y with Hill coefficients nx, ny; y and ny are ignored
+    by act_hill and rep_hill.
+    """
+    code = GATE_CODES.get(type)
+    if code is None:
+        raise ValueError(f"Unknown regulatory function type: {type}")
+    if jit.AVAILABLE:
+        return jit.gate_values(code, x, y, nx, ny)
+    ax, px = occupancies(x, nx)
+    if code in (jit.ACT_HILL, jit.REP_HILL):
+        return _NUMPY_GATES[code](ax, px, None, None)
+    return _NUMPY_GATES[code](ax, px, *occupancies(y, ny))
+
+
+def act_hill(x, n):
+    return evaluate("act_hill", x, 0.0, n, 1.0)
+
+
+def rep_hill(x, n):
+    return evaluate("rep_hill", x, 0.0, n, 1.0)
+
+
+def act_hill_mult(x, y, nx, ny):
+    return evaluate("act_hill_mult", x, y, nx, ny)
+
+
+def rep_hill_mult(x, y, nx, ny):
+    return evaluate("rep_hill_mult", x, y, nx, ny)
+
+
+def aa_and(x, y, nx, ny):
+    return evaluate("aa_and", x, y, nx, ny)
+
+
+def aa_or(x, y, nx, ny):
+    return evaluate("aa_or", x, y, nx, ny)
+
+
+def aa_or_single(x, y, nx, ny):
+    return evaluate("aa_or_single", x, y, nx, ny)
+
+
+def rr_and(x, y, nx, ny):
+    return evaluate("rr_and", x, y, nx, ny)
+
+
+def rr_or(x, y, nx, ny):
+    return evaluate("rr_or", x, y, nx, ny)
+
+
+def rr_and_single(x, y, nx, ny):
+    return evaluate("rr_and_single", x, y, nx, ny)
+
+
+def ar_and(x, y, nx, ny):
+    return evaluate("ar_and", x, y, nx, ny)
+
+
+def ar_or(x, y, nx, ny):
+    return evaluate("ar_or", x, y, nx, ny)
+
+
+def ar_and_single(x, y, nx, ny):
+    return evaluate("ar_and_single", x, y, nx, ny)
+
+
+def ar_or_single(x, y, nx, ny):
+    return evaluate("ar_or_single", x, y, nx, ny)
@@ -0,0 +1,273 @@
+"""
+External input functions of proteins, and their compiled form.
+
+An input function f(t, *args) gives a protein's external concentration at time t. The piecewise
+constant ones (x_pulse, steady_state) are compiled by InputSchedule into breakpoints and levels,
+so the right-hand side looks their values up with a binary search instead of calling them.
+table_input interpolates a measured time series held by a TableInput.
+"""
+import hashlib
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+import scipy.interpolate
+
+# Pulse inputs with more edges than this are evaluated directly instead of through a schedule
+MAX_SCHEDULE_BREAKPOINTS = 100000
+
+# How many floats on either side of an edge InputSchedule checks against the input functions
+EDGE_ULPS = 4
+
+
+def x_pulse(t, t_0, t_f, tau, x_0, duty_cycle):
+    """
+    Returns x value for a pulse beginning at t = t_0 with a period of tau. 
+    duty_cycle is the fraction of the period that the pulse is on. This should be between 0 and 1.
+    x_0 is the amplitude of the pulse.
+    t_f is when the pulse should stop.
+    """
+    # Find how far into the current period we are. Use floor to support floating point values.
+    t_since_period_start = t - t_0 - ((t - t_0) // (tau))*(tau)
+    return np.logical_and(t >= t_0, np.logical_and(t <= t_f, t_since_period_start <= tau*duty_cycle)) * x_0
+
+def steady_state(t, val):
+    return val
+
+# Input functions that are constant between the breakpoints reported by input_breakpoints
+PIECEWISE_CONSTANT_INPUTS = (x_pulse, steady_state)
+
+
+def input_edges(func, args):
+    """
+    Every time at which a piecewise-constant input can change value, or None if func is not one
+    or has more than MAX_SCHEDULE_BREAKPOINTS of them.
+    """
+    if func is steady_state:
+        return np.empty(0)
+    if func is not x_pulse:
+        return None
+    t_0, t_f, tau, x_0, duty_cycle = (float(arg) for arg in args)
+    if x_0 == 0 or t_0 > t_f:
+        return np.empty(0)
+    if duty_cycle >= 1:
+        # On from t_0 to t_f, which may be infinite
+        edges = np.array([t_0, t_f])
+        return edges[np.isfinite(edges)]
+    if not tau > 0 or not np.isfinite(t_f):
+        return None
+    num_periods = int(np.ceil((t_f - t_0) / tau)) + 1
+    if 2 * num_periods > MAX_SCHEDULE_BREAKPOINTS:
+        return None
+    starts = t_0 + tau * np.arange(num_periods)
+    edges = np.concatenate((starts, starts + tau * duty_cycle, [t_f]))
+    return np.unique(edges[edges <= t_f])
+
+
+class InputSchedule:
+    """
+    Piecewise-constant inputs compiled into one sorted breakpoint array mTimes (k) and a level
+    table mLevels (2k + 1, number of inputs): row 2i holds the values on the open interval before
+    mTimes[i] (row 2k those after the last breakpoint) and row 2i + 1 the values at mTimes[i]
+    itself, since pulses include both of their edges. Built once from the input functions.
+
+    Rounding makes a function like x_pulse switch up to a few ulps away from its nominal edges,
+    so the floats next to every edge are checked against the functions and the disagreeing ones
+    become breakpoints too; lookups then return exactly what the functions would.
+    """
+
+    def __init__(self, inputs, edges=None):
+        """inputs is a list of (function, args) pairs; edges their input_edges, if already known."""
+        self.mInputs = list(inputs)
+        if edges is None:
+            edges = [input_edges(func, args) for func, args in self.mInputs]
+        nominal = np.unique(np.concatenate([np.empty(0)] + list(edges)))
+        self._build(nominal)
+        if len(nominal):
+            near = [nominal]
+            up = down = nominal
+            for _ in range(EDGE_ULPS):
+                up, down = np.nextafter(up, np.inf), np.nextafter(down, -np.inf)
+                near += [up, down]
+            near = np.unique(np.concatenate(near))
+            exact = self._evaluate(near)
+            for _ in range(EDGE_ULPS):
+                wrong = np.any(self(near) != exact, axis=1)
+                if not wrong.any():
+                    break
+                self._build(np.union1d(self.mTimes, near[wrong]))
+        self.mLevels.flags.writeable = False
+
+    def _evaluate(self, t):
+        out = np.empty((len(t), len(self.mInputs)))
+        for k, (func, args) in enumerate(self.mInputs):
+            out[:, k] = func(t, *args)
+        return out
+
+    def _build(self, times):
+        # Probe every open interval at its midpoint and every breakpoint at itself
+        probe = np.empty(2 * len(times) + 1)
+        probe[1::2] = times
+        if len(times):
+            probe[0] = times[0] - 1.0 - abs(times[0])
+            probe[-1] = times[-1] + 1.0 + abs(times[-1])
+            probe[2:-1:2] = 0.5 * (times[:-1] + times[1:])
+        else:
+            probe[0] = 0.0
+        self.mTimes = times
+        self.mTimeList = times.tolist()
+        self.mLevels = self._evaluate(probe)
+
+    def at(self, time):
+        """Input values at the float time, shape (number of inputs,)."""
+        return self.mLevels[bisect_left(self.mTimeList, time) + bisect_right(self.mTimeList, time)]
+
+    def __call__(self, t):
+        """Input values at times t: shape t.shape + (number of inputs,)."""
+        t = np.asarray(t, dtype=float)
+        return self.mLevels[np.searchsorted(self.mTimes, t, side="left") + np.searchsorted(self.mTimes, t, side="right")]
+
+
+# Interpolation between the samples of a table input
+TABLE_INTERPOLATIONS = ("linear", "cubic")
+
+# Sample spacings that agree to this relative tolerance count as uniform, indexed without a search
+UNIFORM_SPACING_RTOL = 1e-9
+
+
+class TableInput:
+    """
+    External concentration interpolated from a measured time series, holding the first and last
+    values outside the sampled range.
+
+    times and values may be memory-mapped columns (see load_table); linear interpolation reads
+    them in place. Evenly sampled times are indexed by arithmetic instead of a binary search,
+    and cubic interpolation evaluates a precomputed not-a-knot spline, so a lookup costs the same
+    for any trace length.
+    """
+
+    def __init__(self, times, values, interpolation="linear"):
+        if interpolation not in TABLE_INTERPOLATIONS:
+            raise ValueError(f"Unknown interpolation '{interpolation}', expected one of {list(TABLE_INTERPOLATIONS)}")
+        self.mTimes = times
+        self.mValues = values
+        self.mInterpolation = interpolation
+        if times.ndim != 1 or times.shape != values.shape or len(times) < 2:
+            raise ValueError("A table input needs at least two times and as many values")
+        steps = np.diff(times)
+        if not np.all(steps > 0):
+            raise ValueError("The times of a table input must be strictly increasing")
+        if not np.all(np.isfinite(values)):
+            raise ValueError("A table input has values that are not finite")
+
+        self.mStart, self.mEnd = float(times[0]), float(times[-1])
+        step = (self.mEnd - self.mStart) / (len(times) - 1)
+        self.mStep = step if np.all(np.abs(steps - step) <= UNIFORM_SPACING_RTOL * step) else None
+        # Spline coefficients (4, n - 1), highest power first
+        self.mCoefficients = None
+        if interpolation == "cubic":
+            self.mCoefficients = scipy.interpolate.CubicSpline(times, values).c
+        self.mHash = None
+
+    def getHash(self):
+        """Hex digest of the samples and interpolation, equal for tables with the same content."""
+        if self.mHash is None:
+            digest = hashlib.sha256(self.mInterpolation.encode())
+            digest.update(np.ascontiguousarray(self.mTimes, dtype=float).tobytes())
+            digest.update(np.ascontiguousarray(self.mValues, dtype=float).tobytes())
+            self.mHash = digest.hexdigest()
+        return self.mHash
+
+    def __eq__(self, other):
+        return isinstance(other, TableInput) and self.getHash() == other.getHash()
+
+    def __hash__(self):
+        return hash(self.getHash())
+
+    def _interval(self, t):
+        """Index of the sample interval holding t, clipped to [0, n - 2]."""
+        last = len(self.mTimes) - 2
+        if self.mStep is not None:
+            i = np.floor((t - self.mStart) / self.mStep).astype(np.intp)
+            # Rounding can put t just past an interval edge
+            i = np.clip(i, 0, last)
+            i = i - (t < self.mTimes[i]) + (t >= self.mTimes[np.minimum(i + 1, last + 1)])
+            return np.clip(i, 0, last)
+        return np.clip(np.searchsorted(self.mTimes, t, side="right") - 1, 0, last)
+
+    def at(self, time):
+        """Interpolated value at the float time, with Python scalars only."""
+        time = min(max(time, self.mStart), self.mEnd)
+        last = len(self.mTimes) - 2
+        if self.mStep is not None:
+            i = min(max(int((time - self.mStart) // self.mStep), 0), last)
+            if time < self.mTimes[i]:
+                i = max(i - 1, 0)
+            elif i < last and time >= self.mTimes[i + 1]:
+                i += 1
+        else:
+            i = min(max(bisect_right(self.mTimes, time) - 1, 0), last)
+        dx = time - float(self.mTimes[i])
+        if self.mCoefficients is None:
+            left, right = float(self.mValues[i]), float(self.mValues[i + 1])
+            return left + (right - left) * (dx / (float(self.mTimes[i + 1]) - float(self.mTimes[i])))
+        c0, c1, c2, c3 = self.mCoefficients[:, i].tolist()
+        return ((c0 * dx + c1) * dx + c2) * dx + c3
+
+    def __call__(self, t):
+        """Interpolated values at times t, of t's shape."""
+        t = np.asarray(t, dtype=float)
+        if t.ndim == 0:
+            return self.at(float(t))
+        clipped = np.clip(t, self.mStart, self.mEnd)
+        i = self._interval(clipped)
+        dx = clipped - self.mTimes[i]
+        if self.mCoefficients is None:
+            left, right = self.mValues[i], self.mValues[i + 1]
+            return left + (right - left) * (dx / (self.mTimes[i + 1] - self.mTimes[i]))
+        c = self.mCoefficients
+        return ((c[0, i] * dx + c[1, i]) * dx + c[2, i]) * dx + c[3, i]
+
+
+def table_input(t, table):
+    """External concentration of a protein driven by the TableInput table."""
+    return table(t)
+
+
+def load_table(data):
+    """
+    TableInput from the inputFunctionData of a "table" input, which holds either inline "times"
+    and "values" lists or a "file": a .npy array (memory-mapped) or a .csv file, whose columns
+    "timeColumn" (default 0) and "valueColumn" (default 1) are read; CSV columns may also be named
+    after a header row. "interpolation" is "linear" (default) or "cubic".
+    """
+    interpolation = data.get("interpolation", "linear")
+    if "file" not in data:
+        if "times" not in data or "values" not in data:
+            raise ValueError("A table input needs a 'file' or inline 'times' and 'values'")
+        return TableInput(np.asarray(data["times"], dtype=float), np.asarray(data["values"], dtype=float), interpolation)
+
+    path = data["file"]
+    time_column, value_column = data.get("timeColumn", 0), data.get("valueColumn", 1)
+    if path.lower().endswith(".npy"):
+        array = np.load(path, mmap_mode="r")
+        if array.ndim != 2:
+            raise ValueError(f"Table input file {path} must hold a 2-D array of samples, one per row")
+        return TableInput(array[:, int(time_column)], array[:, int(value_column)], interpolation)
+    if path.lower().endswith(".csv"):
+        with open(path) as f:
+            header = f.readline().strip().split(",")
+        try:
+            [float(field) for field in header]
+            names, skip = None, 0
+        except ValueError:
+            names, skip = [name.strip() for name in header], 1
+        columns = []
+        for column in (time_column, value_column):
+            if isinstance(column, str):
+                if names is None or column not in names:
+                    raise ValueError(f"Table input file {path} has no column '{column}'")
+                column = names.index(column)
+            columns.append(int(column))
+        times, values = np.loadtxt(path, delimiter=",", skiprows=skip, usecols=columns, unpack=True, ndmin=2)
+        return TableInput(times, values, interpolation)
+    raise ValueError(f"Table input file {path} must be a .npy or .csv file")
@@ -11,11 +11,14 @@ os.environ.setdefault("NUMEXPR_NUM_THREADS", "1")
 
 import argparse
 import base64
+import hashlib
 import io
 import json
+import multiprocessing
 import sys
 import time
 import traceback
+from collections import OrderedDict
 
 import numpy as np
 import matplotlib
@@ -25,7 +28,25 @@ matplotlib.use("Agg")
 import matplotlib.pyplot as plt
 
 from backend.parser import parse_circuit
-from backend.simulate import run_simulation
+from backend.compiler import compile_circuit
+from backend.simulate import SOLVERS, CheckpointStore, find_steady_state, resume_time, run_simulation, simulate_window
+from backend.fit import fit_parameters
+from backend.result_cache import DEFAULT_MAX_BYTES, ResultCache
+from backend.sensitivity import global_sensitivity, run_sensitivity
+from backend.stochastic import STOCHASTIC_METHODS, run_stochastic
+from backend.sweep import run_sweep, sweep_points
+
+# Plot geometry; the plot is sampled at one point per horizontal pixel
+PLOT_FIGSIZE = (10, 6)
+PLOT_DPI = 100
+PLOT_POINTS = PLOT_FIGSIZE[0] * PLOT_DPI
+
+# SimulationRecord of the last run_simulation, so an edit to the same circuit only re-integrates
+# the proteins downstream of it
+_last_simulation = None
+
+# States of earlier runs that extend_simulation and simulate_window resume from
+_checkpoints = CheckpointStore()
 
 
 # -----------------------------
@@ -84,6 +105,83 @@ def write_response(obj: dict) -> None:
     sys.stdout.buffer.flush()
 
 
+# -----------------------------
+# Compiled circuit cache
+# -----------------------------
+# Payload fields that make up the circuit; everything else (circuitSettings, sweep, ...) is a run option
+CIRCUIT_FIELDS = ("nodes", "edges", "proteins", "hillCoefficients")
+
+# Number of parsed and compiled circuits kept in memory
+MAX_CACHED_CIRCUITS = 16
+
+
+class CircuitCache:
+    """
+    Protein arrays and compiled circuits of the last maxCircuits payloads, keyed by a hash of the
+    canonical JSON of their CIRCUIT_FIELDS. The UI resends the whole circuit with every command, so
+    a repeat submission, even with other circuitSettings, skips parse_circuit and compile_circuit.
+
+    Table inputs are read from their files when the circuit is parsed; the key is the payload,
+    so rewriting a file under the same path is only seen once the entry is evicted or cleared.
+    """
+
+    def __init__(self, maxCircuits=MAX_CACHED_CIRCUITS):
+        self.mMaxCircuits = maxCircuits
+        # key -> (protein array, CompiledCircuit)
+        self.mEntries = OrderedDict()
+        self.mHits = 0
+        self.mMisses = 0
+        self.mEvictions = 0
+
+    @staticmethod
+    def key(payload):
+        circuit = {field: payload.get(field) for field in CIRCUIT_FIELDS}
+        canonical = json.dumps(circuit, sort_keys=True, separators=(",", ":"), allow_nan=True, default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, payload):
+        """(protein array, CompiledCircuit) of the payload's circuit; both are None for an empty circuit."""
+        key = self.key(payload)
+        entry = self.mEntries.get(key)
+        if entry is not None:
+            self.mEntries.move_to_end(key)
+            self.mHits += 1
+            return entry
+
+        self.mMisses += 1
+        protein_array = parse_circuit(payload)
+        if not protein_array:
+            return None, None
+        entry = (protein_array, compile_circuit(protein_array))
+        if self.mMaxCircuits > 0:
+            self.mEntries[key] = entry
+            while len(self.mEntries) > self.mMaxCircuits:
+                self.mEntries.popitem(last=False)
+                self.mEvictions += 1
+        return entry
+
+    def getStats(self):
+        lookups = self.mHits + self.mMisses
+        return {
+            "entries": len(self.mEntries),
+            "maxEntries": self.mMaxCircuits,
+            "hits": self.mHits,
+            "misses": self.mMisses,
+            "evictions": self.mEvictions,
+            "hitRate": self.mHits / lookups if lookups else 0.0,
+        }
+
+    def clear(self):
+        self.mEntries.clear()
+
+
+# Circuits of recent payloads, shared by every handler that simulates the circuit in this process
+_circuits = CircuitCache()
+
+# run_simulation results of this and earlier sessions; see --cache-dir and --cache-max-mb
+_results = ResultCache()
+
+
 # -----------------------------
 # Handlers
 # -----------------------------
@@ -91,15 +189,83 @@ def ping_handler(_: dict) -> dict:
     return {"ok": True, "pong": True}
 
 
+def cache_stats_handler(payload: dict) -> dict:
+    """
+    Hit and miss counts of the compiled circuit cache and the on-disk result cache;
+    {"clear": true} empties both afterwards.
+    """
+    stats = {"circuits": _circuits.getStats(), "results": _results.getStats()}
+    if payload.get("clear"):
+        _circuits.clear()
+        _results.clear()
+    _stderr(f"[cache_stats] {stats}")
+    return {"ok": True, **stats}
+
+
+def _solver_options(circuit_settings: dict) -> dict:
+    """Map circuitSettings solver fields onto run_simulation keyword arguments."""
+    solver = circuit_settings.get("solver") or "odeint"
+    if solver not in SOLVERS:
+        raise ValueError(f"Unknown solver '{solver}', expected one of {list(SOLVERS)}")
+
+    options = {"solver": solver}
+    for key, kwarg in {"rtol": "rtol", "atol": "atol", "maxStep": "max_step"}.items():
+        value = circuit_settings.get(key)
+        if value is not None:
+            value = float(value)
+            if value <= 0:
+                raise ValueError(f"circuitSettings.{key} must be positive, got {value}")
+            options[kwarg] = value
+    return options
+
+
+def _output_grids(duration: float, num_points: int, start: float = 0.0):
+    """
+    Build the single time grid handed to the solver: the union of the numTimePoints grid returned
+    as data and the pixel-resolution grid used for the plot, both from start to duration. The
+    solver steps at its own pace and interpolates onto these points. Returns (t, data_idx,
+    plot_idx) with t[data_idx] and t[plot_idx] recovering the two grids.
+    """
+    t_data = np.linspace(start, duration, num_points)
+    t_plot = np.linspace(start, duration, PLOT_POINTS) if num_points < PLOT_POINTS else t_data
+    t = np.union1d(t_data, t_plot)
+    return t, np.searchsorted(t, t_data), np.searchsorted(t, t_plot)
+
+
+def _plot_image(t, concentrations, protein_names, title: str) -> str:
+    """Line plot of every protein's concentration over t as a base64-encoded PNG."""
+    plt.figure(figsize=PLOT_FIGSIZE)
+    for i, name in enumerate(protein_names):
+        plt.plot(t, concentrations[:, i], label=name)
+
+    plt.xlabel("Time")
+    plt.ylabel("Concentration")
+    plt.title(title)
+    plt.legend()
+    plt.grid(True, alpha=0.3)
+
+    buf = io.BytesIO()
+    plt.savefig(buf, format="png", dpi=PLOT_DPI)
+    buf.seek(0)
+    image_base64 = base64.b64encode(buf.read()).decode("utf-8")
+    plt.close()
+    return image_base64
+
+
 def run_simulation_handler(payload: dict) -> dict:
+    global _last_simulation
     t0 = time.time()
     _stderr("[run_simulation] handler: start")
 
     try:
-        # Parse circuit
+        # Parse and compile the circuit, unless it was seen before
         t_parse0 = time.time()
-        protein_array = parse_circuit(payload)
-        _stderr(f"[run_simulation] parse_circuit done in {time.time() - t_parse0:.3f}s")
+        hits = _circuits.mHits
+        protein_array, circuit = _circuits.get(payload)
+        _stderr(
+            f"[run_simulation] circuit {'cached' if _circuits.mHits > hits else 'parsed and compiled'} "
+            f"in {time.time() - t_parse0:.3f}s"
+        )
 
         if not protein_array:
             _stderr("[run_simulation] no circuit provided")
@@ -109,21 +275,39 @@ def run_simulation_handler(payload: dict) -> dict:
         circuit_settings = payload.get("circuitSettings", {}) or {}
         duration = circuit_settings.get("simulationDuration", 20)
         raw_num = circuit_settings.get("numTimePoints", 1000)
+        solver_options = _solver_options(circuit_settings)
 
-        # Higher resolution for smoothness (keep your current behavior)
-        n = int(raw_num) * 10
-        _stderr(f"[run_simulation] duration={duration} numTimePoints(raw)={raw_num} n={n}")
-
-        # Build t
+        # Build t: requested points for the data, pixel resolution for the plot
         t_lin0 = time.time()
-        t = np.linspace(0, duration, n)
-        _stderr(f"[run_simulation] linspace built in {time.time() - t_lin0:.3f}s")
+        t, data_idx, plot_idx = _output_grids(duration, int(raw_num))
+        _stderr(
+            f"[run_simulation] duration={duration} numTimePoints(raw)={raw_num} n={len(t)} solver={solver_options}; "
+            f"grid built in {time.time() - t_lin0:.3f}s"
+        )
+
+        # Results of an identical earlier run, possibly from an earlier session
+        decompose = bool(circuit_settings.get("decompose", False))
+        use_cache = bool(circuit_settings.get("cacheResults", True))
+        result_key = _results.key(
+            "run_simulation", circuit.getHash(), float(duration), int(raw_num), solver_options, decompose,
+            PLOT_FIGSIZE, PLOT_DPI,
+        )
+        cached = _results.get(result_key) if use_cache else None
+        if cached is not None:
+            _stderr(f"[run_simulation] handler: cached result in {time.time() - t0:.3f}s")
+            return _cached_simulation_response(cached)
 
         # Run simulation
         _stderr("[run_simulation] calling backend.simulate.run_simulation...")
         t_sim0 = time.time()
-        final_concentrations = run_simulation(t, protein_array)
-        _stderr(f"[run_simulation] run_simulation returned in {time.time() - t_sim0:.3f}s")
+        result = run_simulation(
+            t, circuit, full_output=True, decompose=decompose,
+            previous=_last_simulation, checkpoints=_checkpoints, **solver_options
+        )
+        final_concentrations, solver_info = result if result is not None else (None, None)
+        if solver_info is not None:
+            _last_simulation = solver_info.pop("record", None)
+        _stderr(f"[run_simulation] run_simulation returned in {time.time() - t_sim0:.3f}s ({solver_info})")
 
         if final_concentrations is None or (
             isinstance(final_concentrations, np.ndarray) and final_concentrations.size == 0
@@ -135,28 +319,30 @@ def run_simulation_handler(payload: dict) -> dict:
         _stderr("[run_simulation] plotting...")
         t_plot0 = time.time()
 
-        plt.figure(figsize=(10, 6))
-        for i, protein in enumerate(protein_array):
-            plt.plot(t, final_concentrations[:, i], label=protein.getName())
-
-        plt.xlabel("Time")
-        plt.ylabel("Concentration")
-        plt.title(f"Simulation Results ({duration}s)")
-        plt.legend()
-        plt.grid(True, alpha=0.3)
-
-        buf = io.BytesIO()
-        plt.savefig(buf, format="png", dpi=100)
-        buf.seek(0)
-        image_base64 = base64.b64encode(buf.read()).decode("utf-8")
-        plt.close()
+        protein_names = [p.getName() for p in protein_array]
+        image_base64 = _plot_image(
+            t[plot_idx], final_concentrations[plot_idx], protein_names, f"Simulation Results ({duration}s)"
+        )
 
         _stderr(f"[run_simulation] plotting+encode done in {time.time() - t_plot0:.3f}s")
 
-        # Downsample for transfer
-        protein_names = [p.getName() for p in protein_array]
-        time_points = t.tolist()[::10]
-        concentration_data = final_concentrations[::10].tolist()
+        time_points = t[data_idx].tolist()
+        concentration_data = final_concentrations[data_idx].tolist()
+
+        # Only full runs are stored: a reintegrated result replays the unchanged proteins from the
+        # previous run's output grid, which is close to but not the result the key stands for
+        full_run = solver_info.get("reintegrated", circuit.getNumProteins()) == circuit.getNumProteins()
+        if use_cache and full_run and _results.isEnabled():
+            stored = _results.put(
+                result_key,
+                proteinNames=np.array(protein_names, dtype=str),
+                timePoints=t[data_idx],
+                concentrations=final_concentrations[data_idx],
+                image=np.frombuffer(image_base64.encode("ascii"), dtype=np.uint8),
+                solver=np.array(json.dumps(solver_info)),
+            )
+            if not stored:
+                _stderr(f"[run_simulation] could not write the result cache in {_results.mDirectory}")
 
         _stderr(f"[run_simulation] handler: done total {time.time() - t0:.3f}s")
         return {
@@ -167,6 +353,8 @@ def run_simulation_handler(payload: dict) -> dict:
                 "timePoints": time_points,
                 "concentrations": concentration_data,
             },
+            "solver": solver_info,
+            "cached": False,
         }
 
     except Exception as e:
@@ -176,6 +364,414 @@ def run_simulation_handler(payload: dict) -> dict:
         return {"ok": False, "error": str(e), "traceback": tb}
 
 
+def _cached_simulation_response(arrays: dict) -> dict:
+    """The run_simulation response stored in the result cache as arrays."""
+    return {
+        "ok": True,
+        "image": arrays["image"].tobytes().decode("ascii"),
+        "data": {
+            "proteinNames": arrays["proteinNames"].tolist(),
+            "timePoints": arrays["timePoints"].tolist(),
+            "concentrations": arrays["concentrations"].tolist(),
+        },
+        "solver": json.loads(str(arrays["solver"])),
+        "cached": True,
+    }
+
+
+def _resumed_simulation_handler(payload: dict, command: str) -> dict:
+    """
+    Shared body of extend_simulation_handler and simulate_window_handler: both integrate from the
+    nearest checkpoint stored by an earlier run of the same circuit and solver settings.
+    """
+    t0 = time.time()
+    _stderr(f"[{command}] handler: start")
+
+    try:
+        protein_array, circuit = _circuits.get(payload)
+        if not protein_array:
+            _stderr(f"[{command}] no circuit provided")
+            return {"ok": True, "message": "No circuit provided"}
+
+        circuit_settings = payload.get("circuitSettings", {}) or {}
+        solver_options = _solver_options(circuit_settings)
+        if command == "extend_simulation":
+            duration = float(circuit_settings.get("simulationDuration", 20))
+            start = resume_time(circuit, _checkpoints, duration, **solver_options)
+            num_points = int(circuit_settings.get("numTimePoints", 1000))
+        else:
+            window = payload.get("window") or {}
+            if not {"start", "end"} <= window.keys():
+                raise ValueError("simulate_window needs window.start and window.end")
+            start, duration = float(window["start"]), float(window["end"])
+            if not 0 <= start < duration:
+                raise ValueError(f"Invalid window [{start}, {duration}]")
+            num_points = int(window.get("numTimePoints", circuit_settings.get("numTimePoints", 1000)))
+
+        t, data_idx, plot_idx = _output_grids(duration, num_points, start)
+        final_concentrations, solver_info = simulate_window(t, circuit, _checkpoints, full_output=True, **solver_options)
+        _stderr(
+            f"[{command}] [{start}, {duration}] resumed from t={solver_info['resumedFrom']} "
+            f"in {time.time() - t0:.3f}s ({solver_info})"
+        )
+
+        protein_names = [p.getName() for p in protein_array]
+        return {
+            "ok": True,
+            "image": _plot_image(
+                t[plot_idx], final_concentrations[plot_idx], protein_names, f"Simulation Results ({start}s - {duration}s)"
+            ),
+            "data": {
+                "proteinNames": protein_names,
+                "timePoints": t[data_idx].tolist(),
+                "concentrations": final_concentrations[data_idx].tolist(),
+            },
+            "solver": solver_info,
+        }
+
+    except Exception as e:
+        tb = traceback.format_exc()
+        _stderr(f"[{command}] EXCEPTION after {time.time() - t0:.3f}s: {e}")
+        _stderr(tb)
+        return {"ok": False, "error": str(e), "traceback": tb}
+
+
+def extend_simulation_handler(payload: dict) -> dict:
+    """
+    Continue the last run of the circuit up to circuitSettings.simulationDuration, starting from its
+    latest checkpoint rather than from 0. The data covers that checkpoint to the new duration.
+    """
+    return _resumed_simulation_handler(payload, "extend_simulation")
+
+
+def simulate_window_handler(payload: dict) -> dict:
+    """
+    Simulate the time window {"start", "end", "numTimePoints"} given as payload["window"],
+    resuming from the last checkpoint before start.
+    """
+    return _resumed_simulation_handler(payload, "simulate_window")
+
+
+def steady_state_handler(payload: dict) -> dict:
+    """
+    Find the steady state of the circuit without integrating over the whole simulationDuration.
+
+    Inputs are frozen at their value at simulationDuration. An optional "steadyState" object may
+    set "tol" and "maxBursts"; the circuitSettings solver options are used for integration bursts.
+    """
+    t0 = time.time()
+    _stderr("[steady_state] handler: start")
+
+    try:
+        protein_array, circuit = _circuits.get(payload)
+        if not protein_array:
+            _stderr("[steady_state] no circuit provided")
+            return {"ok": True, "message": "No circuit provided"}
+
+        circuit_settings = payload.get("circuitSettings", {}) or {}
+        options = payload.get("steadyState", {}) or {}
+        result = find_steady_state(
+            circuit,
+            t=float(circuit_settings.get("simulationDuration", 20)),
+            tol=float(options.get("tol", 1e-8)),
+            max_bursts=int(options.get("maxBursts", 10)),
+            **_solver_options(circuit_settings),
+        )
+        _stderr(
+            f"[steady_state] converged={result['converged']} bursts={result['bursts']} "
+            f"residual={result['residual']:.3g} in {time.time() - t0:.3f}s"
+        )
+
+        return {
+            "ok": True,
+            "proteinNames": [protein.getName() for protein in protein_array],
+            "concentrations": result["concentrations"].tolist(),
+            "converged": result["converged"],
+            "stable": result["stable"],
+            "eigenvalues": {
+                "real": result["eigenvalues"].real.tolist(),
+                "imag": result["eigenvalues"].imag.tolist(),
+            },
+            "residual": result["residual"],
+            "bursts": result["bursts"],
+        }
+
+    except Exception as e:
+        tb = traceback.format_exc()
+        _stderr(f"[steady_state] EXCEPTION: {e}")
+        _stderr(tb)
+        return {"ok": False, "error": str(e), "traceback": tb}
+
+
+def run_stochastic_handler(payload: dict) -> dict:
+    """
+    Sample stochastic trajectories of the circuit on the numTimePoints grid.
+
+    An optional "stochastic" object sets "method" ("ssa", "tau_leaping" or "langevin"), "trajectories",
+    "seed", "volume", "tau" and "rawTrajectories" (how many sampled trajectories to return).
+    """
+    t0 = time.time()
+    _stderr("[run_stochastic] handler: start")
+
+    try:
+        protein_array, circuit = _circuits.get(payload)
+        if not protein_array:
+            _stderr("[run_stochastic] no circuit provided")
+            return {"ok": True, "message": "No circuit provided"}
+
+        circuit_settings = payload.get("circuitSettings", {}) or {}
+        options = payload.get("stochastic", {}) or {}
+        method = options.get("method", "ssa")
+        if method not in STOCHASTIC_METHODS:
+            raise ValueError(f"Unknown stochastic method '{method}', expected one of {list(STOCHASTIC_METHODS)}")
+        t = np.linspace(0, circuit_settings.get("simulationDuration", 20), int(circuit_settings.get("numTimePoints", 1000)))
+
+        result = run_stochastic(
+            t,
+            circuit,
+            num_trajectories=int(options.get("trajectories", 1000)),
+            method=method,
+            seed=options.get("seed"),
+            volume=float(options.get("volume", 1.0)),
+            tau=float(options["tau"]) if options.get("tau") is not None else None,
+            num_raw=int(options.get("rawTrajectories", 0)),
+        )
+        _stderr(f"[run_stochastic] method={method} steps={result['steps']} in {time.time() - t0:.3f}s")
+
+        return {
+            "ok": True,
+            "proteinNames": [protein.getName() for protein in protein_array],
+            "timePoints": t.tolist(),
+            "mean": result["mean"].tolist(),
+            "variance": result["variance"].tolist(),
+            "trajectories": result["trajectories"].tolist(),
+            "method": method,
+            "steps": result["steps"],
+        }
+
+    except Exception as e:
+        tb = traceback.format_exc()
+        _stderr(f"[run_stochastic] EXCEPTION: {e}")
+        _stderr(tb)
+        return {"ok": False, "error": str(e), "traceback": tb}
+
+
+def run_sensitivity_handler(payload: dict) -> dict:
+    """
+    Simulate the circuit together with the sensitivities of its concentrations to parameters.
+
+    An optional "sensitivity" object lists "parameters" as {"target", "parameter"} dicts (beta,
+    lossRate, initialConcentration or hill); without it every beta, loss rate and Hill coefficient
+    is included. The circuitSettings solver options apply.
+    """
+    t0 = time.time()
+    _stderr("[run_sensitivity] handler: start")
+
+    try:
+        protein_array, circuit = _circuits.get(payload)
+        if not protein_array:
+            _stderr("[run_sensitivity] no circuit provided")
+            return {"ok": True, "message": "No circuit provided"}
+
+        circuit_settings = payload.get("circuitSettings", {}) or {}
+        options = payload.get("sensitivity", {}) or {}
+        requested = options.get("parameters")
+        parameters = [(p["target"], p["parameter"]) for p in requested] if requested else None
+        t = np.linspace(0, circuit_settings.get("simulationDuration", 20), int(circuit_settings.get("numTimePoints", 1000)))
+
+        result, info = run_sensitivity(t, circuit, parameters, full_output=True, **_solver_options(circuit_settings))
+        parameters = result["parameters"]
+        _stderr(f"[run_sensitivity] {len(parameters)} parameters nfev={info['nfev']} in {time.time() - t0:.3f}s")
+
+        return {
+            "ok": True,
+            "proteinNames": circuit.getNames(),
+            "timePoints": t.tolist(),
+            "parameters": [{"target": target, "parameter": parameter} for target, parameter in parameters],
+            "values": result["values"].tolist(),
+            "concentrations": result["concentrations"].tolist(),
+            "sensitivities": result["sensitivities"].tolist(),
+            "indices": result["indices"].tolist(),
+            "solver": info,
+        }
+
+    except Exception as e:
+        tb = traceback.format_exc()
+        _stderr(f"[run_sensitivity] EXCEPTION: {e}")
+        _stderr(tb)
+        return {"ok": False, "error": str(e), "traceback": tb}
+
+
+def fit_parameters_handler(payload: dict) -> dict:
+    """
+    Fit circuit parameters to measured time series.
+
+    payload is the circuit JSON plus a "fit" object: "data" ({protein name: {"time", "values"}}),
+    "parameters" ({"target", "parameter", "min", "max"} dicts with an optional "initial"), and
+    optionally "method" ("least_squares" or "differential_evolution"), "starts", "workers", "seed"
+    and "maxEvaluations". The circuitSettings solver options apply to every simulation.
+    """
+    t0 = time.time()
+    _stderr("[fit_parameters] handler: start")
+
+    try:
+        if _circuits.get(payload)[0] is None:
+            _stderr("[fit_parameters] no circuit provided")
+            return {"ok": True, "message": "No circuit provided"}
+
+        fit = payload.get("fit") or {}
+        circuit_settings = payload.get("circuitSettings", {}) or {}
+        result = fit_parameters(
+            payload, fit.get("data") or {}, fit.get("parameters") or [],
+            method=fit.get("method", "least_squares"), starts=fit.get("starts", 4), workers=fit.get("workers"),
+            seed=fit.get("seed"), max_evaluations=int(fit.get("maxEvaluations", 200)), **_solver_options(circuit_settings)
+        )
+        _stderr(f"[fit_parameters] cost={result['cost']:.3g} after {len(result['starts'])} starts in {time.time() - t0:.3f}s")
+
+        return {
+            "ok": True,
+            "parameters": [{"target": target, "parameter": parameter} for target, parameter in result["parameters"]],
+            "values": result["values"].tolist(),
+            "cost": result["cost"],
+            "residuals": result["residuals"],
+            "success": result["success"],
+            "message": result["message"],
+            "starts": [
+                {**start, "initial": start["initial"].tolist(), "values": start["values"].tolist()}
+                for start in result["starts"]
+            ],
+            "history": [{"cost": cost, "seconds": seconds} for cost, seconds in result["history"]],
+            "seconds": result["seconds"],
+        }
+
+    except Exception as e:
+        tb = traceback.format_exc()
+        _stderr(f"[fit_parameters] EXCEPTION: {e}")
+        _stderr(tb)
+        return {"ok": False, "error": str(e), "traceback": tb}
+
+
+def run_sweep_handler(payload: dict, emit) -> dict:
+    """
+    Simulate the circuit over a parameter sweep across a process pool.
+
+    payload is the circuit JSON plus a "sweep" object: "axes" ({"target", "parameter", "values" or
+    "min"/"max"/"num"}), "mode" ("grid" or "latin_hypercube" with "samples"/"seed"), and optionally
+    "chunkSize", "workers" and "output" ("final" or "trajectory"). Each finished chunk is sent through
+    emit as a partial response; the returned dict is the final response that completes the request.
+    """
+    t0 = time.time()
+    _stderr("[run_sweep] handler: start")
+
+    try:
+        sweep = payload.get("sweep") or {}
+        circuit_settings = payload.get("circuitSettings", {}) or {}
+        duration = circuit_settings.get("simulationDuration", 20)
+        num_points = int(circuit_settings.get("numTimePoints", 1000))
+        solver_options = _solver_options(circuit_settings)
+        output = sweep.get("output", "final")
+
+        parameters, values = sweep_points(sweep)
+        t = np.linspace(0, duration, num_points)
+        _stderr(f"[run_sweep] {len(values)} points over {[list(p) for p in parameters]} solver={solver_options}")
+
+        num_chunks = 0
+        protein_names = []
+        for chunk in run_sweep(
+            payload, parameters, values, t,
+            chunk_size=sweep.get("chunkSize", 64), workers=sweep.get("workers"), output=output, **solver_options
+        ):
+            num_chunks += 1
+            protein_names = chunk["proteinNames"]
+            emit({
+                "ok": True,
+                "partial": True,
+                "chunk": {
+                    "indices": chunk["indices"].tolist(),
+                    "values": chunk["values"].tolist(),
+                    "concentrations": chunk["concentrations"].tolist(),
+                    "solver": chunk["info"],
+                },
+            })
+            _stderr(f"[run_sweep] chunk {num_chunks} sent ({len(chunk['indices'])} points)")
+
+        _stderr(f"[run_sweep] handler: done total {time.time() - t0:.3f}s")
+        return {
+            "ok": True,
+            "partial": False,
+            "proteinNames": protein_names,
+            "parameters": [{"target": target, "parameter": parameter} for target, parameter in parameters],
+            "timePoints": t.tolist() if output == "trajectory" else [float(t[-1])],
+            "numPoints": len(values),
+            "numChunks": num_chunks,
+        }
+
+    except Exception as e:
+        tb = traceback.format_exc()
+        _stderr(f"[run_sweep] EXCEPTION after {time.time() - t0:.3f}s: {e}")
+        _stderr(tb)
+        return {"ok": False, "error": str(e), "traceback": tb}
+
+
+def _finite_list(values) -> list:
+    """Nested list of an array with NaN as None, which JSON can carry."""
+    values = np.asarray(values, dtype=float)
+    return np.where(np.isfinite(values), values, None).tolist()
+
+
+def global_sensitivity_handler(payload: dict, emit) -> dict:
+    """
+    Sobol or Morris global sensitivity of trajectory metrics across a process pool.
+
+    payload is the circuit JSON plus a "globalSensitivity" object: "parameters" ({"target",
+    "parameter", "min", "max"} dicts), optional "outputs" ({"protein", "metric"} dicts, metric one
+    of final, mean, max, min, amplitude or period), "method" ("sobol" or "morris"), "samples",
+    "levels", "seed", "confidence", "resamples", "chunkSize" and "workers". Progress after every
+    chunk is sent through emit as a partial response.
+    """
+    t0 = time.time()
+    _stderr("[global_sensitivity] handler: start")
+
+    try:
+        options = payload.get("globalSensitivity") or {}
+        circuit_settings = payload.get("circuitSettings", {}) or {}
+        t = np.linspace(0, circuit_settings.get("simulationDuration", 20), int(circuit_settings.get("numTimePoints", 1000)))
+
+        def progress(done, total):
+            emit({"ok": True, "partial": True, "progress": {"done": done, "total": total}})
+
+        result = global_sensitivity(
+            payload, options.get("parameters") or [], t, outputs=options.get("outputs"),
+            method=options.get("method", "sobol"), samples=int(options.get("samples", 1024)),
+            levels=int(options.get("levels", 4)), seed=options.get("seed"),
+            confidence=float(options.get("confidence", 0.95)), resamples=int(options.get("resamples", 100)),
+            chunk_size=options.get("chunkSize", 64), workers=options.get("workers"), progress=progress,
+            **_solver_options(circuit_settings)
+        )
+        _stderr(f"[global_sensitivity] {result['numEvaluations']} simulations in {time.time() - t0:.3f}s")
+
+        indices = ("S1", "S1Conf", "ST", "STConf") if result["method"] == "sobol" else ("mu", "muStar", "sigma", "muStarConf")
+        response = {
+            "ok": True,
+            "partial": False,
+            "method": result["method"],
+            "parameters": [{"target": target, "parameter": parameter} for target, parameter in result["parameters"]],
+            "outputs": [{"protein": protein, "metric": metric} for protein, metric in result["outputs"]],
+            "numEvaluations": result["numEvaluations"],
+            "solver": result["info"],
+        }
+        response.update({key: _finite_list(result[key]) for key in indices})
+        if "numValid" in result:
+            response["numValid"] = result["numValid"].tolist()
+        return response
+
+    except Exception as e:
+        tb = traceback.format_exc()
+        _stderr(f"[global_sensitivity] EXCEPTION after {time.time() - t0:.3f}s: {e}")
+        _stderr(tb)
+        return {"ok": False, "error": str(e), "traceback": tb}
+
+
 # -----------------------------
 # One-message processing (shared by loop + --once)
 # -----------------------------
@@ -198,11 +794,56 @@ def process_one() -> bool:
             result = ping_handler(payload)
             _stderr(f"[ipc] handler end: ping in {time.time() - t_cmd0:.3f}s")
 
+        elif command == "cache_stats":
+            _stderr("[ipc] handler start: cache_stats")
+            result = cache_stats_handler(payload)
+            _stderr(f"[ipc] handler end: cache_stats in {time.time() - t_cmd0:.3f}s")
+
         elif command == "run_simulation":
             _stderr("[ipc] handler start: run_simulation")
             result = run_simulation_handler(payload)
             _stderr(f"[ipc] handler end: run_simulation in {time.time() - t_cmd0:.3f}s")
 
+        elif command == "extend_simulation":
+            _stderr("[ipc] handler start: extend_simulation")
+            result = extend_simulation_handler(payload)
+            _stderr(f"[ipc] handler end: extend_simulation in {time.time() - t_cmd0:.3f}s")
+
+        elif command == "simulate_window":
+            _stderr("[ipc] handler start: simulate_window")
+            result = simulate_window_handler(payload)
+            _stderr(f"[ipc] handler end: simulate_window in {time.time() - t_cmd0:.3f}s")
+
+        elif command == "steady_state":
+            _stderr("[ipc] handler start: steady_state")
+            result = steady_state_handler(payload)
+            _stderr(f"[ipc] handler end: steady_state in {time.time() - t_cmd0:.3f}s")
+
+        elif command == "run_stochastic":
+            _stderr("[ipc] handler start: run_stochastic")
+            result = run_stochastic_handler(payload)
+            _stderr(f"[ipc] handler end: run_stochastic in {time.time() - t_cmd0:.3f}s")
+
+        elif command == "run_sensitivity":
+            _stderr("[ipc] handler start: run_sensitivity")
+            result = run_sensitivity_handler(payload)
+            _stderr(f"[ipc] handler end: run_sensitivity in {time.time() - t_cmd0:.3f}s")
+
+        elif command == "fit_parameters":
+            _stderr("[ipc] handler start: fit_parameters")
+            result = fit_parameters_handler(payload)
+            _stderr(f"[ipc] handler end: fit_parameters in {time.time() - t_cmd0:.3f}s")
+
+        elif command == "run_sweep":
+            _stderr("[ipc] handler start: run_sweep")
+            result = run_sweep_handler(payload, lambda chunk: write_response({**chunk, "requestId": request_id}))
+            _stderr(f"[ipc] handler end: run_sweep in {time.time() - t_cmd0:.3f}s")
+
+        elif command == "global_sensitivity":
+            _stderr("[ipc] handler start: global_sensitivity")
+            result = global_sensitivity_handler(payload, lambda message: write_response({**message, "requestId": request_id}))
+            _stderr(f"[ipc] handler end: global_sensitivity in {time.time() - t_cmd0:.3f}s")
+
         else:
             result = {"ok": False, "error": f"Unknown command: {command}"}
 
@@ -244,7 +885,14 @@ def main(once: bool = False) -> None:
 
 
 if __name__ == "__main__":
+    # Required for the run_sweep process pool in the frozen binary
+    multiprocessing.freeze_support()
     ap = argparse.ArgumentParser()
     ap.add_argument("--once", action="store_true", help="Process exactly one IPC message then exit")
+    ap.add_argument("--cache-dir", help="Directory of the run_simulation result cache")
+    ap.add_argument("--cache-max-mb", type=float, help="Size of the result cache in MB; 0 disables it")
     args = ap.parse_args()
+    if args.cache_dir or args.cache_max_mb is not None:
+        max_bytes = DEFAULT_MAX_BYTES if args.cache_max_mb is None else int(args.cache_max_mb * 1024 * 1024)
+        _results = ResultCache(args.cache_dir, max_bytes)
     main(once=args.once)
@@ -0,0 +1,239 @@
+"""
+Optional Numba kernels for CompiledCircuit.
+
+Every gate of a circuit is stored in one flat table (type code, target, inputs, Hill coefficients)
+and the Jacobian is a single native loop over that table. The right-hand side and gate sums loop
+over the deduplicated term table instead (see compiler._term_table), so every distinct Hill term
+and gate is evaluated once. The kernels take the tables as arguments, so they are compiled once
+for all circuits and cached on disk.
+gate_values exposes the same gate code as a NumPy ufunc for the kernels in hill.py.
+If numba is not installed AVAILABLE is False and CompiledCircuit keeps its NumPy path.
+"""
+import os
+import sys
+
+import numpy as np
+
+if getattr(sys, "frozen", False) and "NUMBA_CACHE_DIR" not in os.environ:
+    # A frozen build unpacks its modules to a fresh temporary directory on every start, so keep
+    # the compiled kernels in the user's cache directory instead of next to this file
+    if sys.platform == "win32":
+        cache_root = os.environ.get("LOCALAPPDATA", os.path.expanduser("~"))
+    elif sys.platform == "darwin":
+        cache_root = os.path.expanduser("~/Library/Caches")
+    else:
+        cache_root = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    os.environ["NUMBA_CACHE_DIR"] = os.path.join(cache_root, "genecircuits", "numba")
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+AVAILABLE = numba is not None
+
+
+def _kernel(func):
+    return numba.njit(cache=True, nogil=True)(func) if AVAILABLE else func
+
+
+# Type codes are indices into compiler.GATE_TYPES
+ACT_HILL, REP_HILL, ACT_HILL_MULT, REP_HILL_MULT, AA_AND, AA_OR, AA_OR_SINGLE, RR_AND, RR_OR, \
+    RR_AND_SINGLE, AR_AND, AR_OR, AR_AND_SINGLE, AR_OR_SINGLE = range(14)
+
+
+# x**n is capped here so that occupancies of large inputs with large Hill coefficients stay finite
+MAX_POWER = 1e300
+
+
+@_kernel
+def _hill_power(x, n):
+    """x**n, by multiplication for the common integer Hill coefficients."""
+    if n == 1.0:
+        return x
+    if n == 2.0:
+        return x * x
+    if n == 3.0:
+        return x * x * x
+    if n == 4.0:
+        square = x * x
+        return square * square
+    return x ** n
+
+
+@_kernel
+def _occupancies(x, n):
+    """(x**n / (1 + x**n), 1 / (1 + x**n)), sharing the power; see hill.occupancies."""
+    u = min(_hill_power(x, n), MAX_POWER)
+    p = 1.0 / (1.0 + u)
+    return u * p, p
+
+
+@_kernel
+def _gate(code, x, y, nx, ny):
+    ax, px = _occupancies(x, nx)
+    if code == ACT_HILL or code == REP_HILL:
+        return _combine(code, ax, px, ax, px)
+    ay, py = _occupancies(y, ny)
+    return _combine(code, ax, px, ay, py)
+
+
+@_kernel
+def _combine(code, ax, px, ay, py):
+    """Gate output from the occupancies of its inputs; see hill.combine."""
+    # Sums of products of occupancies in [0, 1]: no cancellation for small inputs, no inf / inf for large ones
+    if code == ACT_HILL:
+        return ax
+    if code == REP_HILL:
+        return px
+    if code == ACT_HILL_MULT or code == AA_AND:
+        return ax * ay
+    if code == REP_HILL_MULT or code == RR_AND:
+        return px * py
+    if code == AA_OR:
+        return ax * py + ay
+    if code == RR_OR:
+        return px + ax * py
+    if code == AR_AND:
+        return ax * py
+    if code == AR_OR:
+        return ax + px * py
+    # Single occupancy types divide by (1 + u + v) / ((1 + u) (1 + v)), which is at least px
+    denom = px + ax * py
+    if code == AA_OR_SINGLE:
+        return (ax * py + ay * px) / denom
+    if code == RR_AND_SINGLE:
+        return px * py / denom
+    if code == AR_AND_SINGLE:
+        return ax * py / denom
+    return py / denom
+
+
+def _gate_value(code, x, y, nx, ny):
+    return _gate(code, x, y, nx, ny)
+
+
+# NumPy ufunc of _gate, compiled by gate_values on first use
+_gate_ufunc = None
+
+
+def gate_values(codes, x, y, nx, ny):
+    """Gate outputs for type codes and inputs of any broadcastable shapes, as one native loop."""
+    global _gate_ufunc
+    if _gate_ufunc is None:
+        _gate_ufunc = numba.vectorize(["float64(int64, float64, float64, float64, float64)"], cache=True)(_gate_value)
+    # x**n overflowing before it is capped is expected
+    with np.errstate(over="ignore"):
+        return _gate_ufunc(codes, x, y, nx, ny)
+
+
+@_kernel
+def _occupancy_slope(x, n, ax, px):
+    """d(ax)/dx = n ax px / x, finite where x**n overflows; see compiler._occupancy_slopes."""
+    if x > 0:
+        return n * ax * px / x
+    return 1.0 if n == 1.0 else 0.0
+
+
+@_kernel
+def _gate_derivatives(code, x, y, nx, ny):
+    """(d/dx, d/dy) of one gate; see GateGroup.derivatives for the NumPy version."""
+    ax, px = _occupancies(x, nx)
+    sx = _occupancy_slope(x, nx, ax, px)
+    if code == ACT_HILL:
+        return sx, 0.0
+    if code == REP_HILL:
+        return -sx, 0.0
+    ay, py = _occupancies(y, ny)
+    sy = _occupancy_slope(y, ny, ay, py)
+    if code == ACT_HILL_MULT or code == AA_AND:
+        return sx * ay, ax * sy
+    if code == REP_HILL_MULT or code == RR_AND:
+        return -sx * py, -px * sy
+    if code == AA_OR:
+        return sx * py, px * sy
+    if code == RR_OR:
+        return -sx * ay, -ax * sy
+    if code == AR_AND:
+        return sx * py, -ax * sy
+    if code == AR_OR:
+        return sx * ay, -px * sy
+    denom = px + ax * py
+    if code == AA_OR_SINGLE:
+        return sx * (py / denom) ** 2, sy * (px / denom) ** 2
+    if code == RR_AND_SINGLE:
+        return -sx * (py / denom) ** 2, -sy * (px / denom) ** 2
+    if code == AR_AND_SINGLE:
+        return sx * py / denom ** 2, -sy * ax * px / denom ** 2
+    return sx * ay * py / denom ** 2, -sy * px / denom ** 2
+
+
+@_kernel
+def _total(internal, ext):
+    """Total concentrations: ext plus the internal states, which cover the first internal.shape[0] proteins."""
+    conc = ext.copy()
+    for i in range(internal.shape[0]):
+        conc[i] += internal[i]
+    return conc
+
+
+@_kernel
+def prod_rates(conc, constProd, termInputs, termHills, codes, firstTerms, secondTerms, targets, gateIndex):
+    """Summed gate output plus constant production for each protein (CompiledCircuit.calcProdRates)."""
+    active = np.empty(termInputs.shape[0])
+    repressed = np.empty(termInputs.shape[0])
+    for k in range(termInputs.shape[0]):
+        active[k], repressed[k] = _occupancies(conc[termInputs[k]], termHills[k])
+    values = np.empty(codes.shape[0])
+    for g in range(codes.shape[0]):
+        first, second = firstTerms[g], secondTerms[g]
+        values[g] = _combine(codes[g], active[first], repressed[first], active[second], repressed[second])
+    prod = constProd.copy()
+    for k in range(targets.shape[0]):
+        prod[targets[k]] += values[gateIndex[k]]
+    return prod
+
+
+@_kernel
+def rates(internal, ext, beta, degrad, constProd, termInputs, termHills, codes, firstTerms, secondTerms, targets,
+          gateIndex):
+    """d(internal concentration)/dt of the states (CompiledCircuit.calcRates)."""
+    conc = _total(internal, ext)
+    prod = prod_rates(conc, constProd, termInputs, termHills, codes, firstTerms, secondTerms, targets, gateIndex)
+    out = np.empty(internal.shape[0])
+    for i in range(out.shape[0]):
+        out[i] = beta[i] * prod[i] - degrad[i] * internal[i]
+    return out
+
+
+@_kernel
+def gate_derivatives(conc, codes, firstInputs, secondInputs, firstHills, secondHills):
+    """Partial derivatives of every gate with respect to its first and second input, in table order."""
+    d_first = np.empty(codes.shape[0])
+    d_second = np.empty(codes.shape[0])
+    for g in range(codes.shape[0]):
+        d_first[g], d_second[g] = _gate_derivatives(
+            codes[g], conc[firstInputs[g]], conc[secondInputs[g]], firstHills[g], secondHills[g]
+        )
+    return d_first, d_second
+
+
+@_kernel
+def jacobian(internal, ext, beta, degrad, codes, targets, firstInputs, secondInputs, firstHills, secondHills):
+    """Dense Jacobian of rates with respect to the internal states (CompiledCircuit.calcJacobian)."""
+    conc = _total(internal, ext)
+    n = internal.shape[0]
+    jac = np.zeros((n, n))
+    for g in range(codes.shape[0]):
+        d_first, d_second = _gate_derivatives(
+            codes[g], conc[firstInputs[g]], conc[secondInputs[g]], firstHills[g], secondHills[g]
+        )
+        i = targets[g]
+        # Input-only slots past the states are not differentiated
+        if firstInputs[g] < n:
+            jac[i, firstInputs[g]] += beta[i] * d_first
+        if codes[g] != ACT_HILL and codes[g] != REP_HILL and secondInputs[g] < n:
+            jac[i, secondInputs[g]] += beta[i] * d_second
+    for i in range(n):
+        jac[i, i] -= degrad[i]
+    return jac
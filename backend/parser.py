@@ -1,7 +1,8 @@
 
 from .protein import Protein, Gate
-from .simulate import x_pulse
-from .simulate import steady_state
+from .inputs import x_pulse
+from .inputs import steady_state
+from .inputs import load_table, table_input
 import json
 from collections import defaultdict
 
@@ -56,6 +57,10 @@ def parse_circuit(json_data):
                         temp = [list(p.mExtConcFuncArgs.values())[0]]
                         p.mExtConcFuncArgs = temp
 
+                    elif p.mExtConcFunc == "table":
+                        p.mExtConcFunc = table_input
+                        p.mExtConcFuncArgs = [load_table(p.mExtConcFuncArgs)]
+
                     protein_array.append(p)
                     type_to_node_id[name] = node_id
                     node_id_to_protein[node_id] = p
@@ -1,4 +1,4 @@
-import biocircuits
+from . import hill
 
 class Protein:
     def __init__(self, id, name, initConc, degrad, gates, extConcFunc = None, extConcFuncArgs = None, beta = 1):
@@ -81,40 +81,34 @@ class Gate:
     def getRegFunc(self):
         # additive, use for independent promoters
         if self.mType == "act_hill":
-            return lambda p: biocircuits.act_hill(p[self.mFirstInput].getConcentration(), self.mFirstHill)
+            return lambda p: hill.act_hill(p[self.mFirstInput].getConcentration(), self.mFirstHill)
         # multiplicative, use for combinatorial regulation
         elif self.mType == "act_hill_mult":
-            return lambda p: (
-                biocircuits.act_hill(p[self.mFirstInput].getConcentration(), self.mFirstHill) * 
-                biocircuits.act_hill(p[self.mSecondInput].getConcentration(), self.mSecondHill)
-            )
+            return lambda p: hill.act_hill_mult(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
         elif self.mType == "rep_hill":
-            return lambda p: biocircuits.rep_hill(p[self.mFirstInput].getConcentration(), self.mFirstHill)
+            return lambda p: hill.rep_hill(p[self.mFirstInput].getConcentration(), self.mFirstHill)
         elif self.mType == "rep_hill_mult":
-            return lambda p: (
-                biocircuits.rep_hill(p[self.mFirstInput].getConcentration(), self.mFirstHill) * 
-                biocircuits.rep_hill(p[self.mSecondInput].getConcentration(), self.mSecondHill)
-            )
+            return lambda p: hill.rep_hill_mult(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
         elif self.mType == "aa_and":
-            return lambda p: biocircuits.aa_and(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
+            return lambda p: hill.aa_and(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
         elif self.mType == "aa_or":
-            return lambda p: biocircuits.aa_or(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
+            return lambda p: hill.aa_or(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
         elif self.mType == "aa_or_single":
-            return lambda p: biocircuits.aa_or_single(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
+            return lambda p: hill.aa_or_single(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
         elif self.mType == "rr_and":
-            return lambda p: biocircuits.rr_and(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
+            return lambda p: hill.rr_and(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
         elif self.mType == "rr_or":
-            return lambda p: biocircuits.rr_or(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
+            return lambda p: hill.rr_or(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
         elif self.mType == "rr_and_single":
-            return lambda p: biocircuits.rr_and_single(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
+            return lambda p: hill.rr_and_single(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
         elif self.mType == "ar_and":
-            return lambda p: biocircuits.ar_and(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
+            return lambda p: hill.ar_and(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
         elif self.mType == "ar_or":
-            return lambda p: biocircuits.ar_or(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
+            return lambda p: hill.ar_or(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
         elif self.mType == "ar_and_single":
-            return lambda p: biocircuits.ar_and_single(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
+            return lambda p: hill.ar_and_single(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
         elif self.mType == "ar_or_single":
-            return lambda p: biocircuits.ar_or_single(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
+            return lambda p: hill.ar_or_single(p[self.mFirstInput].getConcentration(), p[self.mSecondInput].getConcentration(), self.mFirstHill, self.mSecondHill)
         else:
             raise ValueError(f"Unknown regulatory function type: {self.mType}")
         
@@ -0,0 +1,196 @@
+"""
+Persistent cache of simulation results, content-addressed by a hash of everything that produced them.
+
+Each entry is one compressed .npz file named after its key, written to a temporary file and
+renamed into place so readers never see a partial entry, even with several backend processes on
+the same directory. Reading an entry touches its modification time, and once the directory
+outgrows its byte budget the least recently used entries are deleted.
+"""
+import hashlib
+import importlib.util
+import json
+import marshal
+import os
+import sys
+import tempfile
+import zipfile
+
+import numpy as np
+import scipy
+
+from . import __version__
+
+# Environment variable overriding the cache directory
+CACHE_DIR_VARIABLE = "GENECIRCUITS_CACHE_DIR"
+
+# Bytes of results kept on disk before the least recently used entries are deleted
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Layout of the stored entries; bump to orphan every entry written by an older layout
+CACHE_FORMAT = 1
+
+ENTRY_SUFFIX = ".npz"
+
+# Backend modules whose code decides the stored trajectories and plots; editing any of them
+# orphans every entry, without anyone having to bump __version__ or CACHE_FORMAT
+KEY_MODULES = ("compiler", "hill", "inputs", "jit", "simulate", "ipc_server")
+
+# source_digest() of this process, computed on first use
+_source_digest = None
+
+
+def default_cache_dir():
+    """$GENECIRCUITS_CACHE_DIR, or a results folder in the platform's per-user cache directory."""
+    if os.environ.get(CACHE_DIR_VARIABLE):
+        return os.environ[CACHE_DIR_VARIABLE]
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Caches")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "genecircuits", "results")
+
+
+def source_digest():
+    """Hex digest of the sources of KEY_MODULES, or of their compiled code in frozen builds."""
+    global _source_digest
+    if _source_digest is None:
+        digest = hashlib.sha256()
+        for name in KEY_MODULES:
+            spec = importlib.util.find_spec(f"{__package__}.{name}")
+            try:
+                with open(spec.origin, "rb") as f:
+                    digest.update(f.read())
+            except (OSError, TypeError):
+                # PyInstaller bundles only carry the compiled modules
+                digest.update(marshal.dumps(spec.loader.get_code(spec.name)))
+        _source_digest = digest.hexdigest()
+    return _source_digest
+
+
+class ResultCache:
+    """
+    Arrays of earlier results under directory, at most maxBytes of them; maxBytes=0 disables the cache.
+
+    Keys come from key(), which folds in the backend version, a digest of the backend's numerical
+    code and the NumPy and SciPy versions, so that neither an upgrade nor an edit of the kernels
+    serves results of other numerics. get and put only raise for programming errors: a
+    missing, unreadable or corrupt entry is a miss, and put reports whether the entry was written.
+    """
+
+    def __init__(self, directory=None, maxBytes=DEFAULT_MAX_BYTES):
+        self.mDirectory = directory or default_cache_dir()
+        self.mMaxBytes = maxBytes
+        self.mHits = 0
+        self.mMisses = 0
+        self.mWrites = 0
+        self.mEvictions = 0
+
+    @staticmethod
+    def key(*parts):
+        """Hex digest of the JSON of parts together with the code and versions that produced the result."""
+        versions = [CACHE_FORMAT, __version__, source_digest(), np.__version__, scipy.__version__]
+        canonical = json.dumps([versions, *parts], sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def isEnabled(self):
+        return self.mMaxBytes > 0
+
+    def get(self, key):
+        """The arrays stored under key as a dict, or None."""
+        if not self.isEnabled():
+            return None
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as entry:
+                arrays = {name: entry[name] for name in entry.files}
+            os.utime(path)
+        except FileNotFoundError:
+            self.mMisses += 1
+            return None
+        except (OSError, ValueError, EOFError, zipfile.BadZipFile):
+            # Corrupt or truncated by something other than put; drop it and recompute
+            self._remove(path)
+            self.mMisses += 1
+            return None
+        self.mHits += 1
+        return arrays
+
+    def put(self, key, **arrays):
+        """Store arrays under key, then evict down to maxBytes. Returns False if the entry could not be written."""
+        if not self.isEnabled():
+            return False
+        temp = None
+        try:
+            os.makedirs(self.mDirectory, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self.mDirectory, suffix=".tmp", delete=False) as f:
+                temp = f.name
+                np.savez_compressed(f, **arrays)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, self._path(key))
+        except OSError:
+            if temp is not None:
+                self._remove(temp)
+            return False
+        self.mWrites += 1
+        self.evict()
+        return True
+
+    def evict(self):
+        """Delete least recently used entries until the directory holds at most maxBytes."""
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in sorted(entries, key=lambda entry: entry[2]):
+            if total <= self.mMaxBytes:
+                break
+            if self._remove(path):
+                self.mEvictions += 1
+            total -= size
+
+    def clear(self):
+        for path, _, _ in self._entries():
+            self._remove(path)
+
+    def getStats(self):
+        entries = self._entries()
+        lookups = self.mHits + self.mMisses
+        return {
+            "directory": self.mDirectory,
+            "entries": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "maxBytes": self.mMaxBytes,
+            "hits": self.mHits,
+            "misses": self.mMisses,
+            "writes": self.mWrites,
+            "evictions": self.mEvictions,
+            "hitRate": self.mHits / lookups if lookups else 0.0,
+        }
+
+    def _path(self, key):
+        return os.path.join(self.mDirectory, key + ENTRY_SUFFIX)
+
+    def _entries(self):
+        """(path, size, last use) of every stored entry; temporary files of writes in progress are skipped."""
+        entries = []
+        try:
+            with os.scandir(self.mDirectory) as it:
+                for item in it:
+                    if item.name.endswith(ENTRY_SUFFIX):
+                        try:
+                            stat = item.stat()
+                        except FileNotFoundError:
+                            continue
+                        entries.append((item.path, stat.st_size, stat.st_mtime))
+        except FileNotFoundError:
+            pass
+        return entries
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
@@ -0,0 +1,457 @@
+import warnings
+
+import numpy as np
+import scipy.integrate
+import scipy.sparse
+import scipy.stats
+import scipy.stats.qmc
+
+from .compiler import (HILL_PARAMETER, SINGLE_INPUT_GATES, CompiledCircuit, compile_circuit, parameter_slots,
+                       parameter_value)
+from .parser import parse_circuit
+from .simulate import IVP_METHODS, SOLVERS, input_breakpoints, inputs_frozen_between_edges, integrate_segments
+from .sweep import run_sweep
+
+
+# Above this many proteins default_parameters only includes the betas, since the sensitivity
+# system grows with proteins times parameters
+MAX_FULL_DEFAULT_PROTEINS = 20
+
+
+def default_parameters(circuit):
+    """
+    (target, parameter) pairs for the beta of every regulated protein, the loss rate of every
+    protein and every Hill coefficient, in protein and gate order. Circuits of more than
+    MAX_FULL_DEFAULT_PROTEINS proteins only get the betas.
+    """
+    names = circuit.getNames()
+    regulated = set()
+    hills = []
+    for group in circuit.mGateGroups:
+        regulated.update(group.mTargets.tolist())
+        inputs = [group.mFirstInputs] if group.mType in SINGLE_INPUT_GATES else [group.mFirstInputs, group.mSecondInputs]
+        for k, target in enumerate(group.mTargets):
+            for column in inputs:
+                hill_id = f"{names[column[k]]}-{names[target]}"
+                if hill_id not in hills:
+                    hills.append(hill_id)
+    parameters = [(names[i], "beta") for i in sorted(regulated)]
+    if len(names) > MAX_FULL_DEFAULT_PROTEINS:
+        return parameters
+    parameters += [(name, "lossRate") for name in names]
+    return parameters + [(hill_id, HILL_PARAMETER) for hill_id in hills]
+
+
+def run_sensitivity(t, circuit, parameters=None, solver="odeint", jacobian=True, rtol=None, atol=None, max_step=None,
+                    split_at_pulses=True, full_output=False):
+    """
+    Concentrations and their forward sensitivities to parameters, in one integration.
+
+    parameters is a list of (target, parameter) pairs as for run_ensemble: ("Protein A", "beta"),
+    ("Protein A", "lossRate"), ("Protein A", "initialConcentration") or ("Protein A-Protein B", "hill").
+    It defaults to default_parameters. The sensitivities S = dx/dp of the internal concentrations
+    are integrated together with x as dS/dt = J S + df/dp, where J is the circuit Jacobian and
+    df/dp comes from the gate outputs and their derivatives, so the solver controls their error
+    like that of x. Inputs do not depend on the parameters, so S is also the sensitivity of the
+    total concentrations.
+
+    Returns a dict with
+      "concentrations": (len(t), N) total concentrations, as run_simulation;
+      "sensitivities": (len(t), N, P) d(concentration)/d(parameter);
+      "indices": (N, P) normalized sensitivity indices p * RMS_t(dx/dp) / max_t |x|, the relative
+        change of each protein per relative change of each parameter, 0 for proteins that stay 0;
+      "parameters": the P (target, parameter) pairs and "values": their values.
+    With full_output=True a second value holds the solver info dict.
+    """
+    if solver != "odeint" and solver not in IVP_METHODS:
+        raise ValueError(f"Unknown solver '{solver}', expected one of {SOLVERS}")
+    if not isinstance(circuit, CompiledCircuit):
+        circuit = compile_circuit(circuit)
+    if parameters is None:
+        parameters = default_parameters(circuit)
+    t = np.asarray(t, dtype=float)
+    n, num_parameters = circuit.getNumProteins(), len(parameters)
+    slots = [parameter_slots(circuit, target, parameter) for target, parameter in parameters]
+    values = np.array([parameter_value(circuit, *pair, slot) for pair, slot in zip(parameters, slots)])
+
+    # State: x followed by one block of N sensitivities per parameter
+    z0 = np.zeros(n * (num_parameters + 1))
+    z0[:n] = circuit.getInitialConcentrations()
+    for j, ((_, parameter), (_, where)) in enumerate(zip(parameters, slots)):
+        if parameter == "initialConcentration":
+            z0[n * (j + 1) + where] = 1.0
+
+    system = SensitivitySystem(circuit, parameters, slots, values)
+    breakpoints = input_breakpoints(circuit, t[0], t[-1]) if split_at_pulses else None
+    z, nfev, njev = integrate_segments(
+        system, t, z0, solver, jacobian, rtol, atol, max_step, breakpoints,
+        freeze=inputs_frozen_between_edges(circuit, t[0], t[-1])
+    )
+    info = {"solver": solver, "nfev": nfev, "njev": njev}
+
+    internal = z[:, :n]
+    sensitivities = z[:, n:].reshape(len(t), num_parameters, n).transpose(0, 2, 1)
+    scale = np.abs(internal).max(axis=0)
+    rms = np.sqrt(np.mean(sensitivities ** 2, axis=0))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        indices = np.where(scale[:, np.newaxis] > 0, values * rms / scale[:, np.newaxis], 0.0)
+
+    result = {
+        "concentrations": internal + circuit.getExternalConcentrations(t),
+        "sensitivities": sensitivities,
+        "indices": indices,
+        "parameters": list(parameters),
+        "values": values,
+    }
+    return (result, info) if full_output else result
+
+
+class SensitivitySystem:
+    """
+    The circuit state x followed by one block of N sensitivities per parameter, with the
+    integration interface of a CompiledCircuit (see simulate.integrate_segments).
+
+    The Jacobian is approximated by the block-diagonal kron(I, J) of the circuit Jacobian J: the
+    second derivatives coupling the sensitivities back to x only affect how fast the implicit
+    solvers converge. It is handed out sparse to BDF and Radau and in banded storage to LSODA, so
+    it takes (P + 1) times the memory of J rather than a dense matrix of the whole state.
+    """
+
+    def __init__(self, circuit, parameters, slots, values):
+        self.mCircuit = circuit
+        self.mNumProteins = circuit.getNumProteins()
+        self.mNumBlocks = len(parameters) + 1
+        self.mTable = _parameter_table(circuit, parameters, slots)
+        self.mTable["values"] = values
+        sparsity = circuit.getJacobianSparsity().tocoo()
+        offsets = sparsity.row - sparsity.col
+        self.mBandwidth = (max(0, int(offsets.max(initial=0))), max(0, -int(offsets.min(initial=0))))
+
+    def getNumStates(self):
+        return self.mNumProteins * self.mNumBlocks
+
+    def getExternalConcentrations(self, t):
+        return self.mCircuit.getExternalConcentrations(t)
+
+    def calcRates(self, z, t, ext=None):
+        circuit, n = self.mCircuit, self.mNumProteins
+        ext = circuit.getExternalConcentrations(t) if ext is None else ext
+        x = z[:n]
+        conc = x + ext
+        prod = circuit.calcProdRates(conc)
+        d_first, d_second = circuit.calcGateDerivatives(conc)
+        sens = z[n:].reshape(self.mNumBlocks - 1, n)
+        d_sens = sens @ circuit.calcJacobian(x, t, ext).T
+        d_sens += _parameter_rates(circuit, self.mTable, x, conc, prod, d_first, d_second)
+        return np.concatenate((circuit.mBeta * prod - circuit.mDegradation * x, d_sens.ravel()))
+
+    def getBandwidth(self):
+        return self.mBandwidth
+
+    def calcBandedJacobian(self, z, t, ext=None):
+        """kron(I, J) in the banded storage of CompiledCircuit.calcBandedJacobian, one copy of J per block."""
+        lower, upper = self.mBandwidth
+        jac = self.mCircuit.calcSparseJacobian(z[:self.mNumProteins], t, ext).tocoo()
+        band = np.zeros((lower + upper + 1, self.mNumProteins))
+        band[jac.row - jac.col + upper, jac.col] = jac.data
+        return np.tile(band, self.mNumBlocks)
+
+    def calcSparseJacobian(self, z, t, ext=None):
+        jac = self.mCircuit.calcSparseJacobian(z[:self.mNumProteins], t, ext)
+        return scipy.sparse.kron(scipy.sparse.identity(self.mNumBlocks, format="csr"), jac, format="csr")
+
+    def calcJacobian(self, z, t, ext=None):
+        return self.calcSparseJacobian(z, t, ext).toarray()
+
+    def getJacobianSparsity(self):
+        return scipy.sparse.kron(
+            scipy.sparse.identity(self.mNumBlocks, format="csr"), self.mCircuit.getJacobianSparsity(), format="csr"
+        )
+
+
+def _parameter_table(circuit, parameters, slots):
+    """
+    Where every parameter enters the rates, as flat index arrays for _parameter_rates:
+    (parameter, protein) pairs of the betas and loss rates, and (parameter, gate, which input) of
+    every gate entry with a Hill coefficient parameter, gates in mGateTable order.
+    """
+    offsets = np.cumsum([0] + [len(group) for group in circuit.mGateGroups])
+    table = {key: [] for key in ("betaRows", "betaProteins", "lossRows", "lossProteins", "hillRows", "hillGates", "hillSecond")}
+    for j, ((_, parameter), (kind, where)) in enumerate(zip(parameters, slots)):
+        if parameter == "beta":
+            table["betaRows"].append(j)
+            table["betaProteins"].append(where)
+        elif parameter == "lossRate":
+            table["lossRows"].append(j)
+            table["lossProteins"].append(where)
+        elif kind == "hill":
+            for g, which, entries in where:
+                table["hillRows"] += [j] * len(entries)
+                table["hillGates"] += (offsets[g] + entries).tolist()
+                table["hillSecond"] += [which == "second"] * len(entries)
+    table = {key: np.asarray(value, dtype=bool if key == "hillSecond" else np.intp) for key, value in table.items()}
+
+    _, targets, first, second, first_hills, second_hills = circuit.mGateTable
+    gates, is_second = table["hillGates"], table["hillSecond"]
+    table["hillInputs"] = np.where(is_second, second[gates], first[gates])
+    table["hillValues"] = np.where(is_second, second_hills[gates], first_hills[gates])
+    table["hillTargets"] = targets[gates]
+    return table
+
+
+def _parameter_rates(circuit, table, internal, conc, prod, d_first, d_second):
+    """
+    (P, N) partial derivatives of the rates with respect to every parameter at fixed concentrations,
+    from the gate sums prod and the gate derivatives of CompiledCircuit.calcGateDerivatives.
+    """
+    out = np.zeros((len(table["values"]), circuit.getNumProteins()))
+    out[table["betaRows"], table["betaProteins"]] = prod[table["betaProteins"]]
+    out[table["lossRows"], table["lossProteins"]] = -internal[table["lossProteins"]]
+    if len(table["hillGates"]):
+        gates = table["hillGates"]
+        d_input = np.where(table["hillSecond"], d_second[gates], d_first[gates])
+        x = conc[table["hillInputs"]]
+        # d(x**n)/dn = x**n ln x = d(x**n)/dx * x ln x / n, so the gate's dx derivative gives its dn one
+        safe_x = np.where(x > 0, x, 1.0)
+        d_hill = np.where(x > 0, d_input * safe_x * np.log(safe_x) / table["hillValues"], 0.0)
+        targets = table["hillTargets"]
+        np.add.at(out, (table["hillRows"], targets), circuit.mBeta[targets] * d_hill)
+    return out
+
+
+GLOBAL_METHODS = ("sobol", "morris")
+
+# Scalar summaries of one protein's trajectory; amplitude and period only look at the second half of t
+TRAJECTORY_METRICS = ("final", "mean", "max", "min", "amplitude", "period")
+
+
+class TrajectoryMetrics:
+    """
+    Reduces ensemble trajectories (M, len(t), N) to (M, K) scalars, one per (protein column, metric)
+    pair. Picklable, so sweep workers can apply it before sending results back.
+    """
+
+    def __init__(self, columns, metrics):
+        for metric in metrics:
+            if metric not in TRAJECTORY_METRICS:
+                raise ValueError(f"Unknown metric '{metric}', expected one of {list(TRAJECTORY_METRICS)}")
+        self.mColumns = list(columns)
+        self.mMetrics = list(metrics)
+
+    def __call__(self, t, concentrations):
+        t = np.asarray(t, dtype=float)
+        late = t >= 0.5 * (t[0] + t[-1])
+        out = np.empty((concentrations.shape[0], len(self.mColumns)))
+        for k, (column, metric) in enumerate(zip(self.mColumns, self.mMetrics)):
+            x = concentrations[:, :, column]
+            if metric == "final":
+                out[:, k] = x[:, -1]
+            elif metric == "mean":
+                out[:, k] = scipy.integrate.trapezoid(x, t, axis=1) / (t[-1] - t[0]) if t[-1] > t[0] else x[:, 0]
+            elif metric == "max":
+                out[:, k] = x.max(axis=1)
+            elif metric == "min":
+                out[:, k] = x.min(axis=1)
+            elif metric == "amplitude":
+                out[:, k] = x[:, late].max(axis=1) - x[:, late].min(axis=1)
+            else:
+                out[:, k] = oscillation_period(t[late], x[:, late])
+        return out
+
+
+def oscillation_period(t, x):
+    """
+    Mean time between upward crossings of the mean level by each row of x (M, len(t)), NaN for rows
+    that cross fewer than twice or barely vary.
+    """
+    level = x.mean(axis=1, keepdims=True)
+    d = x - level
+    flat = (x.max(axis=1) - x.min(axis=1)) <= 1e-6 * np.maximum(1.0, np.abs(level[:, 0]))
+    up = (d[:, :-1] < 0) & (d[:, 1:] >= 0)
+    out = np.full(x.shape[0], np.nan)
+    for m in np.flatnonzero((up.sum(axis=1) >= 2) & ~flat):
+        k = np.flatnonzero(up[m])
+        crossings = t[k] - d[m, k] * (t[k + 1] - t[k]) / (d[m, k + 1] - d[m, k])
+        out[m] = (crossings[-1] - crossings[0]) / (len(k) - 1)
+    return out
+
+
+def saltelli_samples(num_parameters, num_samples, seed=None):
+    """
+    Unit-cube Saltelli design: the (N, P) base matrices A and B from one scrambled Sobol sequence,
+    N rounded up to a power of two. The evaluation rows are A, B, then A with column i taken from B
+    for every i, N * (P + 2) in all; saltelli_rows builds any slice of them.
+    """
+    m = max(1, int(np.ceil(np.log2(max(2, int(num_samples))))))
+    base = scipy.stats.qmc.Sobol(d=2 * num_parameters, scramble=True, seed=seed).random_base2(m)
+    return base[:, :num_parameters], base[:, num_parameters:]
+
+
+def saltelli_rows(A, B):
+    """All N * (P + 2) evaluation rows of the design (A, B), in saltelli_samples order."""
+    blocks = [A, B]
+    for i in range(A.shape[1]):
+        AB = A.copy()
+        AB[:, i] = B[:, i]
+        blocks.append(AB)
+    return np.concatenate(blocks)
+
+
+def sobol_indices(fA, fB, fAB, confidence=0.95, resamples=100, seed=None):
+    """
+    First- and total-order Sobol indices from Saltelli evaluations fA, fB (N, K) and fAB (P, N, K),
+    with the Saltelli (2010) and Jansen estimators. Rows where any evaluation is not finite are left
+    out per output. Returns (S1, S1 half-width, ST, ST half-width, valid rows), indices (K, P), the
+    half-widths of the bootstrap confidence intervals at the given level.
+    """
+    num_parameters, _, num_outputs = fAB.shape
+    z = scipy.stats.norm.ppf(0.5 + confidence / 2)
+    rng = np.random.default_rng(seed)
+    results = np.zeros((4, num_outputs, num_parameters))
+    valid = np.isfinite(fA) & np.isfinite(fB) & np.isfinite(fAB).all(axis=0)
+
+    def estimate(a, b, ab):
+        variance = np.var(np.concatenate((a, b), axis=-1), axis=-1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            first = np.mean(b[..., np.newaxis, :] * (ab - a[..., np.newaxis, :]), axis=-1) / variance[..., np.newaxis]
+            total = 0.5 * np.mean((a[..., np.newaxis, :] - ab) ** 2, axis=-1) / variance[..., np.newaxis]
+        # An output that does not vary depends on no parameter
+        return np.nan_to_num(first), np.nan_to_num(total)
+
+    for k in range(num_outputs):
+        rows = np.flatnonzero(valid[:, k])
+        if len(rows) < 2:
+            results[:, k] = np.nan
+            continue
+        a, b, ab = fA[rows, k], fB[rows, k], fAB[:, rows, k]
+        results[0, k], results[2, k] = estimate(a, b, ab)
+        # Bootstrap over rows, a few resamples per vectorized batch
+        first, total = [], []
+        for start in range(0, resamples, 10):
+            pick = rng.integers(len(rows), size=(min(10, resamples - start), len(rows)))
+            s1, st = estimate(a[pick], b[pick], ab[:, pick].transpose(1, 0, 2))
+            first.append(s1)
+            total.append(st)
+        if first:
+            results[1, k] = z * np.std(np.concatenate(first), axis=0, ddof=1)
+            results[3, k] = z * np.std(np.concatenate(total), axis=0, ddof=1)
+    return results[0], results[1], results[2], results[3], valid.sum(axis=0)
+
+
+def morris_samples(num_parameters, trajectories, levels=4, seed=None):
+    """
+    Unit-cube Morris design: `trajectories` one-at-a-time paths of P + 1 points on a grid of `levels`
+    levels, each moving one parameter by levels / (2 (levels - 1)) per step in a random order.
+    Returns the (trajectories * (P + 1), P) points, the (trajectories, P) order and the step.
+    """
+    if levels < 2 or levels % 2:
+        raise ValueError(f"Morris sampling needs an even number of levels, got {levels}")
+    rng = np.random.default_rng(seed)
+    delta = levels / (2 * (levels - 1))
+    base = rng.integers(0, levels // 2, size=(trajectories, num_parameters)) / (levels - 1)
+    order = np.argsort(rng.random((trajectories, num_parameters)), axis=1)
+    points = np.repeat(base[:, np.newaxis, :], num_parameters + 1, axis=1)
+    for step in range(num_parameters):
+        points[np.arange(trajectories), step + 1:, order[:, step]] += delta
+    return points.reshape(-1, num_parameters), order, delta
+
+
+def morris_indices(f, order, delta, confidence=0.95, resamples=100, seed=None):
+    """
+    Elementary-effect statistics from Morris evaluations f (trajectories * (P + 1), K). Returns
+    (mu, mu*, sigma, mu* half-width), each (K, P), in units of output per unit-cube step; effects
+    that are not finite are left out.
+    """
+    trajectories, num_parameters = order.shape
+    f = f.reshape(trajectories, num_parameters + 1, -1)
+    effects = np.empty((trajectories, num_parameters, f.shape[-1]))
+    rows = np.arange(trajectories)[:, np.newaxis]
+    effects[rows, order] = np.diff(f, axis=1) / delta
+    effects = effects.transpose(2, 1, 0)
+
+    z = scipy.stats.norm.ppf(0.5 + confidence / 2)
+    rng = np.random.default_rng(seed)
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mu = np.nanmean(effects, axis=-1)
+        mu_star = np.nanmean(np.abs(effects), axis=-1)
+        sigma = np.nanstd(effects, axis=-1, ddof=1) if trajectories > 1 else np.zeros_like(mu)
+        pick = rng.integers(trajectories, size=(resamples, trajectories))
+        boot = np.nanmean(np.abs(effects[..., pick]), axis=-1)
+        conf = z * np.nanstd(boot, axis=-1, ddof=1) if resamples > 1 else np.zeros_like(mu)
+    return mu, mu_star, sigma, conf
+
+
+def global_sensitivity(circuit_json, axes, t, outputs=None, method="sobol", samples=1024, levels=4, seed=None,
+                       confidence=0.95, resamples=100, chunk_size=64, workers=None, progress=None, **solver_options):
+    """
+    Variance-based (Sobol) or elementary-effect (Morris) global sensitivity of scalar trajectory metrics.
+
+    axes lists {"target", "parameter", "min", "max"} dicts as for sweep.run_sweep, sampled uniformly.
+    outputs lists {"protein", "metric"} dicts with a metric from TRAJECTORY_METRICS; it defaults
+    to the final concentration of every protein. The design points are simulated as ensembles
+    across worker processes (see sweep.run_sweep), which reduce every trajectory to the metrics
+    before sending it back, so memory grows with the number of samples times outputs only.
+    progress(done, total) is called after every chunk.
+
+    method "sobol" evaluates `samples` (rounded up to a power of two) Saltelli rows per base matrix,
+    samples * (P + 2) simulations, and returns "S1", "S1Conf", "ST", "STConf" and "numValid";
+    "morris" runs `samples` trajectories of P + 1 simulations on a `levels` grid and returns "mu",
+    "muStar", "sigma" and "muStarConf". Indices are (K outputs, P parameters) and the Conf arrays
+    are bootstrap confidence interval half-widths. Both also return "parameters", "outputs",
+    "numEvaluations" and the solver "info" with nfev and njev summed over chunks.
+    """
+    if method not in GLOBAL_METHODS:
+        raise ValueError(f"Unknown global sensitivity method '{method}', expected one of {list(GLOBAL_METHODS)}")
+    if not axes:
+        raise ValueError("Global sensitivity needs at least one parameter")
+    parameters = [(axis["target"], axis["parameter"]) for axis in axes]
+    lower = np.array([float(axis["min"]) for axis in axes])
+    upper = np.array([float(axis["max"]) for axis in axes])
+    if np.any(lower >= upper):
+        raise ValueError("Every global sensitivity parameter needs min < max")
+
+    names = [protein.getName() for protein in parse_circuit(circuit_json)]
+    if outputs is None:
+        outputs = [{"protein": name, "metric": "final"} for name in names]
+    for output in outputs:
+        if output["protein"] not in names:
+            raise ValueError(f"Unknown protein '{output['protein']}' in global sensitivity outputs")
+    reduce = TrajectoryMetrics([names.index(o["protein"]) for o in outputs], [o.get("metric", "final") for o in outputs])
+
+    if method == "sobol":
+        A, B = saltelli_samples(len(axes), samples, seed)
+        unit = saltelli_rows(A, B)
+    else:
+        unit, order, delta = morris_samples(len(axes), max(2, int(samples)), levels, seed)
+    values = lower + unit * (upper - lower)
+    del unit
+
+    f = np.empty((len(values), len(outputs)))
+    info = {"solver": solver_options.get("solver", "odeint")}
+    done = 0
+    for chunk in run_sweep(circuit_json, parameters, values, t, chunk_size=chunk_size, workers=workers, output=reduce,
+                           **solver_options):
+        f[chunk["indices"]] = chunk["concentrations"]
+        for key in ("nfev", "njev"):
+            info[key] = info.get(key, 0) + chunk["info"].get(key, 0)
+        done += len(chunk["indices"])
+        if progress is not None:
+            progress(done, len(values))
+
+    result = {
+        "method": method,
+        "parameters": parameters,
+        "outputs": [(o["protein"], o.get("metric", "final")) for o in outputs],
+        "numEvaluations": len(values),
+        "info": info,
+    }
+    if method == "sobol":
+        n = len(A)
+        fAB = f[2 * n:].reshape(len(axes), n, len(outputs))
+        s1, s1_conf, st, st_conf, valid = sobol_indices(f[:n], f[n:2 * n], fAB, confidence, resamples, seed)
+        result.update({"S1": s1, "S1Conf": s1_conf, "ST": st, "STConf": st_conf, "numValid": valid})
+    else:
+        mu, mu_star, sigma, conf = morris_indices(f, order, delta, confidence, resamples, seed)
+        result.update({"mu": mu, "muStar": mu_star, "sigma": sigma, "muStarConf": conf})
+    return result
@@ -1,6 +1,49 @@
+from collections import OrderedDict
+
 import scipy.integrate
+import scipy.interpolate
+import scipy.sparse.linalg
 import numpy as np
 
+from .compiler import (CompiledCircuit, EnsembleCircuit, changed_proteins, compile_circuit, component_circuit,
+                       make_ensemble)
+from .inputs import PIECEWISE_CONSTANT_INPUTS, steady_state, x_pulse
+
+# Solvers available through scipy.integrate.solve_ivp
+IVP_METHODS = ("LSODA", "BDF", "Radau", "RK45", "DOP853")
+
+# Every value accepted for circuitSettings.solver
+SOLVERS = ("odeint",) + IVP_METHODS
+
+# Implicit solve_ivp methods that accept a scipy.sparse Jacobian
+SPARSE_JACOBIAN_METHODS = ("BDF", "Radau")
+
+# solve_ivp methods whose error control uses an RMS norm over all components
+RMS_NORM_METHODS = ("BDF", "Radau", "RK45", "DOP853")
+
+# Above this many edges per pulse input the integration is not split at pulse edges
+MAX_PULSE_BREAKPOINTS = 2000
+
+# integrate_components samples every upstream component this many times per output interval, so
+# downstream components read an interpolant of it that is accurate between the output points
+COMPONENT_SAMPLES = 4
+
+# reintegrate reads the unchanged upstream proteins from a spline through the stored output points.
+# If that spline may be off by more than this fraction of their largest concentration, the output
+# grid is too coarse for their dynamics and the whole circuit is integrated again instead
+REINTEGRATION_TOLERANCE = 1e-4
+
+# Up to this many proteins find_steady_state uses dense linear algebra. Above it, Newton steps use a
+# sparse LU and only the rightmost Jacobian eigenvalues, which decide stability, are computed
+# instead of the full O(N^3) dense spectrum
+DENSE_JACOBIAN_LIMIT = 500
+NUM_RIGHTMOST_EIGENVALUES = 6
+
+# A run stores about this many evenly spaced checkpoints, and a CheckpointStore keeps those of
+# this many circuits and settings
+NUM_CHECKPOINTS = 16
+MAX_CHECKPOINT_CIRCUITS = 16
+
 
 # TODO: leave descriptor
 def simulation_iter(concentrations, t, proteinArray):
@@ -18,10 +61,131 @@ def simulation_iter(concentrations, t, proteinArray):
     return production_rates
 
 
-def run_simulation(t, proteinArray):
+class SimulationRecord:
+    """What run_simulation keeps of a finished run so a later run of an edited circuit can reuse it."""
+
+    def __init__(self, circuit, t, settings, internal):
+        self.mCircuit = circuit
+        self.mTimePoints = np.array(t, dtype=float)
+        # Everything besides the circuit that the trajectories depend on
+        self.mSettings = settings
+        self.mInternal = internal
+
+    def matches(self, circuit, t, settings):
+        """Whether circuit has the same proteins and t and settings are those of this run."""
+        return (
+            circuit.getNames() == self.mCircuit.getNames()
+            and settings == self.mSettings
+            and np.array_equal(np.asarray(t, dtype=float), self.mTimePoints)
+        )
+
+
+class CheckpointStore:
+    """
+    Internal concentrations at a few time points of earlier runs, per circuit and solver settings.
+
+    The inputs are functions of absolute time, so the state vector and its time are all a run
+    needs to resume. The checkpoints of the MAX_CHECKPOINT_CIRCUITS most recently used circuits
+    and settings are kept.
+    """
+
+    def __init__(self, maxCircuits=MAX_CHECKPOINT_CIRCUITS):
+        self.mMaxCircuits = maxCircuits
+        # key -> (sorted times, states with one row per time)
+        self.mEntries = OrderedDict()
+
+    @staticmethod
+    def key(circuit, settings):
+        return circuit.getHash(), tuple(settings)
+
+    def add(self, circuit, settings, t, internal):
+        """Keep about NUM_CHECKPOINTS evenly spaced states of a trajectory internal on the time points t."""
+        t = np.asarray(t, dtype=float)
+        stride = max(1, (len(t) - 1) // NUM_CHECKPOINTS)
+        rows = np.union1d(np.arange(0, len(t), stride), [len(t) - 1])
+        key = self.key(circuit, settings)
+        times, states = self.mEntries.pop(key, (np.empty(0), np.empty((0, circuit.getNumProteins()))))
+        times, first = np.unique(np.concatenate((t[rows], times)), return_index=True)
+        self.mEntries[key] = (times, np.concatenate((internal[rows], states))[first])
+        while len(self.mEntries) > self.mMaxCircuits:
+            self.mEntries.popitem(last=False)
+
+    def latest(self, circuit, settings, time=np.inf):
+        """(time, internal state) of the last checkpoint at or before time, or None."""
+        key = self.key(circuit, settings)
+        if key not in self.mEntries:
+            return None
+        self.mEntries.move_to_end(key)
+        times, states = self.mEntries[key]
+        k = np.searchsorted(times, time, side="right") - 1
+        return None if k < 0 else (times[k], states[k])
+
+    def clear(self):
+        self.mEntries.clear()
+
+
+def run_simulation(t, proteinArray, vectorized=True, jacobian=True, solver="odeint",
+                   rtol=None, atol=None, max_step=None, full_output=False, split_at_pulses=True,
+                   decompose=False,
+                   previous=None, checkpoints=None):
+    """
+    Integrate the circuit over the time points t and return concentrations with shape (len(t), N).
+
+    By default the protein array is compiled into array form (see backend.compiler) so the
+    right-hand side is a handful of NumPy expressions. vectorized=False integrates through
+    simulation_iter instead, walking the Protein and Gate objects directly; it is kept as the
+    reference implementation and always uses odeint.
+
+    solver, rtol, atol, max_step and jacobian are passed on to integrate_circuit. Tolerances
+    left as None use the solver's own defaults. With full_output=True a second value is
+    returned: a dict with the solver that ran and its nfev/njev counts.
+
+    With split_at_pulses=True the integration is restarted at every edge of the x_pulse inputs.
+    With decompose=True the strongly connected components are integrated one after another
+    (see integrate_components).
+
+    With full_output=True the info dict also holds a SimulationRecord under "record". Passing it
+    back as previous when simulating an edited version of the circuit on the same t with the same
+    settings re-integrates only the proteins downstream of the edit (see reintegrate); info
+    reports how many proteins were "reintegrated". When t is too coarse to replay the unchanged
+    proteins to REINTEGRATION_TOLERANCE the whole circuit is integrated again instead.
+
+    checkpoints is a CheckpointStore that receives evenly spaced states of this run, from which
+    simulate_window and extend_simulation can later resume.
+
+    proteinArray may also be an already compiled CompiledCircuit, which skips compilation; the
+    reference implementation needs the protein array itself.
+    """
+    if isinstance(proteinArray, CompiledCircuit):
+        if not vectorized:
+            raise ValueError("vectorized=False needs the protein array, not a CompiledCircuit")
     # Initial concentrations each protein
-    if proteinArray is None or len(proteinArray) == 0:
+    elif proteinArray is None or len(proteinArray) == 0:
         return None
+
+    if vectorized:
+        circuit = proteinArray if isinstance(proteinArray, CompiledCircuit) else compile_circuit(proteinArray)
+        breakpoints = input_breakpoints(circuit, t[0], t[-1]) if split_at_pulses else None
+        settings = (solver, jacobian, rtol, atol, max_step, split_at_pulses, decompose)
+        options = dict(method=solver, jacobian=jacobian, rtol=rtol, atol=atol, max_step=max_step, breakpoints=breakpoints)
+        reintegrated = None
+        if previous is not None and previous.matches(circuit, t, settings):
+            affected = circuit.getDownstream(changed_proteins(previous.mCircuit, circuit))
+            reintegrated = reintegrate(circuit, t, previous.mInternal, affected, decompose=decompose, **options)
+        if reintegrated is not None:
+            internal, info = reintegrated
+        else:
+            integrate = integrate_components if decompose else integrate_circuit
+            internal, info = integrate(circuit, t, full_output=True, **options)
+            info["reintegrated"] = circuit.getNumProteins()
+        if checkpoints is not None:
+            checkpoints.add(circuit, _checkpoint_settings(solver, jacobian, rtol, atol, max_step, split_at_pulses), t, internal)
+        final_concentrations = internal + circuit.getExternalConcentrations(t)
+        if full_output:
+            info["record"] = SimulationRecord(circuit, t, settings, internal)
+            return final_concentrations, info
+        return final_concentrations
+
     initial_concentrations = [0.0] * len(proteinArray)
     for protein in proteinArray:
         initial_concentrations[protein.mID] = protein.getInternalConcentration()
@@ -29,24 +193,568 @@ def run_simulation(t, proteinArray):
     # Integrate!
     args = (proteinArray,)
 
-    final_concentrations = scipy.integrate.odeint(simulation_iter, initial_concentrations, t, args)
+    final_concentrations, infodict = scipy.integrate.odeint(
+        simulation_iter, initial_concentrations, t, args, full_output=True
+    )
 
     # Combine internal and external concentrations
     for i, protein in enumerate(proteinArray):
         if protein.mExtConcFunc is not None:
             final_concentrations[:, i] += protein.mExtConcFunc(t, *protein.mExtConcFuncArgs)
+    if full_output:
+        return final_concentrations, _odeint_info(infodict)
     return final_concentrations
 
-def x_pulse(t, t_0, t_f, tau, x_0, duty_cycle):
+def integrate_circuit(circuit, t, method="odeint", jacobian=True, rtol=None, atol=None, max_step=None,
+                      full_output=False, breakpoints=None, initial=None, prune=True):
+    """
+    Integrate the internal concentrations of a CompiledCircuit over the time points t.
+
+    method is "odeint" or one of the solve_ivp methods in IVP_METHODS. With jacobian=True the
+    analytical Jacobian is supplied: dense for odeint/LSODA, and as a scipy.sparse matrix for the
+    implicit BDF/Radau solvers, whose cost then scales with the number of gate edges instead of N^2.
+
+    breakpoints lists times where the external inputs jump (see input_breakpoints). The solver is
+    restarted at each one instead of discovering the edge through step rejections. If every input
+    is piecewise constant with all its edges among the breakpoints (see inputs_frozen_between_edges),
+    the inputs are also frozen to their value inside each segment.
+
+    initial is the internal state at t[0]; it defaults to the circuit's initial concentrations.
+
+    With prune=True the solver only sees the reduced system of prune_circuit; the proteins without
+    gates are filled in from their closed-form decay. info reports how many "states" were integrated.
+
+    Returns an array with shape (len(t), N), plus the solver info dict when full_output=True.
+    """
+    if method != "odeint" and method not in IVP_METHODS:
+        raise ValueError(f"Unknown solver '{method}', expected one of {SOLVERS}")
+
+    t = np.asarray(t, dtype=float)
+    y0 = circuit.getInitialConcentrations() if initial is None else np.array(initial, dtype=float)
+    pruned = prune_circuit(circuit, t[0], y0) if prune else None
+    if pruned is not None:
+        reduced, members = pruned
+        y = np.zeros((len(t), len(y0)))
+        decaying = np.flatnonzero(y0 != 0)
+        y[:, decaying] = y0[decaying] * np.exp(-np.outer(t - t[0], circuit.mDegradation[decaying]))
+        info = {"solver": method, "nfev": 0, "njev": 0, "states": len(members)}
+        if len(members):
+            y[:, members], sub_info = integrate_circuit(
+                reduced, t, method=method, jacobian=jacobian, rtol=rtol, atol=atol, max_step=max_step,
+                full_output=True, breakpoints=breakpoints, initial=y0[members], prune=False
+            )
+            info.update(sub_info, states=len(members))
+        return (y, info) if full_output else y
+
+    y, nfev, njev = integrate_segments(
+        circuit, t, y0, method, jacobian, rtol, atol, max_step, breakpoints,
+        freeze=inputs_frozen_between_edges(circuit, t[0], t[-1])
+    )
+    info = {"solver": method, "nfev": nfev, "njev": njev, "states": circuit.getNumStates()}
+    return (y, info) if full_output else y
+
+def integrate_segments(system, t, y0, method, jacobian, rtol, atol, max_step, breakpoints, freeze=False):
+    """
+    Integrate system from the state y0 over the time points t, restarting the solver at every
+    breakpoint inside them. With freeze=True the inputs are held at their value inside each
+    segment, which is only valid if inputs_frozen_between_edges holds for the breakpoints.
+
+    system is a CompiledCircuit or any object with its calcRates, Jacobian, bandwidth and
+    getExternalConcentrations methods, such as the sensitivity system of sensitivity.run_sensitivity.
+    Returns (y, nfev, njev).
+    """
+    edges = segment_edges(t, breakpoints if breakpoints is not None else [])
+    freeze = freeze and len(edges) > 0
+    bounds = np.concatenate(([t[0]], edges, [t[-1]]))
+
+    y = np.empty((len(t), len(y0)))
+    total_nfev = total_njev = 0
+    for k in range(len(bounds) - 1):
+        start, stop = bounds[k], bounds[k + 1]
+        last = k == len(bounds) - 2
+        mask = (t >= start) & ((t <= stop) if last else (t < stop))
+        # Every segment is integrated from its start to its end so the next one can resume there
+        t_seg = np.unique(np.concatenate(([start], t[mask], [stop])))
+        ext = system.getExternalConcentrations(0.5 * (start + stop)) if freeze else None
+
+        y_seg, nfev, njev = _integrate_segment(system, y0, t_seg, method, jacobian, rtol, atol, max_step, ext)
+        y[mask] = y_seg[np.searchsorted(t_seg, t[mask])]
+        y0 = y_seg[-1]
+        total_nfev += nfev
+        total_njev += njev
+    return y, total_nfev, total_njev
+
+def prune_circuit(circuit, t_0, initial):
     """
-    Returns x value for a pulse beginning at t = t_0 with a period of tau. 
-    duty_cycle is the fraction of the period that the pulse is on. This should be between 0 and 1.
-    x_0 is the amplitude of the pulse.
-    t_f is when the pulse should stop.
+    The smaller system left to integrate from the internal state initial at time t_0.
+
+    A protein without gates only decays, so it is dropped from the state vector and read by the
+    other gates as an input of its closed-form trajectory. Gates whose inputs all stay constant
+    (steady_state inputs of proteins that start at zero or do not decay) are evaluated once and
+    folded into a constant production term (see compiler.fold_constants).
+
+    Returns (reduced circuit, indices of its states in circuit), or None if nothing can be removed.
+    Ensembles are left alone, since the reduced circuit would lose their banded structure.
     """
-    # Find how far into the current period we are. Use floor to support floating point values.
-    t_since_period_start = t - t_0 - ((t - t_0) // (tau))*(tau)
-    return np.logical_and(t >= t_0, np.logical_and(t <= t_f, t_since_period_start <= tau*duty_cycle)) * x_0
+    if isinstance(circuit, EnsembleCircuit):
+        return None
+    num_states = circuit.getNumStates()
+    regulated = np.zeros(num_states, dtype=bool)
+    regulated[circuit.mGateTable[1]] = True
+
+    own_inputs = {i: (func, args) for i, func, args in circuit.mInputs}
+    inputs, constants = {}, {}
+    for i in range(circuit.getNumProteins()):
+        if i < num_states and regulated[i]:
+            continue
+        func, args = own_inputs.get(i, (steady_state, (0.0,)))
+        init = initial[i] if i < num_states else 0.0
+        degradation = circuit.mDegradation[i]
+        if func is steady_state and (init == 0 or degradation == 0):
+            constants[i] = init + args[0]
+        if init != 0:
+            args = (t_0, init, degradation, func, args)
+            func = _decay_output
+        inputs[i] = (func, args)
+    if regulated.all():
+        known = np.zeros(circuit.getNumProteins(), dtype=bool)
+        known[list(constants)] = True
+        _, _, first, second, _, _ = circuit.mGateTable
+        if not np.any(known[first] & known[second]):
+            return None
+
+    members = np.flatnonzero(regulated)
+    reduced, _ = component_circuit(circuit, members, inputs, constants)
+    return reduced, members
+
+def integrate_components(circuit, t, method="odeint", jacobian=True, rtol=None, atol=None, max_step=None,
+                         full_output=False, breakpoints=None):
+    """
+    Same as integrate_circuit, but integrates the strongly connected components of the regulatory
+    graph one at a time in topological order (see CompiledCircuit.getComponents).
+
+    Each component only sees the proteins it reads from earlier components, as inputs interpolated
+    with cubic Hermite splines through their computed trajectory and rates. The solver therefore
+    handles several small systems instead of one large one, and LSODA picks a stiff or non-stiff
+    method per component. Components without gates only decay and are solved in closed form.
+    The upstream trajectories are sampled on t plus the breakpoints, so t must resolve them.
+    """
+    t = np.asarray(t, dtype=float)
+    edges = np.asarray(breakpoints if breakpoints is not None else [], dtype=float)
+    # Upstream trajectories are sampled COMPONENT_SAMPLES times per output interval
+    fine = (t[:-1, np.newaxis] + np.diff(t)[:, np.newaxis] * np.arange(COMPONENT_SAMPLES) / COMPONENT_SAMPLES).ravel()
+    grid = np.union1d(np.union1d(t, fine), edges[(edges > t[0]) & (edges < t[-1])])
+    out = np.searchsorted(grid, t)
+
+    y = np.empty((len(t), circuit.getNumProteins()))
+    own_inputs = {i: (func, args) for i, func, args in circuit.mInputs}
+    upstream_inputs = {}
+    info = {"solver": method, "nfev": 0, "njev": 0, "components": 0}
+    for members in circuit.getComponents():
+        sub, _ = component_circuit(circuit, members, upstream_inputs)
+        info["components"] += 1
+
+        if not sub.mGateGroups:
+            # Nothing regulates these proteins: their internal concentrations only decay
+            for local, i in enumerate(members):
+                func, args = own_inputs.get(i, (steady_state, (0.0,)))
+                init, degradation = sub.mInitConc[local], sub.mDegradation[local]
+                if init != 0:
+                    args = (grid[0], init, degradation, func, args)
+                    func = _decay_output
+                upstream_inputs[i] = (func, args)
+                y[:, i] = _decay_output(t, grid[0], init, degradation, None, ())
+            continue
+
+        internal, sub_info = integrate_circuit(
+            sub, grid, method=method, jacobian=jacobian, rtol=rtol, atol=atol, max_step=max_step,
+            full_output=True, breakpoints=breakpoints
+        )
+        info["nfev"] += sub_info["nfev"]
+        info["njev"] += sub_info["njev"]
+        rates = sub.calcRates(internal, grid)
+        for local, i in enumerate(members):
+            coefficients = scipy.interpolate.CubicHermiteSpline(grid, internal[:, local], rates[:, local]).c
+            upstream_inputs[i] = (_component_output, (grid, coefficients) + own_inputs.get(i, (None, ())))
+        y[:, members] = internal[out, :len(members)]
+
+    return (y, info) if full_output else y
+
+def simulate_window(t, proteinArray, checkpoints, solver="odeint", jacobian=True, rtol=None, atol=None,
+                    max_step=None, split_at_pulses=True, full_output=False):
+    """
+    Concentrations on the time points t, which may start after time 0, resuming from the last
+    checkpoint at or before t[0] instead of integrating from 0. Without one the run starts from the
+    initial concentrations at time 0. The run adds its own checkpoints to the store, so zooming into
+    a window or extending a simulation only integrates from the nearest earlier state.
+
+    The solver arguments are those of run_simulation and, like the circuit, select which
+    checkpoints apply. With full_output=True the info dict also holds "resumedFrom", the time the
+    integration started at.
+    """
+    circuit = proteinArray if isinstance(proteinArray, CompiledCircuit) else compile_circuit(proteinArray)
+    t = np.asarray(t, dtype=float)
+    settings = _checkpoint_settings(solver, jacobian, rtol, atol, max_step, split_at_pulses)
+    start, initial = checkpoints.latest(circuit, settings, t[0]) or (0.0, circuit.getInitialConcentrations())
+    if t[0] < start:
+        raise ValueError(f"Cannot simulate from t={t[0]} before time 0")
+
+    grid = np.union1d([start], t)
+    breakpoints = input_breakpoints(circuit, grid[0], grid[-1]) if split_at_pulses else None
+    internal, info = integrate_circuit(
+        circuit, grid, method=solver, jacobian=jacobian, rtol=rtol, atol=atol, max_step=max_step,
+        full_output=True, breakpoints=breakpoints, initial=initial
+    )
+    checkpoints.add(circuit, settings, grid, internal)
+    internal = internal[np.searchsorted(grid, t)]
+    info["resumedFrom"] = float(start)
+    final_concentrations = internal + circuit.getExternalConcentrations(t)
+    return (final_concentrations, info) if full_output else final_concentrations
+
+def resume_time(proteinArray, checkpoints, time=np.inf, **options):
+    """
+    Time of the last checkpoint at or before time of the circuit under the run_simulation options,
+    or 0 without one.
+    """
+    circuit = proteinArray if isinstance(proteinArray, CompiledCircuit) else compile_circuit(proteinArray)
+    latest = checkpoints.latest(circuit, _checkpoint_settings(**options), time)
+    return 0.0 if latest is None else float(latest[0])
+
+def extend_simulation(duration, proteinArray, checkpoints, num_points=1000, **options):
+    """
+    Continue the latest stored run of the circuit up to time duration. Returns the concentrations
+    from its last checkpoint to duration on num_points time points, like simulate_window.
+    """
+    circuit = proteinArray if isinstance(proteinArray, CompiledCircuit) else compile_circuit(proteinArray)
+    start = resume_time(circuit, checkpoints, duration, **options)
+    return simulate_window(np.linspace(start, duration, int(num_points)), circuit, checkpoints, **options)
+
+def _checkpoint_settings(solver="odeint", jacobian=True, rtol=None, atol=None, max_step=None, split_at_pulses=True,
+                         **_):
+    """The run_simulation arguments a trajectory depends on, as stored with its checkpoints."""
+    return solver, jacobian, rtol, atol, max_step, split_at_pulses
+
+def reintegrate(circuit, t, previous, affected, method="odeint", jacobian=True, rtol=None, atol=None,
+                max_step=None, breakpoints=None, decompose=False):
+    """
+    Update previous, the (len(t), N) internal concentrations of an earlier run, by integrating only
+    the proteins in the boolean mask affected, which must be closed downstream (see
+    CompiledCircuit.getDownstream). The other proteins keep their previous trajectories and are
+    read as inputs through cubic Hermite splines with their exact rates as slopes, so the cost
+    scales with the affected part of the circuit. Returns (internal, info) like integrate_circuit
+    with full_output=True, or None if the splines are not accurate to REINTEGRATION_TOLERANCE
+    (estimated from their difference to plain cubic splines between the output points).
+    """
+    t = np.asarray(t, dtype=float)
+    members = np.flatnonzero(affected)
+    internal = np.array(previous, dtype=float)
+    info = {"solver": method, "nfev": 0, "njev": 0, "reintegrated": len(members)}
+    if len(members) == 0:
+        return internal, info
+
+    own_inputs = {i: (func, args) for i, func, args in circuit.mInputs}
+    read = circuit.getJacobianSparsity()[members].indices
+    upstream = np.unique(read[~affected[read]])
+    coefficients = None
+    if len(upstream):
+        # Upstream proteins only read upstream proteins, so their stored trajectories give their exact rates
+        values = internal[:, upstream]
+        slopes = circuit.calcRates(internal, t)[:, upstream]
+        spline = scipy.interpolate.CubicHermiteSpline(t, values, slopes)
+        midpoints = 0.5 * (t[1:] + t[:-1])
+        error = np.abs(spline(midpoints) - scipy.interpolate.CubicSpline(t, values)(midpoints)).max()
+        if error > REINTEGRATION_TOLERANCE * max(np.abs(values).max(), np.finfo(float).tiny):
+            return None
+        coefficients = spline.c
+    upstream_inputs = {
+        i: (_component_output, (t, coefficients[:, :, j]) + own_inputs.get(i, (None, ())))
+        for j, i in enumerate(upstream)
+    }
+
+    sub, _ = component_circuit(circuit, members, upstream_inputs)
+    integrate = integrate_components if decompose else integrate_circuit
+    sub_internal, sub_info = integrate(
+        sub, t, method=method, jacobian=jacobian, rtol=rtol, atol=atol, max_step=max_step,
+        full_output=True, breakpoints=breakpoints
+    )
+    internal[:, members] = sub_internal[:, :len(members)]
+    info.update(sub_info, reintegrated=len(members))
+    return internal, info
+
+def _component_output(t, knots, coefficients, func, args):
+    """
+    Total concentration of an upstream protein: its internal trajectory, evaluated from the
+    piecewise cubic coefficients of a spline through it, plus its own input.
+    """
+    k = np.clip(np.searchsorted(knots, t, side="right") - 1, 0, len(knots) - 2)
+    dt = t - knots[k]
+    total = ((coefficients[0, k] * dt + coefficients[1, k]) * dt + coefficients[2, k]) * dt + coefficients[3, k]
+    # The cubic can overshoot below zero next to fast transients, where Hill terms are undefined
+    total = np.maximum(total, 0.0)
+    return total if func is None else total + func(t, *args)
+
+def _decay_output(t, t_0, init, degradation, func, args):
+    """Total concentration of a protein that is not regulated: exponential decay plus its own input."""
+    total = init * np.exp(-degradation * (np.asarray(t) - t_0))
+    return total if func is None else total + func(t, *args)
+
+def _integrate_segment(circuit, y0, t, method, jacobian, rtol, atol, max_step, ext):
+    """Integrate one segment over the time points t. Returns (y, nfev, njev)."""
+    # Block-diagonal systems (ensembles) use LSODA's banded solver instead of a dense N x N matrix
+    band = circuit.getBandwidth()
+    dense_jacobian = circuit.calcJacobian if band is None else circuit.calcBandedJacobian
+
+    if method == "odeint":
+        banded = {} if band is None else {"ml": band[0], "mu": band[1]}
+        y, infodict = scipy.integrate.odeint(
+            circuit.calcRates, y0, t, args=(ext,), Dfun=dense_jacobian if jacobian else None, rtol=rtol, atol=atol,
+            hmax=0.0 if max_step is None else max_step, full_output=True, **banded
+        )
+        info = _odeint_info(infodict)
+        return y, info["nfev"], info["njev"]
+
+    options = {}
+    if method in SPARSE_JACOBIAN_METHODS:
+        if jacobian:
+            options["jac"] = lambda time, y: circuit.calcSparseJacobian(y, time, ext)
+        else:
+            options["jac_sparsity"] = circuit.getJacobianSparsity()
+    elif method == "LSODA":
+        if band is not None:
+            options["lband"], options["uband"] = band
+        if jacobian:
+            options["jac"] = lambda time, y: dense_jacobian(y, time, ext)
+    if rtol is not None:
+        options["rtol"] = rtol
+    if atol is not None:
+        options["atol"] = atol
+    if max_step is not None:
+        options["max_step"] = max_step
+
+    sol = scipy.integrate.solve_ivp(
+        lambda time, y: circuit.calcRates(y, time, ext),
+        (t[0], t[-1]),
+        y0,
+        method=method,
+        t_eval=t,
+        **options,
+    )
+    if not sol.success:
+        raise RuntimeError(f"{method} integration failed: {sol.message}")
+    return sol.y.T, int(sol.nfev), int(sol.njev)
+
+def run_ensemble(t, circuit, parameters, values, solver="odeint", jacobian=True, rtol=None, atol=None,
+                 max_step=None, full_output=False, split_at_pulses=True):
+    """
+    Simulate many parameter sets of one circuit in a single integration.
+
+    circuit is a protein array from parse_circuit or an already compiled CompiledCircuit.
+    parameters names the columns of the (M, P) matrix values as (target, parameter) pairs, e.g.
+    ("Protein A", "beta"), ("Protein A", "lossRate"), ("Protein A", "initialConcentration") or
+    ("Protein A-Protein B", "hill"); each row is one ensemble member. All members are stacked into
+    one block-diagonal system (see compiler.make_ensemble) so the solver runs once for the whole
+    ensemble. The solver options match run_simulation.
+
+    LSODA (odeint) controls the error of every component, but the other solve_ivp methods use an
+    RMS norm over the whole state, which would let individual members drift by up to sqrt(M) times
+    the tolerance. Their tolerances are therefore divided by sqrt(M).
+
+    Returns concentrations with shape (M, len(t), N), plus the solver info dict when full_output=True.
+    """
+    if not isinstance(circuit, CompiledCircuit):
+        circuit = compile_circuit(circuit)
+    ensemble = make_ensemble(circuit, parameters, values)
+    if solver in RMS_NORM_METHODS:
+        scale = np.sqrt(ensemble.getNumMembers())
+        rtol = (1e-3 if rtol is None else rtol) / scale
+        atol = (1e-6 if atol is None else atol) / scale
+
+    breakpoints = input_breakpoints(circuit, t[0], t[-1]) if split_at_pulses else None
+    internal, info = integrate_circuit(
+        ensemble, t, method=solver, jacobian=jacobian, rtol=rtol, atol=atol, max_step=max_step,
+        full_output=True, breakpoints=breakpoints
+    )
+    num_proteins = circuit.getNumProteins()
+    internal = internal.reshape(len(t), ensemble.getNumMembers(), num_proteins).transpose(1, 0, 2)
+    concentrations = internal + circuit.getExternalConcentrations(t)
+    return (concentrations, info) if full_output else concentrations
+
+def find_steady_state(circuit, t=0.0, initial=None, tol=1e-8, max_bursts=10, burst_duration=10.0,
+                      solver="odeint", rtol=None, atol=None, max_step=None):
+    """
+    Find a fixed point of the circuit directly instead of integrating to a long final time.
+
+    circuit is a protein array from parse_circuit or a CompiledCircuit. The external inputs are
+    frozen at their value at time t, and a damped Newton iteration using the analytical Jacobian is
+    started from initial, by default the initial concentrations. If it fails to reach a non-negative
+    point with max |rate| <= tol, the circuit is integrated for burst_duration with the given
+    solver options and Newton is retried from there. Each burst is twice as long as the
+    previous one, up to max_bursts bursts.
+
+    Newton converges to the nearest root, which can be a saddle the trajectory moves away from
+    (e.g. the symmetric state of a toggle switch). An unstable root is therefore only accepted once
+    Newton finds it again after a burst.
+
+    Returns a dict with the fixed point "concentrations" (internal + external, shape (N,)),
+    "converged", the Jacobian "eigenvalues" at that point (only the NUM_RIGHTMOST_EIGENVALUES with
+    the largest real part above DENSE_JACOBIAN_LIMIT proteins), "stable" (all real parts negative),
+    the final "residual" max |rate| and the number of integration "bursts" used.
+    """
+    if solver != "odeint" and solver not in IVP_METHODS:
+        raise ValueError(f"Unknown solver '{solver}', expected one of {SOLVERS}")
+    if not isinstance(circuit, CompiledCircuit):
+        circuit = compile_circuit(circuit)
+    ext = circuit.getExternalConcentrations(t)
+    y = circuit.getInitialConcentrations() if initial is None else np.asarray(initial, dtype=float)
+
+    bursts = 0
+    unstable_root = None
+    while True:
+        x, converged = _newton_steady_state(circuit, y, t, ext, tol)
+        if converged:
+            eigenvalues = _jacobian_eigenvalues(circuit, x, t, ext)
+            if (np.all(eigenvalues.real < 0) or bursts == max_bursts
+                    or (unstable_root is not None and np.allclose(x, unstable_root, rtol=1e-6, atol=1e-6))):
+                break
+            unstable_root = x
+        elif bursts == max_bursts:
+            # Report the end of the last burst rather than wherever Newton diverged to
+            x = y
+            eigenvalues = _jacobian_eigenvalues(circuit, x, t, ext)
+            break
+        duration = burst_duration * 2 ** bursts
+        y = _integrate_segment(circuit, y, np.array([0.0, duration]), solver, True, rtol, atol, max_step, ext)[0][-1]
+        bursts += 1
+
+    return {
+        "concentrations": x + ext,
+        "converged": converged,
+        "eigenvalues": eigenvalues,
+        "stable": bool(np.all(eigenvalues.real < 0)),
+        "residual": float(np.max(np.abs(circuit.calcRates(x, t, ext)), initial=0.0)),
+        "bursts": bursts,
+    }
+
+def _jacobian_eigenvalues(circuit, x, t, ext):
+    if circuit.getNumProteins() > DENSE_JACOBIAN_LIMIT:
+        try:
+            return scipy.sparse.linalg.eigs(circuit.calcSparseJacobian(x, t, ext), k=NUM_RIGHTMOST_EIGENVALUES,
+                                            which="LR", return_eigenvectors=False)
+        except scipy.sparse.linalg.ArpackNoConvergence:
+            pass
+    return np.linalg.eigvals(circuit.calcJacobian(x, t, ext))
+
+def _newton_steady_state(circuit, y0, t, ext, tol, max_iter=20):
+    """
+    Damped Newton iteration from y0 using the analytical Jacobian.
+    Returns (internal concentrations, converged).
+    """
+    x = np.array(y0, dtype=float)
+    dense = circuit.getNumProteins() <= DENSE_JACOBIAN_LIMIT
+    with np.errstate(all="ignore"):
+        rates = circuit.calcRates(x, t, ext)
+        for _ in range(max_iter):
+            if np.max(np.abs(rates), initial=0.0) <= tol:
+                return x, True
+            try:
+                if dense:
+                    step = np.linalg.solve(circuit.calcJacobian(x, t, ext), -rates)
+                else:
+                    step = scipy.sparse.linalg.splu(circuit.calcSparseJacobian(x, t, ext).tocsc()).solve(-rates)
+            except (np.linalg.LinAlgError, RuntimeError):
+                # Singular Jacobian
+                return x, False
+            # Halve the step until the residual drops; Hill terms are undefined below zero concentration
+            norm = np.linalg.norm(rates)
+            alpha = 1.0
+            while alpha >= 1e-4:
+                candidate = x + alpha * step
+                if np.all(candidate + ext >= 0):
+                    candidate_rates = circuit.calcRates(candidate, t, ext)
+                    if np.all(np.isfinite(candidate_rates)) and np.linalg.norm(candidate_rates) < (1 - 1e-4 * alpha) * norm:
+                        break
+                alpha /= 2
+            else:
+                return x, False
+            x, rates = candidate, candidate_rates
+    return x, bool(np.max(np.abs(rates), initial=0.0) <= tol)
+
+def input_breakpoints(circuit, t_start, t_end, max_edges=MAX_PULSE_BREAKPOINTS):
+    """
+    Sorted times in (t_start, t_end) where any x_pulse input of the circuit switches on or off,
+    leaving out pulses with more than max_edges edges (see pulse_breakpoints).
+    """
+    edges = [
+        pulse_breakpoints(t_start, t_end, *args, max_edges=max_edges)
+        for _, func, args in circuit.mInputs
+        if func is x_pulse
+    ]
+    if not edges:
+        return np.empty(0)
+    edges = np.unique(np.concatenate(edges))
+    # Edges of different pulses that only differ by rounding would leave a segment too short to integrate
+    keep = np.ones(len(edges), dtype=bool)
+    keep[1:] = np.diff(edges) > 1e-9 * np.maximum(1.0, np.abs(edges[1:]))
+    return edges[keep]
+
+def inputs_frozen_between_edges(circuit, t_start, t_end):
+    """
+    Whether every input of the circuit is piecewise constant and input_breakpoints lists all its
+    edges in (t_start, t_end), so the inputs can be held at their value inside each segment between
+    breakpoints. A pulse with more than MAX_PULSE_BREAKPOINTS edges is left out of the breakpoints
+    and has to be evaluated while integrating.
+    """
+    for _, func, args in circuit.mInputs:
+        if func not in PIECEWISE_CONSTANT_INPUTS:
+            return False
+        if func is x_pulse and 2 * _pulse_periods(t_end, *args) > MAX_PULSE_BREAKPOINTS:
+            return False
+    return True
+
+def segment_edges(t, breakpoints):
+    """
+    Sorted breakpoints strictly inside the output times t, moved onto the output times they only
+    miss by rounding: a segment a few ulps long makes odeint fail.
+    """
+    edges = np.unique(np.asarray(breakpoints, dtype=float))
+    edges = edges[(edges > t[0]) & (edges < t[-1])]
+    if len(edges):
+        k = np.clip(np.searchsorted(t, edges), 1, len(t) - 1)
+        nearest = np.where(np.abs(t[k] - edges) < np.abs(t[k - 1] - edges), t[k], t[k - 1])
+        close = np.abs(nearest - edges) <= 1e-9 * np.maximum(1.0, np.abs(edges))
+        edges = np.unique(np.where(close, nearest, edges))
+        edges = edges[(edges > t[0]) & (edges < t[-1])]
+    return edges
+
+def pulse_breakpoints(t_start, t_end, t_0, t_f, tau, x_0, duty_cycle, max_edges=MAX_PULSE_BREAKPOINTS):
+    """
+    Times in (t_start, t_end) where x_pulse(t, t_0, t_f, tau, x_0, duty_cycle) can jump:
+    the start of every period, the end of every on-phase, and t_f.
+    Returns an empty array if there are more than max_edges of them; restarting the solver that
+    often costs more than letting it resolve the edges itself. max_edges=None lists them all.
+    """
+    num_periods = _pulse_periods(t_end, t_0, t_f, tau, x_0, duty_cycle)
+    if num_periods == 0 or (max_edges is not None and 2 * num_periods > max_edges):
+        return np.empty(0)
+    if duty_cycle >= 1:
+        # Always on between t_0 and t_f
+        edges = np.array([t_0, t_f])
+    else:
+        starts = t_0 + tau * np.arange(num_periods)
+        edges = np.concatenate((starts, starts + tau * duty_cycle, [t_f]))
+    return np.unique(edges[(edges > t_start) & (edges < t_end) & (edges <= t_f)])
+
+def _pulse_periods(t_end, t_0, t_f, tau, x_0, duty_cycle):
+    """Number of periods of an x_pulse input that start before min(t_end, t_f), or 0 if it never switches."""
+    stop = min(t_end, t_f)
+    if x_0 == 0 or tau <= 0 or t_0 >= stop:
+        return 0
+    return int(np.ceil((stop - t_0) / tau)) + 1
 
-def steady_state(t, val):
-    return val
\ No newline at end of file
+def _odeint_info(infodict):
+    # odeint reports cumulative counts per output time; the last entry is the total
+    return {
+        "solver": "odeint",
+        "nfev": int(infodict["nfe"][-1]) if len(infodict["nfe"]) else 0,
+        "njev": int(infodict["nje"][-1]) if len(infodict["nje"]) else 0,
+    }
@@ -5,6 +5,8 @@ import * as path from "node:path";
 type Pending = {
   resolve: (value: any) => void;
   reject: (reason: any) => void;
+  // Receives intermediate frames (partial: true) of streaming commands such as run_sweep
+  onPartial?: (value: any) => void;
 };
 
 export type PythonClientOptions = {
@@ -62,9 +64,13 @@ export class PythonIpcClient {
           const requestId = message?.requestId;
 
           if (requestId && this.pending.has(requestId)) {
-            const { resolve } = this.pending.get(requestId)!;
-            this.pending.delete(requestId);
-            resolve(message);
+            const { resolve, onPartial } = this.pending.get(requestId)!;
+            if (message.partial === true) {
+              onPartial?.(message);
+            } else {
+              this.pending.delete(requestId);
+              resolve(message);
+            }
           }
         } catch {
           // keep behavior: ignore malformed frames (no debug logging)
@@ -78,7 +84,11 @@ export class PythonIpcClient {
     }
   }
 
-  async request<TResponse>(message: any, timeoutMs: number): Promise<TResponse> {
+  async request<TResponse>(
+    message: any,
+    timeoutMs: number,
+    onPartial?: (value: any) => void
+  ): Promise<TResponse> {
     const requestId = Date.now().toString() + Math.random().toString(36).substring(2, 5);
     message.requestId = requestId;
 
@@ -103,6 +113,7 @@ export class PythonIpcClient {
           clearTimeout(t);
           reject(err);
         },
+        onPartial,
       });
 
       this.proc.stdin.write(lenBuf);
@@ -115,6 +126,14 @@ export class PythonIpcClient {
     return resp;
   }
 
+  async cacheStats(timeoutMs: number, clear = false) {
+    const resp = await this.request<any>(
+      { command: "cache_stats", data: { clear } },
+      timeoutMs
+    );
+    return resp;
+  }
+
   async runSimulation(circuitData: unknown, timeoutMs: number) {
     const resp = await this.request<any>(
       { command: "run_simulation", data: circuitData },
@@ -122,6 +141,76 @@ export class PythonIpcClient {
     );
     return resp;
   }
+
+  async extendSimulation(circuitData: unknown, timeoutMs: number) {
+    const resp = await this.request<any>(
+      { command: "extend_simulation", data: circuitData },
+      timeoutMs
+    );
+    return resp;
+  }
+
+  async simulateWindow(circuitData: unknown, timeoutMs: number) {
+    const resp = await this.request<any>(
+      { command: "simulate_window", data: circuitData },
+      timeoutMs
+    );
+    return resp;
+  }
+
+  async steadyState(circuitData: unknown, timeoutMs: number) {
+    const resp = await this.request<any>(
+      { command: "steady_state", data: circuitData },
+      timeoutMs
+    );
+    return resp;
+  }
+
+  async runStochastic(circuitData: unknown, timeoutMs: number) {
+    const resp = await this.request<any>(
+      { command: "run_stochastic", data: circuitData },
+      timeoutMs
+    );
+    return resp;
+  }
+
+  async runSensitivity(circuitData: unknown, timeoutMs: number) {
+    const resp = await this.request<any>(
+      { command: "run_sensitivity", data: circuitData },
+      timeoutMs
+    );
+    return resp;
+  }
+
+  async fitParameters(circuitData: unknown, timeoutMs: number) {
+    const resp = await this.request<any>(
+      { command: "fit_parameters", data: circuitData },
+      timeoutMs
+    );
+    return resp;
+  }
+
+  async runSweep(circuitData: unknown, onChunk: (chunk: any) => void, timeoutMs: number) {
+    const resp = await this.request<any>(
+      { command: "run_sweep", data: circuitData },
+      timeoutMs,
+      (message) => onChunk(message.chunk)
+    );
+    return resp;
+  }
+
+  async globalSensitivity(
+    circuitData: unknown,
+    onProgress: (progress: { done: number; total: number }) => void,
+    timeoutMs: number
+  ) {
+    const resp = await this.request<any>(
+      { command: "global_sensitivity", data: circuitData },
+      timeoutMs,
+      (message) => onProgress(message.progress)
+    );
+    return resp;
+  }
 }
 
 /**
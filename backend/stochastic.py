@@ -0,0 +1,184 @@
+import numpy as np
+
+from .compiler import CompiledCircuit, compile_circuit, make_ensemble
+from .simulate import input_breakpoints
+
+STOCHASTIC_METHODS = ("ssa", "tau_leaping", "langevin")
+
+
+def run_stochastic(t, circuit, num_trajectories=1000, method="ssa", seed=None, volume=1.0, tau=None,
+                   num_raw=0):
+    """
+    Simulate many stochastic trajectories of the circuit at once.
+
+    Every protein has two reactions with the same propensities as the deterministic model:
+    production at volume * beta * (sum of its gates) and degradation at lossRate * copy number.
+    Gates read the concentration copy number / volume plus the external input, so volume sets how
+    many molecules one concentration unit stands for; the initial copy numbers are the initial
+    concentrations times volume, rounded for the discrete methods.
+
+    method is one of
+      "ssa": Gillespie's direct method, exact;
+      "tau_leaping": Poisson updates with a fixed step of at most tau;
+      "langevin": the chemical Langevin equation, integrated with Euler-Maruyama steps of at most
+        tau on continuous copy numbers. Its cost does not grow with the copy numbers, so it suits
+        large volumes where the noise is small but SSA takes too many events.
+    tau defaults to the output spacing capped at 0.1 / max lossRate. All trajectories advance
+    together in one (num_trajectories, N) state array. SSA stops at every edge of every pulse
+    input, however many there are, which keeps it exact for pulse and steady-state inputs. It also
+    stops at every output time, so other inputs (tables) are held for at most one output interval.
+
+    Returns a dict with the per-time-point "mean" and "variance" of the concentrations across
+    trajectories (each (len(t), N)), the first num_raw "trajectories" ((num_raw, len(t), N)), and
+    the number of vectorized "steps" taken. Results are reproducible for a given seed.
+    """
+    if method not in STOCHASTIC_METHODS:
+        raise ValueError(f"Unknown stochastic method '{method}', expected one of {list(STOCHASTIC_METHODS)}")
+    if volume <= 0:
+        raise ValueError(f"volume must be positive, got {volume}")
+    if not isinstance(circuit, CompiledCircuit):
+        circuit = compile_circuit(circuit)
+    t = np.asarray(t, dtype=float)
+    num_trajectories = int(num_trajectories)
+    num_raw = min(int(num_raw), num_trajectories)
+
+    # Identical copies of the circuit, one per trajectory, so one call evaluates every gate of every trajectory
+    ensemble = make_ensemble(circuit, [], np.empty((num_trajectories, 0)))
+    counts = np.tile(circuit.mInitConc, (num_trajectories, 1)) * volume
+    if method != "langevin":
+        counts = np.rint(counts).astype(np.int64)
+    rng = np.random.default_rng(seed)
+
+    if method == "ssa":
+        sums, squares, raw, steps = _ssa(circuit, ensemble, t, counts, rng, volume, num_raw)
+    else:
+        leap = _tau_leap if method == "tau_leaping" else _langevin_step
+        sums, squares, raw, steps = _fixed_step(circuit, ensemble, t, counts, rng, volume, tau, num_raw, leap)
+
+    ext = circuit.getExternalConcentrations(t)
+    mean = sums / num_trajectories
+    return {
+        "mean": mean / volume + ext,
+        "variance": np.maximum(squares / num_trajectories - mean ** 2, 0.0) / volume ** 2,
+        "trajectories": raw / volume + ext,
+        "steps": steps,
+    }
+
+
+def _propensities(circuit, ensemble, counts, ext, volume):
+    """Production and degradation propensities, each (M, N), for copy numbers counts and inputs ext."""
+    shape = counts.shape
+    conc = counts / volume + ext
+    production = volume * circuit.mBeta * ensemble.calcProdRates(conc.ravel()).reshape(shape)
+    return production, circuit.mDegradation * counts
+
+
+def _ssa(circuit, ensemble, t, counts, rng, volume, num_raw):
+    num_trajectories, n = counts.shape
+    num_times = len(t)
+    sums = np.zeros((num_times, n))
+    squares = np.zeros((num_times, n))
+    raw = np.zeros((num_raw, num_times, n))
+
+    time = np.full(num_trajectories, t[0])
+    # Index of the next output time point of every trajectory
+    next_out = np.zeros(num_trajectories, dtype=np.intp)
+    switches = np.append(input_breakpoints(circuit, t[0], t[-1], max_edges=None), np.inf)
+    outputs = np.append(t, np.inf)
+    steps = 0
+
+    active = next_out < num_times
+    while active.any():
+        steps += 1
+        # The inputs are constant up to the next switch; reading them halfway there keeps an edge
+        # that rounding puts a few ulps off from taking the value of the wrong side
+        switch = switches[np.minimum(np.searchsorted(switches, time, side="right"), len(switches) - 1)]
+        ext = circuit.getExternalConcentrations(np.where(np.isfinite(switch), 0.5 * (time + switch), time))
+        production, degradation = _propensities(circuit, ensemble, counts, ext, volume)
+        propensities = np.concatenate((production, degradation), axis=1)
+        total = propensities.sum(axis=1)
+        with np.errstate(divide="ignore"):
+            new_time = time + rng.exponential(size=num_trajectories) / total
+
+        # Propensities change when an input switches; by memorylessness the waiting time can be
+        # redrawn there. Stopping at output times too also bounds the wait where every propensity is 0.
+        stop = np.minimum(switch, outputs[np.minimum(np.searchsorted(outputs, time, side="right"), num_times)])
+        fire = active & (new_time <= stop)
+        new_time = np.minimum(new_time, stop)
+
+        # The current state holds on [time, new_time)
+        while True:
+            record = active & (t[np.minimum(next_out, num_times - 1)] < new_time)
+            record &= next_out < num_times
+            if not record.any():
+                break
+            rows = np.flatnonzero(record)
+            np.add.at(sums, next_out[rows], counts[rows])
+            np.add.at(squares, next_out[rows], counts[rows] ** 2)
+            kept = rows[rows < num_raw]
+            raw[kept, next_out[kept]] = counts[kept]
+            next_out[rows] += 1
+
+        fire &= next_out < num_times
+        rows = np.flatnonzero(fire)
+        if len(rows):
+            cumulative = np.cumsum(propensities[rows], axis=1)
+            target = rng.random(len(rows)) * total[rows]
+            reaction = np.minimum((cumulative < target[:, np.newaxis]).sum(axis=1), 2 * n - 1)
+            counts[rows, reaction % n] += np.where(reaction < n, 1, -1)
+
+        time = new_time
+        active = next_out < num_times
+
+    return sums, squares, raw, steps
+
+
+def _fixed_step(circuit, ensemble, t, counts, rng, volume, tau, num_raw, leap):
+    """
+    Advance all trajectories with steps of at most tau and accumulate the statistics at every
+    output time. leap(counts, production, degradation, h, rng) updates counts in place.
+    """
+    num_times = len(t)
+    n = counts.shape[1]
+    sums = np.zeros((num_times, n))
+    squares = np.zeros((num_times, n))
+    raw = np.zeros((num_raw, num_times, n))
+
+    if tau is None:
+        tau = np.diff(t).max() if num_times > 1 else 1.0
+        if np.any(circuit.mDegradation > 0):
+            tau = min(tau, 0.1 / circuit.mDegradation.max())
+    if tau <= 0:
+        raise ValueError(f"tau must be positive, got {tau}")
+    steps = 0
+
+    for k in range(num_times):
+        if k > 0:
+            # Split the output interval into equal steps of at most tau
+            num_leaps = max(1, int(np.ceil((t[k] - t[k - 1]) / tau)))
+            h = (t[k] - t[k - 1]) / num_leaps
+            for step in range(num_leaps):
+                ext = circuit.getExternalConcentrations(t[k - 1] + (step + 0.5) * h)
+                production, degradation = _propensities(circuit, ensemble, counts, ext, volume)
+                leap(counts, production, degradation, h, rng)
+                steps += 1
+        sums[k] = counts.sum(axis=0)
+        squares[k] = (counts.astype(float) ** 2).sum(axis=0)
+        raw[:, k] = counts[:num_raw]
+
+    return sums, squares, raw, steps
+
+
+def _tau_leap(counts, production, degradation, h, rng):
+    births = rng.poisson(production * h)
+    deaths = np.minimum(rng.poisson(degradation * h), counts)
+    counts += births - deaths
+
+
+def _langevin_step(counts, production, degradation, h, rng):
+    # Euler-Maruyama step of dn = (a+ - a-) dt + sqrt(a+ + a-) dW, reflected at zero
+    noise = rng.standard_normal(counts.shape)
+    noise *= np.sqrt((production + degradation) * h)
+    counts += (production - degradation) * h
+    counts += noise
+    np.abs(counts, out=counts)
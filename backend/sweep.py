@@ -0,0 +1,168 @@
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import product
+
+import numpy as np
+import scipy.stats.qmc
+
+from .compiler import compile_circuit, parameter_slots
+from .parser import parse_circuit
+from .simulate import run_ensemble
+
+SWEEP_MODES = ("grid", "latin_hypercube")
+
+# What each sweep point reports: the whole trajectory or only the concentrations at the last time point
+SWEEP_OUTPUTS = ("final", "trajectory")
+
+# Chunks queued per worker; later chunks are submitted as earlier ones finish, so memory stays flat
+CHUNKS_IN_FLIGHT = 2
+
+# Compiled circuit owned by each worker process, set once by _init_worker
+_worker_circuit = None
+
+
+def axis_values(axis):
+    """Grid values for one sweep axis: an explicit "values" list, or "num" points from "min" to "max"."""
+    if "values" in axis:
+        values = np.asarray(axis["values"], dtype=float)
+    elif {"min", "max"} <= axis.keys():
+        values = np.linspace(float(axis["min"]), float(axis["max"]), int(axis.get("num", 10)))
+    else:
+        raise ValueError(f"Sweep axis for {axis.get('target')}/{axis.get('parameter')} needs 'values' or 'min'/'max'")
+    if values.ndim != 1 or len(values) == 0:
+        raise ValueError(f"Sweep axis for {axis.get('target')}/{axis.get('parameter')} has no values")
+    return values
+
+
+def grid_samples(axes):
+    """Full factorial grid over the axes. Returns an (M, P) array, last axis varying fastest."""
+    return np.array(list(product(*(axis_values(axis) for axis in axes))), dtype=float).reshape(-1, len(axes))
+
+
+def latin_hypercube_samples(axes, num_samples, seed=None):
+    """num_samples Latin hypercube points between each axis' min and max (or the range of its values)."""
+    lower, upper = [], []
+    for axis in axes:
+        if {"min", "max"} <= axis.keys():
+            lower.append(float(axis["min"]))
+            upper.append(float(axis["max"]))
+        else:
+            values = axis_values(axis)
+            lower.append(values.min())
+            upper.append(values.max())
+    unit = scipy.stats.qmc.LatinHypercube(d=len(axes), seed=seed).random(int(num_samples))
+    return np.asarray(lower) + unit * (np.asarray(upper) - np.asarray(lower))
+
+
+def sweep_points(sweep):
+    """
+    Expand a sweep specification into (parameters, values).
+
+    sweep["axes"] is a list of {"target", "parameter", ...} dicts (see axis_values); parameter is
+    beta, lossRate, initialConcentration or hill, as accepted by simulate.run_ensemble.
+    sweep["mode"] is "grid" (default) or "latin_hypercube", which also reads "samples" and "seed".
+    """
+    axes = sweep.get("axes") or []
+    if not axes:
+        raise ValueError("Sweep needs at least one axis")
+    mode = sweep.get("mode", "grid")
+    if mode not in SWEEP_MODES:
+        raise ValueError(f"Unknown sweep mode '{mode}', expected one of {list(SWEEP_MODES)}")
+
+    parameters = [(axis["target"], axis["parameter"]) for axis in axes]
+    if mode == "grid":
+        values = grid_samples(axes)
+    else:
+        values = latin_hypercube_samples(axes, sweep.get("samples", 100), sweep.get("seed"))
+    return parameters, values
+
+
+def default_workers():
+    """Number of cores this process may run on."""
+    try:
+        return max(1, len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return max(1, os.cpu_count() or 1)
+
+
+def redirect_stdout():
+    """Send a worker process's stdout to stderr: the parser prints to stdout, which is the IPC channel of the parent."""
+    try:
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    except (AttributeError, OSError, ValueError):
+        pass
+    sys.stdout = sys.stderr
+
+
+def _init_worker(circuit_json):
+    global _worker_circuit
+    redirect_stdout()
+    _worker_circuit = compile_circuit(parse_circuit(circuit_json))
+
+
+def _run_chunk(t, parameters, values, output, solver_options):
+    concentrations, info = run_ensemble(t, _worker_circuit, parameters, values, full_output=True, **solver_options)
+    if callable(output):
+        concentrations = output(t, concentrations)
+    elif output == "final":
+        concentrations = concentrations[:, -1, :]
+    return concentrations, info
+
+
+def run_sweep(circuit_json, parameters, values, t, chunk_size=64, workers=None, output="final", **solver_options):
+    """
+    Simulate circuit_json at every row of values across a process pool, yielding results as they finish.
+
+    Each worker parses and compiles the circuit once and then integrates chunks of chunk_size points as
+    one ensemble (see simulate.run_ensemble). Yields dicts with the "proteinNames", the row "indices"
+    of the chunk, the "values" of its parameters, the "concentrations" (chunk, N) for output="final"
+    or (chunk, len(t), N) for output="trajectory", and the solver "info". output may also be a
+    picklable callable reduce(t, concentrations) that the worker applies to the (chunk, len(t), N)
+    trajectories, so only its result travels back. Chunks arrive in completion order, and only
+    CHUNKS_IN_FLIGHT per worker are queued at a time.
+    """
+    if not callable(output) and output not in SWEEP_OUTPUTS:
+        raise ValueError(f"Unknown sweep output '{output}', expected one of {list(SWEEP_OUTPUTS)}")
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    chunk_size = max(1, int(chunk_size))
+
+    # Fail on bad parameter names here rather than inside every worker
+    circuit = compile_circuit(parse_circuit(circuit_json))
+    for target, parameter in parameters:
+        parameter_slots(circuit, target, parameter)
+
+    starts = range(0, len(values), chunk_size)
+    workers = min(workers or default_workers(), len(starts))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(circuit_json,)) as pool:
+        queue = iter(starts)
+        pending = {}
+
+        def submit():
+            start = next(queue, None)
+            if start is not None:
+                future = pool.submit(_run_chunk, t, parameters, values[start:start + chunk_size], output, solver_options)
+                pending[future] = start
+
+        for _ in range(CHUNKS_IN_FLIGHT * workers):
+            submit()
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start = pending.pop(future)
+                    concentrations, info = future.result()
+                    submit()
+                    stop = start + len(concentrations)
+                    yield {
+                        "proteinNames": circuit.getNames(),
+                        "indices": np.arange(start, stop),
+                        "values": values[start:stop],
+                        "concentrations": concentrations,
+                        "info": info,
+                    }
+        except BaseException:
+            # Error in a worker or the consumer stopped early: drop the chunks that have not started
+            for future in pending:
+                future.cancel()
+            raise
@@ -0,0 +1,13 @@
+import pytest
+
+from backend import ipc_server
+from backend.result_cache import CACHE_DIR_VARIABLE
+
+
+@pytest.fixture(autouse=True)
+def isolated_result_cache(monkeypatch, tmp_path):
+    # Keep every test off the per-user result cache: no test may be served a result of an earlier
+    # run, nor leave entries behind in the developer's cache directory. test_ipc_server.py imports
+    # its own copy of the module as ipc_server and redirects that one itself
+    monkeypatch.setenv(CACHE_DIR_VARIABLE, str(tmp_path / "results"))
+    monkeypatch.setattr(ipc_server, '_results', ipc_server.ResultCache(str(tmp_path / "results")))
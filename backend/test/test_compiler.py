@@ -0,0 +1,386 @@
+import numpy as np
+import pytest
+from backend import jit
+from backend.compiler import changed_proteins, compile_circuit, component_circuit, fold_constants, make_ensemble, parameter_slots, GateGroup, GATE_TYPES
+from backend.protein import Protein, Gate
+from backend.simulate import simulation_iter, x_pulse, steady_state
+from backend.test.test_gate import MockProtein
+
+
+def make_circuit():
+    """Small circuit that exercises single/double input gates, fan-out and external inputs."""
+    shared = Gate("aa_or", firstInput=0, secondInput=1, firstHill=2, secondHill=3)
+    return [
+        Protein(0, "A", 0.3, 0.5, [], x_pulse, (0, 10, 4, 1.5, 0.5)),
+        Protein(1, "B", 0.7, 1.0, [Gate("rep_hill", firstInput=3, firstHill=2)], steady_state, [0.2], beta=2),
+        Protein(2, "C", 0.1, 0.2, [shared, Gate("act_hill", firstInput=0, firstHill=3)], beta=3),
+        Protein(3, "D", 0.9, 0.4, [shared, Gate("ar_and", firstInput=2, secondInput=1, firstHill=2, secondHill=1)]),
+    ]
+
+
+class TestCompiler:
+    """Unit tests for compile_circuit and CompiledCircuit"""
+
+    def test_compile_groups_gates_by_type(self):
+        circuit = compile_circuit(make_circuit())
+        types = [group.mType for group in circuit.mGateGroups]
+        assert sorted(types) == sorted(["rep_hill", "act_hill", "aa_or", "ar_and"])
+
+        aa_or = next(g for g in circuit.mGateGroups if g.mType == "aa_or")
+        # Shared gate is expanded once per target protein
+        assert list(aa_or.mTargets) == [2, 3]
+        assert list(aa_or.mFirstInputs) == [0, 0]
+        assert list(aa_or.mSecondInputs) == [1, 1]
+
+    def test_compile_parameters(self):
+        circuit = compile_circuit(make_circuit())
+        assert circuit.getNames() == ["A", "B", "C", "D"]
+        assert np.allclose(circuit.getInitialConcentrations(), [0.3, 0.7, 0.1, 0.9])
+        assert np.allclose(circuit.mDegradation, [0.5, 1.0, 0.2, 0.4])
+        assert np.allclose(circuit.mBeta, [1, 2, 3, 1])
+
+    def test_external_concentrations(self):
+        circuit = compile_circuit(make_circuit())
+        t = np.linspace(0, 12, 25)
+        ext = circuit.getExternalConcentrations(t)
+        assert ext.shape == (25, 4)
+        assert np.allclose(ext[:, 0], x_pulse(t, 0, 10, 4, 1.5, 0.5))
+        assert np.allclose(ext[:, 1], 0.2)
+        assert np.allclose(ext[:, 2:], 0.0)
+
+    @pytest.mark.parametrize("t", [0.0, 1.3, 2.0, 5.5, 11.0])
+    def test_rates_match_object_path(self, t):
+        proteins = make_circuit()
+        circuit = compile_circuit(proteins)
+        x = np.array([0.4, 1.1, 0.6, 0.25])
+        expected = simulation_iter(x, t, proteins)
+        assert np.allclose(circuit.calcRates(x, t), expected)
+
+    @pytest.mark.parametrize("gate_type", GATE_TYPES)
+    def test_every_gate_type_matches_gate(self, gate_type):
+        gate = Gate(gate_type, firstInput=0, secondInput=1, firstHill=2, secondHill=3)
+        proteins = [
+            Protein(0, "X", 0.8, 1, []),
+            Protein(1, "Y", 0.6, 1, []),
+            Protein(2, "Z", 0.0, 1, [gate]),
+        ]
+        circuit = compile_circuit(proteins)
+        x = circuit.getInitialConcentrations()
+        for p in proteins:
+            p.setExternalConcentration(0)
+        assert circuit.calcProdRates(x)[2] == pytest.approx(gate.regFunc(proteins))
+
+    @pytest.mark.parametrize("gate_type", GATE_TYPES)
+    @pytest.mark.parametrize("hills", [(1, 1), (2, 3), (2.5, 4)])
+    def test_jacobian_matches_finite_differences(self, gate_type, hills):
+        gate = Gate(gate_type, firstInput=0, secondInput=1, firstHill=hills[0], secondHill=hills[1])
+        proteins = [
+            Protein(0, "X", 0.8, 0.5, [Gate("rep_hill", firstInput=2, firstHill=2)]),
+            Protein(1, "Y", 0.6, 1.0, [], steady_state, [0.3]),
+            Protein(2, "Z", 0.4, 0.7, [gate], beta=2),
+        ]
+        circuit = compile_circuit(proteins)
+        x = circuit.getInitialConcentrations()
+        jac = circuit.calcJacobian(x, 1.0)
+
+        h = 1e-7
+        numeric = np.zeros_like(jac)
+        for j in range(len(x)):
+            step = np.zeros_like(x)
+            step[j] = h
+            numeric[:, j] = (circuit.calcRates(x + step, 1.0) - circuit.calcRates(x - step, 1.0)) / (2 * h)
+        assert np.allclose(jac, numeric, atol=1e-6)
+
+    def test_jacobian_at_zero_concentration(self):
+        proteins = [
+            Protein(0, "X", 0.0, 1, []),
+            Protein(1, "Y", 0.0, 1, [Gate("act_hill", firstInput=0, firstHill=1)]),
+            Protein(2, "Z", 0.0, 1, [Gate("act_hill", firstInput=0, firstHill=3)]),
+        ]
+        jac = compile_circuit(proteins).calcJacobian(np.zeros(3), 0.0)
+        assert np.all(np.isfinite(jac))
+        assert jac[1, 0] == pytest.approx(1.0)
+        assert jac[2, 0] == pytest.approx(0.0)
+
+    @pytest.mark.parametrize("gate_type", GATE_TYPES)
+    def test_jacobian_of_saturated_inputs(self, gate_type):
+        # x**n overflows for X, so the derivatives must not be formed from the raw powers
+        gate = Gate(gate_type, firstInput=0, secondInput=1, firstHill=50, secondHill=50)
+        proteins = [
+            Protein(0, "X", 1e8, 1, []),
+            Protein(1, "Y", 0.9, 1, []),
+            Protein(2, "Z", 0.4, 0.7, [gate], beta=2),
+        ]
+        circuit = compile_circuit(proteins, use_jit=False)
+        x = circuit.getInitialConcentrations()
+        with np.errstate(over="raise", invalid="raise"):
+            jac = circuit.calcJacobian(x, 0.0)
+
+        numeric = np.zeros_like(jac)
+        for j in range(len(x)):
+            step = np.zeros_like(x)
+            step[j] = 1e-7 * max(1.0, x[j])
+            numeric[:, j] = (circuit.calcRates(x + step, 0.0) - circuit.calcRates(x - step, 0.0)) / (2 * step[j])
+        assert np.allclose(jac, numeric, atol=1e-6)
+
+    def test_sparse_jacobian_matches_dense(self):
+        circuit = compile_circuit(make_circuit())
+        x = np.array([0.4, 1.1, 0.6, 0.25])
+        for t in (0.5, 3.0, 11.0):
+            sparse = circuit.calcSparseJacobian(x, t)
+            assert sparse.format == "csr"
+            assert np.allclose(sparse.toarray(), circuit.calcJacobian(x, t))
+
+    def test_jacobian_sparsity(self):
+        circuit = compile_circuit(make_circuit())
+        pattern = circuit.getJacobianSparsity().toarray()
+        expected = np.eye(4, dtype=bool)
+        expected[1, 3] = True                # B <- rep_hill(D)
+        expected[2, [0, 1]] = True           # C <- aa_or(A, B), act_hill(A)
+        expected[3, [0, 1, 2]] = True        # D <- aa_or(A, B), ar_and(C, B)
+        assert np.array_equal(pattern, expected)
+
+    def test_parameter_slots(self):
+        circuit = compile_circuit(make_circuit())
+        assert parameter_slots(circuit, "C", "beta") == ("protein", 2)
+
+        kind, slots = parameter_slots(circuit, "A-D", "hill")
+        assert kind == "hill"
+        groups = {circuit.mGateGroups[g].mType: (which, list(entries)) for g, which, entries in slots}
+        assert groups == {"aa_or": ("first", [1])}
+
+        with pytest.raises(ValueError):
+            parameter_slots(circuit, "Q", "beta")
+        with pytest.raises(ValueError):
+            parameter_slots(circuit, "C", "kcat")
+        with pytest.raises(ValueError):
+            parameter_slots(circuit, "D-A", "hill")
+
+    def test_ensemble_members_match_modified_circuits(self):
+        base = make_circuit()
+        circuit = compile_circuit(base)
+        parameters = [("C", "beta"), ("D", "lossRate"), ("B", "initialConcentration"), ("C-D", "hill")]
+        values = np.array([[3.0, 0.4, 0.7, 1.0], [1.5, 2.0, 0.1, 3.5]])
+        ensemble = make_ensemble(circuit, parameters, values)
+        assert ensemble.getNumMembers() == 2
+        assert ensemble.getNumProteins() == 8
+
+        x = np.array([0.4, 1.1, 0.6, 0.25, 0.9, 0.2, 0.3, 1.4])
+        rates = ensemble.calcRates(x, 2.5)
+        for m, (beta_c, loss_d, _, hill_cd) in enumerate(values):
+            proteins = make_circuit()
+            proteins[2].mBeta = beta_c
+            proteins[3].mDegradation = loss_d
+            proteins[3].mGates[1] = Gate("ar_and", firstInput=2, secondInput=1, firstHill=hill_cd, secondHill=1)
+            member = compile_circuit(proteins)
+            assert np.allclose(rates[4 * m:4 * m + 4], member.calcRates(x[4 * m:4 * m + 4], 2.5))
+        assert np.allclose(ensemble.getInitialConcentrations()[[1, 5]], [0.7, 0.1])
+
+    def test_ensemble_banded_jacobian(self):
+        circuit = compile_circuit(make_circuit())
+        ensemble = make_ensemble(circuit, [("C", "beta")], [[1.0], [2.0], [3.0]])
+        lower, upper = ensemble.getBandwidth()
+        assert (lower, upper) == (3, 2)
+
+        x = np.linspace(0.1, 1.2, 12)
+        dense = ensemble.calcSparseJacobian(x, 1.0).toarray()
+        band = ensemble.calcBandedJacobian(x, 1.0)
+        for i, j in zip(*np.nonzero(dense)):
+            assert band[i - j + upper, j] == pytest.approx(dense[i, j])
+        # No coupling between members
+        assert not dense[:4, 4:].any() and not dense[4:, :4].any()
+
+    def test_components_in_topological_order(self):
+        # A <-> B feedback loop feeding C, which feeds the D <-> E loop; F is isolated
+        proteins = [
+            Protein(0, "A", 0, 1, [Gate("rep_hill", firstInput=1)]),
+            Protein(1, "B", 0, 1, [Gate("rep_hill", firstInput=0)]),
+            Protein(2, "C", 0, 1, [Gate("act_hill", firstInput=1)]),
+            Protein(3, "D", 0, 1, [Gate("ar_and", firstInput=2, secondInput=4)]),
+            Protein(4, "E", 0, 1, [Gate("act_hill", firstInput=3)]),
+            Protein(5, "F", 0, 1, []),
+        ]
+        components = [sorted(c.tolist()) for c in compile_circuit(proteins).getComponents()]
+        assert sorted(map(sorted, components)) == [[0, 1], [2], [3, 4], [5]]
+        position = {i: k for k, c in enumerate(components) for i in c}
+        assert position[0] < position[2] < position[3]
+
+    def test_component_circuit(self):
+        circuit = compile_circuit(make_circuit())
+        upstream_a = (steady_state, (0.5,))
+        upstream_b = (steady_state, (0.25,))
+        sub, upstream = component_circuit(circuit, [2, 3], {0: upstream_a, 1: upstream_b})
+        assert list(upstream) == [0, 1]
+        assert sub.getNames() == ["C", "D", "A", "B"]
+
+        # Only the members are states; they see the upstream proteins at the given total concentrations
+        assert sub.getNumStates() == 2
+        assert sub.getInitialConcentrations().tolist() == [0.1, 0.9]
+        x = np.array([0.6, 0.25])
+        full = np.array([0.5, 0.25, 0.6, 0.25])
+        ext = circuit.getExternalConcentrations(1.0)
+        expected = circuit.calcRates(full - ext, 1.0)[[2, 3]]
+        assert np.allclose(sub.calcRates(x, 1.0), expected)
+        assert np.allclose(sub.calcRates(np.stack([x, x]), np.array([1.0, 1.0])), expected)
+
+        # Jacobians only cover the states
+        expected_jac = circuit.calcJacobian(full - ext, 1.0)[np.ix_([2, 3], [2, 3])]
+        for use_jit in ([False, True] if jit.AVAILABLE else [False]):
+            sub, _ = component_circuit(compile_circuit(make_circuit(), use_jit=use_jit), [2, 3],
+                                       {0: upstream_a, 1: upstream_b})
+            assert np.allclose(sub.calcJacobian(x, 1.0), expected_jac)
+            assert np.allclose(sub.calcSparseJacobian(x, 1.0).toarray(), expected_jac)
+        assert sub.getJacobianSparsity().toarray().tolist() == [[True, False], [True, True]]
+
+    def test_fold_constants(self):
+        circuit = compile_circuit(make_circuit())
+        # A fixed at 0.5 and B at 0.25 turn aa_or(A, B) and act_hill(A) into constants
+        folded = fold_constants(circuit, {0: 0.5, 1: 0.25})
+        assert len(folded.mGateTable[0]) == 2
+        conc = np.array([0.5, 0.25, 0.6, 0.2])
+        assert np.allclose(folded.calcProdRates(conc), circuit.calcProdRates(conc))
+        assert folded.mConstProd[[0, 1]].tolist() == [0.0, 0.0]
+        assert folded.getHash() != circuit.getHash()
+        # With B unknown only act_hill(A) folds
+        assert fold_constants(circuit, {0: 0.5}).mGateTable[0].tolist() == [1, 5, 5, 10]
+        assert fold_constants(circuit, {2: 0.5}) is circuit
+
+        sub, _ = component_circuit(circuit, [2, 3], {0: (steady_state, (0.5,)), 1: (steady_state, (0.25,))},
+                                   constants={0: 0.5, 1: 0.25})
+        assert len(sub.mGateTable[0]) == 1
+        x = np.array([0.6, 0.2])
+        assert np.allclose(sub.calcRates(x, 1.0), circuit.calcRates(conc - circuit.getExternalConcentrations(1.0), 1.0)[[2, 3]])
+
+    def test_downstream(self):
+        circuit = compile_circuit(make_circuit())
+        # D reads C, B reads D: everything but the input A depends on C
+        assert circuit.getDownstream([2]).tolist() == [False, True, True, True]
+        assert circuit.getDownstream([0]).all()
+        assert not circuit.getDownstream([]).any()
+
+    def test_changed_proteins(self):
+        base = compile_circuit(make_circuit())
+        assert changed_proteins(base, compile_circuit(make_circuit())).tolist() == []
+
+        edited = make_circuit()
+        edited[2].mDegradation = 0.3
+        edited[1].mExtConcFuncArgs = [0.4]
+        # Same gates in another order are not a change
+        edited[3].mGates.reverse()
+        assert changed_proteins(base, compile_circuit(edited)).tolist() == [1, 2]
+
+        edited = make_circuit()
+        edited[3].mGates[1].mFirstHill = 3
+        edited[0].mGates.append(Gate("act_hill", firstInput=3))
+        assert changed_proteins(base, compile_circuit(edited)).tolist() == [0, 3]
+
+        renamed = make_circuit()
+        renamed[0].mName = "X"
+        with pytest.raises(ValueError):
+            changed_proteins(base, compile_circuit(renamed))
+
+    def test_hash(self):
+        circuit = compile_circuit(make_circuit())
+        assert circuit.getHash() == compile_circuit(make_circuit()).getHash()
+        edited = make_circuit()
+        edited[0].mExtConcFuncArgs = (0, 10, 4, 1.5, 0.6)
+        assert compile_circuit(edited).getHash() != circuit.getHash()
+        edited = make_circuit()
+        edited[3].mGates[1].mSecondHill = 2
+        assert compile_circuit(edited).getHash() != circuit.getHash()
+
+    def test_shared_gates_and_terms_are_evaluated_once(self):
+        proteins = make_circuit()
+        # A second copy of the shared aa_or gate and a rep_hill reading A with the same coefficient as C's act_hill
+        proteins[1].mGates.append(Gate("aa_or", firstInput=0, secondInput=1, firstHill=2, secondHill=3))
+        proteins[1].mGates.append(Gate("rep_hill", firstInput=0, firstHill=3, secondHill=7))
+        circuit = compile_circuit(proteins)
+        term_inputs, term_hills, codes, first_terms, second_terms, targets, gate_index = circuit.mTermTable
+        assert len(targets) == 7
+        # aa_or(A, B) serves B, C and D; act_hill(A) and rep_hill(A) share the term (A, 3)
+        assert len(codes) == 5
+        assert sorted(zip(term_inputs.tolist(), term_hills.tolist())) == [(0, 2.0), (0, 3.0), (1, 1.0), (1, 3.0), (2, 2.0), (3, 2.0)]
+
+        conc = np.array([0.4, 1.3, 0.8, 2.1])
+        expected = np.zeros(4)
+        for protein in proteins:
+            for gate in protein.mGates:
+                expected[protein.mID] += gate.regFunc([MockProtein(c) for c in conc])
+        for use_jit in ([False, True] if jit.AVAILABLE else [False]):
+            assert np.allclose(compile_circuit(proteins, use_jit=use_jit).calcProdRates(conc), expected)
+        # Batched concentrations go through the same tables
+        batch = np.stack([conc, 2 * conc, conc / 3])
+        assert np.allclose(circuit.calcProdRates(batch)[0], expected)
+        assert np.allclose(circuit.calcProdRates(batch)[1], circuit.calcProdRates(2 * conc))
+
+    def test_rates_along_trajectory(self):
+        circuit = compile_circuit(make_circuit(), use_jit=False)
+        t = np.array([0.5, 2.0, 7.0])
+        x = np.array([[0.4, 1.1, 0.6, 0.25], [0.1, 0.2, 0.3, 0.4], [1.0, 0.0, 2.0, 0.5]])
+        rates = circuit.calcRates(x, t)
+        for k in range(len(t)):
+            assert np.allclose(rates[k], circuit.calcRates(x[k], t[k]))
+
+    def test_unknown_gate_type(self):
+        with pytest.raises(ValueError):
+            GateGroup("xor", [0], [0], [0], [1], [1])
+
+
+@pytest.mark.skipif(not jit.AVAILABLE, reason="numba is not installed")
+class TestJit:
+    """The numba kernels against the NumPy path"""
+
+    def test_type_codes_match_gate_types(self):
+        codes = [jit.ACT_HILL, jit.REP_HILL, jit.ACT_HILL_MULT, jit.REP_HILL_MULT, jit.AA_AND, jit.AA_OR,
+                 jit.AA_OR_SINGLE, jit.RR_AND, jit.RR_OR, jit.RR_AND_SINGLE, jit.AR_AND, jit.AR_OR,
+                 jit.AR_AND_SINGLE, jit.AR_OR_SINGLE]
+        names = ["act_hill", "rep_hill", "act_hill_mult", "rep_hill_mult", "aa_and", "aa_or", "aa_or_single",
+                 "rr_and", "rr_or", "rr_and_single", "ar_and", "ar_or", "ar_and_single", "ar_or_single"]
+        assert [GATE_TYPES.index(name) for name in names] == codes
+
+    @pytest.mark.parametrize("gate_type", GATE_TYPES)
+    @pytest.mark.parametrize("x", [[0.8, 0.6, 0.4], [0.0, 0.0, 0.3]])
+    def test_every_gate_type_matches_numpy(self, gate_type, x):
+        gate = Gate(gate_type, firstInput=0, secondInput=1, firstHill=2, secondHill=1)
+        proteins = [
+            Protein(0, "X", 0.8, 0.5, [Gate("rep_hill", firstInput=2, firstHill=2.5)]),
+            Protein(1, "Y", 0.6, 1.0, [], steady_state, [0.3]),
+            Protein(2, "Z", 0.4, 0.7, [gate], beta=2),
+        ]
+        native = compile_circuit(proteins, use_jit=True)
+        numpy = compile_circuit(proteins, use_jit=False)
+        x = np.array(x)
+        assert np.allclose(native.calcRates(x, 1.0), numpy.calcRates(x, 1.0), rtol=1e-12, atol=1e-14)
+        assert np.allclose(native.calcJacobian(x, 1.0), numpy.calcJacobian(x, 1.0), rtol=1e-12, atol=1e-14)
+        assert np.allclose(native.calcSparseJacobian(x, 1.0).toarray(), numpy.calcJacobian(x, 1.0),
+                           rtol=1e-12, atol=1e-14)
+
+    @pytest.mark.parametrize("gate_type", GATE_TYPES)
+    def test_saturated_jacobian_matches_numpy(self, gate_type):
+        gate = Gate(gate_type, firstInput=0, secondInput=1, firstHill=50, secondHill=50)
+        proteins = [
+            Protein(0, "X", 1e8, 1, []),
+            Protein(1, "Y", 0.9, 1, []),
+            Protein(2, "Z", 0.4, 0.7, [gate], beta=2),
+        ]
+        x = np.array([1e8, 0.9, 0.4])
+        native = compile_circuit(proteins, use_jit=True).calcJacobian(x, 0.0)
+        assert np.all(np.isfinite(native))
+        assert np.allclose(native, compile_circuit(proteins, use_jit=False).calcJacobian(x, 0.0),
+                           rtol=1e-12, atol=1e-14)
+
+    def test_ensemble_inherits_backend(self):
+        for use_jit in (True, False):
+            circuit = compile_circuit(make_circuit(), use_jit=use_jit)
+            ensemble = make_ensemble(circuit, [("C", "beta")], [[1.0], [2.0]])
+            assert ensemble.mUseJit == use_jit
+        x = np.linspace(0.1, 1.2, 8)
+        assert np.allclose(ensemble.calcRates(x, 2.0), make_ensemble(
+            compile_circuit(make_circuit(), use_jit=True), [("C", "beta")], [[1.0], [2.0]]).calcRates(x, 2.0))
+
+
+def test_jit_requires_numba(monkeypatch):
+    monkeypatch.setattr(jit, "AVAILABLE", False)
+    assert not compile_circuit(make_circuit()).mUseJit
+    with pytest.raises(ValueError):
+        compile_circuit(make_circuit(), use_jit=True)
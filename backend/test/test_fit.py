@@ -0,0 +1,119 @@
+import json
+import os
+
+import numpy as np
+import pytest
+import scipy.optimize
+from backend.compiler import compile_circuit
+from backend.fit import FitObjective, fit_parameters
+from backend.parser import parse_circuit
+from backend.simulate import run_simulation
+
+TOGGLE_SWITCH = os.path.join(os.path.dirname(__file__), "parser_test_data", "toggle_switch_input.json")
+
+
+def load_circuit():
+    """The toggle switch started near its A-high state, so the transient pins down every parameter."""
+    with open(TOGGLE_SWITCH) as f:
+        circuit_json = json.load(f)
+    circuit_json["proteins"]["Protein B"]["initialConcentration"] = 0.1
+    return circuit_json
+
+
+def simulated_data(circuit_json, t):
+    proteins = parse_circuit(circuit_json)
+    y = run_simulation(np.concatenate(([0.0], t)), proteins, rtol=1e-10, atol=1e-12)[1:]
+    return {p.getName(): {"time": t.tolist(), "values": y[:, i].tolist()} for i, p in enumerate(proteins)}
+
+
+# The toggle switch has loss rate 1 and beta 5; start the fit away from both
+BOUNDS = [
+    {"target": "Protein A", "parameter": "lossRate", "min": 0.1, "max": 5, "initial": 2.5},
+    {"target": "Protein A", "parameter": "beta", "min": 0.1, "max": 10, "initial": 1},
+]
+
+
+class TestFitParameters:
+    """Recovering known parameters from a circuit's own trajectories"""
+
+    @pytest.mark.parametrize("method,workers", [("least_squares", 1), ("least_squares", 2), ("differential_evolution", 2)])
+    def test_recovers_parameters(self, method, workers):
+        circuit_json = load_circuit()
+        data = simulated_data(circuit_json, np.linspace(0.5, 20, 20))
+        result = fit_parameters(circuit_json, data, BOUNDS, method=method, starts=2, workers=workers, seed=0,
+                                rtol=1e-10, atol=1e-12)
+        assert result["parameters"] == [("Protein A", "lossRate"), ("Protein A", "beta")]
+        assert np.allclose(result["values"], [1.0, 5.0], rtol=1e-3)
+        assert result["cost"] < 1e-8
+        assert set(result["residuals"]) == {"Protein A", "Protein B"}
+        assert np.allclose(result["residuals"]["Protein B"], 0.0, atol=1e-4)
+        assert len(result["starts"]) == (2 if method == "least_squares" else 1)
+        assert all(seconds >= 0 for _, seconds in result["history"])
+
+    def test_skips_missing_values(self):
+        circuit_json = load_circuit()
+        t = np.linspace(1, 10, 10)
+        data = simulated_data(circuit_json, t)
+        del data["Protein A"]
+        data["Protein B"]["values"][3] = float("nan")
+        result = fit_parameters(circuit_json, data, BOUNDS[1:], starts=1, workers=1, rtol=1e-10, atol=1e-12)
+        assert result["values"][0] == pytest.approx(5.0, rel=1e-3)
+        assert result["residuals"]["Protein B"][3] is None
+        assert len(result["residuals"]["Protein B"]) == 10
+
+    def test_bad_input(self):
+        circuit_json = load_circuit()
+        data = simulated_data(circuit_json, np.linspace(1, 5, 5))
+        with pytest.raises(ValueError):
+            fit_parameters(circuit_json, data, BOUNDS, method="newton")
+        with pytest.raises(ValueError):
+            fit_parameters(circuit_json, data, [])
+        with pytest.raises(ValueError):
+            fit_parameters(circuit_json, data, [{"target": "Protein A", "parameter": "beta", "min": 2, "max": 1}])
+        with pytest.raises(ValueError):
+            fit_parameters(circuit_json, {"Protein C": data["Protein A"]}, BOUNDS)
+        with pytest.raises(ValueError):
+            fit_parameters(circuit_json, {"Protein A": {"time": [1, 2], "values": [1]}}, BOUNDS)
+
+
+class TestFitObjective:
+    """Residuals, Jacobian and the evaluation cache"""
+
+    def test_cache_and_jacobian(self):
+        circuit_json = load_circuit()
+        circuit = compile_circuit(parse_circuit(circuit_json))
+        data = simulated_data(circuit_json, np.linspace(1, 10, 10))
+        parameters = [("Protein A", "beta"), ("Protein B", "lossRate")]
+        objective = FitObjective(circuit, parameters, data, rtol=1e-10, atol=1e-12)
+
+        x = np.array([4.0, 1.2])
+        jac = objective.jacobian(x)
+        residuals = objective.residuals(x)
+        assert len(objective.mHistory) == 1 and objective.mCacheHits == 1
+        assert jac.shape == (20, 2)
+
+        h = 1e-6
+        for j in range(2):
+            step = np.eye(2)[j] * h
+            numeric = (objective.residuals(x + step) - objective.residuals(x - step)) / (2 * h)
+            assert np.allclose(jac[:, j], numeric, atol=1e-5)
+        assert objective.cost(x) == pytest.approx(0.5 * residuals @ residuals)
+
+        # The global search only needs the cost, without sensitivities
+        objective.cost(x + 1)
+        assert objective.mCache[(x + 1).tobytes()][1] is None
+
+        small = FitObjective(circuit, parameters, data, cacheSize=2)
+        for value in (1.0, 2.0, 3.0):
+            small.residuals(np.array([value, 1.0]))
+        assert len(small.mCache) == 2
+
+    def test_one_simulation_per_point(self):
+        circuit_json = load_circuit()
+        circuit = compile_circuit(parse_circuit(circuit_json))
+        objective = FitObjective(circuit, [("Protein A", "beta")], simulated_data(circuit_json, np.linspace(1, 10, 10)))
+        result = scipy.optimize.least_squares(objective.residuals, [2.0], jac=objective.jacobian, bounds=([0.1], [10]))
+        # Every Jacobian is taken at a point whose residuals were just computed
+        assert len(objective.mHistory) == result.nfev
+        assert objective.mCacheHits == result.njev
+        assert result.x[0] == pytest.approx(5.0, rel=1e-3)
@@ -3,6 +3,7 @@ import os
 import pytest
 import numpy as np
 import biocircuits
+from backend import hill, jit
 from backend.protein import Gate, Protein
 
 class TestGate:
@@ -121,6 +122,73 @@ class TestGate:
         assert g1 == g2
         assert not (g1 == g3)
 
+
+def biocircuits_gate(type, x, y, nx, ny):
+    """Reference output of one gate type computed by biocircuits."""
+    if type in ("act_hill", "rep_hill"):
+        return getattr(biocircuits, type)(x, nx)
+    if type.endswith("_mult"):
+        single = getattr(biocircuits, type[:-len("_mult")])
+        return single(x, nx) * single(y, ny)
+    return getattr(biocircuits, type)(x, y, nx, ny)
+
+
+class TestHillKernels:
+    """The hill kernels against biocircuits, natively and through the NumPy fallback"""
+
+    @pytest.fixture(params=[True, False], ids=["native", "numpy"])
+    def native(self, request, monkeypatch):
+        monkeypatch.setattr(jit, "AVAILABLE", request.param and jit.AVAILABLE)
+        return request.param
+
+    @pytest.mark.parametrize("type", list(hill.GATE_CODES))
+    def test_matches_biocircuits(self, native, type):
+        rng = np.random.default_rng(0)
+        x, y = rng.uniform(0, 4, (2, 500))
+        # Integer coefficients take the multiplication fast path, the others pow
+        nx = rng.choice([1, 2, 3, 4, 6, 1.5, 2.7], 500)
+        ny = rng.choice([1, 2, 3, 5, 0.8], 500)
+        x[:10] = 0.0
+        y[5:15] = 0.0
+        function = getattr(hill, type)
+        if type in ("act_hill", "rep_hill"):
+            result = function(x, nx)
+        else:
+            result = function(x, y, nx, ny)
+        np.testing.assert_allclose(result, biocircuits_gate(type, x, y, nx, ny), rtol=1e-12, atol=1e-15)
+        # Scalars and uniform coefficient arrays give the same values
+        assert hill.evaluate(type, x[20], y[20], nx[20], ny[20]) == pytest.approx(result[20], rel=1e-12)
+        np.testing.assert_allclose(
+            hill.evaluate(type, x, y, np.full(500, 2.0), 3.0), biocircuits_gate(type, x, y, 2.0, 3.0), rtol=1e-12, atol=1e-15
+        )
+
+    def test_saturation_for_large_inputs_and_coefficients(self, native):
+        with np.errstate(over="raise", divide="raise", invalid="raise"):
+            assert hill.act_hill(1e3, 400) == 1.0
+            assert hill.rep_hill(1e3, 400) == pytest.approx(0.0, abs=1e-290)
+            assert hill.aa_or(1e3, 1e3, 400, 300) == 1.0
+            assert hill.aa_or_single(1e3, 1e3, 400, 300) == 1.0
+            assert hill.rr_or(1e3, 1e3, 400, 300) == pytest.approx(0.0, abs=1e-290)
+            assert hill.ar_or(1e3, 1e3, 400, 300) == 1.0
+            assert hill.ar_or_single(2.0, 1e3, 2, 300) == pytest.approx(0.0, abs=1e-290)
+            assert hill.ar_and_single(1e3, 2.0, 400, 2) == 1.0
+
+    def test_small_inputs_keep_relative_precision(self, native):
+        # biocircuits computes act_hill as 1 - rep_hill, which loses everything below 1e-16
+        assert hill.act_hill(1e-5, 4) == pytest.approx(1e-20, rel=1e-12)
+        assert hill.aa_or_single(1e-5, 2e-5, 4, 4) == pytest.approx(17e-20, rel=1e-12)
+        assert hill.act_hill(np.array([0.0]), 0.5)[0] == 0.0
+
+    def test_unknown_type(self):
+        with pytest.raises(ValueError):
+            hill.evaluate("xor", 1.0, 1.0, 1, 1)
+
+    def test_hill_power(self):
+        x = np.linspace(0, 3, 7)
+        for n in (1, 2, 3, 5, 8, 9, 2.5, np.full(7, 3.0), np.array([1, 2, 3, 4, 5, 6, 7.0])):
+            np.testing.assert_allclose(hill.hill_power(x, n), x ** np.asarray(n, dtype=float), rtol=1e-14)
+
+
 class MockProtein:
     """Mock class for Protein to simulate concentrations"""
     def __init__(self, concentration):
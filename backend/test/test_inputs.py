@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+import scipy.interpolate
+from backend.compiler import compile_circuit
+from backend.inputs import (MAX_SCHEDULE_BREAKPOINTS, InputSchedule, TableInput, input_edges, load_table, steady_state,
+                            table_input, x_pulse)
+from backend.protein import Protein, Gate
+from backend.simulate import run_simulation
+
+
+class TestInputSchedule:
+    """Compiled schedules against the input functions they replace"""
+
+    @pytest.mark.parametrize("args", [
+        (1.0, 40.0, 2.0, 1.0, 0.5),
+        (3.18, 17.1, 0.7, 2.5, 0.02),
+        (2.84, 45.5, 2.5, 1.0, 0.41),
+        (0.04, np.inf, 10.0, 1.0, 1.0),
+        (5.0, 30.0, 3.0, 1.0, 0.0),
+    ])
+    def test_matches_x_pulse(self, args):
+        schedule = InputSchedule([(x_pulse, args)])
+        rng = np.random.default_rng(0)
+        # Output grids, random times, and the floats right around every breakpoint
+        t = np.concatenate([np.linspace(0, 60, n) for n in (100, 1000, 1001, 3001)] + [rng.uniform(-5, 70, 10000)])
+        near = schedule.mTimes[np.isfinite(schedule.mTimes)]
+        t = np.concatenate([t] + [near + k * np.spacing(near) for k in range(-6, 7)])
+        assert np.array_equal(schedule(t)[:, 0], x_pulse(t, *args))
+        assert all(schedule.at(float(time))[0] == x_pulse(time, *args) for time in t[::50])
+
+    def test_shapes_and_constants(self):
+        schedule = InputSchedule([(x_pulse, (1.0, 5.0, 2.0, 3.0, 0.5)), (steady_state, (2.0,))])
+        assert schedule.at(0.5).tolist() == [0.0, 2.0]
+        assert schedule.at(1.0).tolist() == [3.0, 2.0]
+        assert schedule(np.zeros((4, 3))).shape == (4, 3, 2)
+        constant = InputSchedule([(steady_state, (0.7,))])
+        assert len(constant.mTimes) == 0
+        assert constant.at(123.0).tolist() == [0.7]
+
+    def test_input_edges(self):
+        assert len(input_edges(steady_state, (1.0,))) == 0
+        assert len(input_edges(x_pulse, (1.0, 5.0, 2.0, 0.0, 0.5))) == 0
+        assert input_edges(x_pulse, (1.0, np.inf, 2.0, 1.0, 1.0)).tolist() == [1.0]
+        assert input_edges(x_pulse, (0.0, np.inf, 2.0, 1.0, 0.5)) is None
+        assert input_edges(x_pulse, (0.0, MAX_SCHEDULE_BREAKPOINTS, 1.0, 1.0, 0.5)) is None
+        assert input_edges(lambda t: t, ()) is None
+
+    def test_compiled_circuit(self):
+        custom = (lambda t, a: a * np.sin(t), (0.5,))
+        proteins = [
+            Protein(0, "Pulse", 0.0, 0.5, [], x_pulse, (1.0, 40.0, 2.0, 1.0, 0.5)),
+            Protein(1, "Fast", 0.0, 0.5, [], x_pulse, (0.0, 1e9, 0.01, 1.0, 0.5)),
+            Protein(2, "Custom", 0.0, 0.5, [], *custom),
+            Protein(3, "Out", 0.0, 1.0, [Gate("aa_and", firstInput=0, secondInput=2, firstHill=2, secondHill=2)]),
+        ]
+        circuit = compile_circuit(proteins)
+        assert circuit.mScheduleColumns.tolist() == [0]
+        assert [idx for idx, _, _ in circuit.mDirectInputs] == [1, 2]
+
+        t = np.linspace(0, 50, 2001)
+        ext = circuit.getExternalConcentrations(t)
+        assert np.array_equal(ext[:, 0], x_pulse(t, 1.0, 40.0, 2.0, 1.0, 0.5))
+        assert np.array_equal(ext[:, 1], x_pulse(t, 0.0, 1e9, 0.01, 1.0, 0.5))
+        assert np.array_equal(ext[:, 2], 0.5 * np.sin(t))
+        assert np.all(ext[:, 3] == 0)
+        assert np.array_equal(circuit.getExternalConcentrations(t[7]), ext[7])
+
+
+class TestTableInput:
+    """Interpolated time-series inputs"""
+
+    @pytest.mark.parametrize("uniform", [True, False])
+    @pytest.mark.parametrize("interpolation", ["linear", "cubic"])
+    def test_interpolation(self, uniform, interpolation):
+        rng = np.random.default_rng(0)
+        times = np.arange(0.0, 600.0) if uniform else np.sort(rng.uniform(0, 600, 600))
+        values = np.sin(times / 50) + 0.1 * rng.random(600)
+        table = TableInput(times, values, interpolation)
+        assert (table.mStep is not None) == uniform
+
+        t = np.concatenate((rng.uniform(-10, 610, 3000), times))
+        if interpolation == "linear":
+            expected = np.interp(t, times, values)
+        else:
+            expected = scipy.interpolate.CubicSpline(times, values)(np.clip(t, times[0], times[-1]))
+        assert np.allclose(table(t), expected, rtol=0, atol=1e-12)
+        # The scalar path used by the right-hand side agrees with the vectorized one
+        assert np.array_equal([table.at(float(time)) for time in t], table(t))
+        assert table(t.reshape(2, -1)).shape == (2, len(t) // 2)
+
+    def test_memory_mapped_file(self, tmp_path):
+        samples = np.column_stack((np.arange(100.0), np.arange(100.0) ** 2, -np.arange(100.0)))
+        np.save(tmp_path / "trace.npy", samples)
+        table = load_table({"file": str(tmp_path / "trace.npy"), "valueColumn": 2})
+        assert isinstance(table.mTimes, np.memmap)
+        assert table(10.5) == pytest.approx(-10.5)
+        assert table == load_table({"times": samples[:, 0].tolist(), "values": samples[:, 2].tolist()})
+
+    def test_bad_tables(self):
+        with pytest.raises(ValueError):
+            TableInput(np.array([0.0, 1.0]), np.array([1.0, 2.0]), "nearest")
+        with pytest.raises(ValueError):
+            TableInput(np.array([0.0, 2.0, 1.0]), np.zeros(3))
+        with pytest.raises(ValueError):
+            TableInput(np.array([0.0]), np.zeros(1))
+        with pytest.raises(ValueError):
+            load_table({"interpolation": "linear"})
+
+    def test_simulation(self):
+        # A decaying protein driven by a ramp table: its input is added to the total concentration
+        table = TableInput(np.array([0.0, 10.0, 20.0]), np.array([0.0, 2.0, 2.0]))
+        proteins = [
+            Protein(0, "In", 0.0, 1.0, [], table_input, (table,)),
+            Protein(1, "Out", 0.0, 1.0, [Gate("act_hill", firstInput=0, firstHill=1)], beta=2),
+        ]
+        t = np.linspace(0, 20, 201)
+        y = run_simulation(t, proteins, rtol=1e-10, atol=1e-12)
+        assert np.allclose(y[:, 0], table(t))
+        # Out follows 2 In / (1 + In) once the input has stopped changing
+        assert y[-1, 1] == pytest.approx(2 * 2 / 3, rel=1e-3)
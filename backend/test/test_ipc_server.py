@@ -17,20 +17,38 @@ fake_parser = types.ModuleType('parser')
 fake_parser.parse_circuit = lambda data: None
 sys.modules['parser'] = fake_parser
 fake_simulate = types.ModuleType('simulate')
-fake_simulate.run_simulation = lambda t, protein_array: None
+fake_simulate.run_simulation = lambda t, protein_array, **kwargs: None
 sys.modules['simulate'] = fake_simulate
 
 import ipc_server
 
 
 class MockProtein:
+    """A constant protein with just enough attributes for compile_circuit; A, B, ... get ids 0, 1, ..."""
+
     def __init__(self, name):
         self._name = name
+        self.mID = ord(name) - ord('A')
+        self.mName = name
+        self.mInternalConc = 0.0
+        self.mDegradation = 0.0
+        self.mBeta = 0.0
+        self.mExtConcFunc = None
+        self.mGates = []
 
     def getName(self):
         return self._name
 
 
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch, tmp_path):
+    # Tests swap parse_circuit and run_simulation under identical payloads, so none may see
+    # another's cached circuit or results, nor those of real sessions, nor reintegrate from its last run
+    monkeypatch.setattr(ipc_server, '_last_simulation', None)
+    monkeypatch.setattr(ipc_server, '_circuits', ipc_server.CircuitCache())
+    monkeypatch.setattr(ipc_server, '_results', ipc_server.ResultCache(str(tmp_path / "results")))
+
+
 def test_no_circuit_returns_message_when_none(monkeypatch):
     # parse_circuit returns None -> handler should return the friendly message
     monkeypatch.setattr(ipc_server, 'parse_circuit', lambda data: None)
@@ -58,11 +76,11 @@ def test_simulation_success_returns_image_and_data(monkeypatch):
     monkeypatch.setattr(ipc_server, 'parse_circuit', lambda data: proteins)
 
     # Prepare t and concentrations expected by the handler
-    def fake_run_simulation(t, protein_array):
+    def fake_run_simulation(t, protein_array, full_output=False, **kwargs):
         # Return an array shaped (len(t), len(protein_array))
         a = np.linspace(0, 1, len(t))
         b = np.linspace(1, 0, len(t))
-        return np.vstack([a, b]).T
+        return np.vstack([a, b]).T, {"solver": kwargs.get("solver", "odeint"), "nfev": 0, "njev": 0}
 
     monkeypatch.setattr(ipc_server, 'run_simulation', fake_run_simulation)
 
@@ -83,7 +101,7 @@ def test_simulation_success_returns_image_and_data(monkeypatch):
     # Validate protein names
     assert result['data']['proteinNames'] == ['A', 'B']
 
-    # timePoints should be downsampled: original n = numTimePoints*10; downsample by [::10] -> numTimePoints entries
+    # timePoints are exactly the numTimePoints requested
     assert len(result['data']['timePoints']) == data['circuitSettings']['numTimePoints']
 
     # concentrations shape
@@ -99,7 +117,7 @@ def test_simulation_success_returns_image_and_data(monkeypatch):
 def test_simulation_returns_error_when_no_results(monkeypatch):
     proteins = [MockProtein('A')]
     monkeypatch.setattr(ipc_server, 'parse_circuit', lambda data: proteins)
-    monkeypatch.setattr(ipc_server, 'run_simulation', lambda t, p: None)
+    monkeypatch.setattr(ipc_server, 'run_simulation', lambda t, p, **kwargs: None)
 
     result = ipc_server.run_simulation_handler({})
 
@@ -107,6 +125,126 @@ def test_simulation_returns_error_when_no_results(monkeypatch):
     assert result.get('error') == 'Simulation failed to produce results'
 
 
+def test_solver_settings_are_passed_through(monkeypatch):
+    proteins = [MockProtein('A')]
+    monkeypatch.setattr(ipc_server, 'parse_circuit', lambda data: proteins)
+    monkeypatch.setattr(ipc_server, '_last_simulation', None)
+    received = {}
+
+    def fake_run_simulation(t, protein_array, full_output=False, **kwargs):
+        received.update(kwargs)
+        return np.zeros((len(t), 1)), {"solver": kwargs["solver"], "nfev": 12, "njev": 3}
+
+    monkeypatch.setattr(ipc_server, 'run_simulation', fake_run_simulation)
+
+    result = ipc_server.run_simulation_handler({
+        "circuitSettings": {"simulationDuration": 5, "numTimePoints": 10,
+                            "solver": "BDF", "rtol": 1e-4, "atol": 1e-8, "maxStep": 0.5, "decompose": True}
+    })
+
+    assert received.pop("checkpoints") is ipc_server._checkpoints
+    assert received == {"solver": "BDF", "rtol": 1e-4, "atol": 1e-8, "max_step": 0.5, "decompose": True, "previous": None}
+    assert result["solver"] == {"solver": "BDF", "nfev": 12, "njev": 3}
+
+
+def test_edit_reintegrates_downstream_proteins_only(monkeypatch):
+    from backend.protein import Protein, Gate
+
+    def circuit(loss_rate):
+        return [
+            Protein(0, "A", 1.0, 1.0, [], beta=1),
+            Protein(1, "B", 0.0, 0.5, [Gate("act_hill", firstInput=0)], beta=2),
+            Protein(2, "C", 0.0, loss_rate, [Gate("rep_hill", firstInput=1)], beta=2),
+        ]
+
+    monkeypatch.setattr(ipc_server, 'parse_circuit', lambda data: circuit(data["proteins"]["C"]["lossRate"]))
+    settings = {"circuitSettings": {"simulationDuration": 10, "numTimePoints": 50}}
+    first = ipc_server.run_simulation_handler({**settings, "proteins": {"C": {"lossRate": 1.0}}})
+    second = ipc_server.run_simulation_handler({**settings, "proteins": {"C": {"lossRate": 2.0}}})
+
+    assert first["solver"]["reintegrated"] == 3
+    assert second["solver"]["reintegrated"] == 1
+    first_data, second_data = np.array(first["data"]["concentrations"]), np.array(second["data"]["concentrations"])
+    assert np.array_equal(first_data[:, :2], second_data[:, :2])
+    assert second_data[-1, 2] < first_data[-1, 2]
+    json.dumps(second)
+
+    # Only the full run went into the result cache, so the edit simulates again in a later session
+    assert ipc_server.cache_stats_handler({})["results"]["writes"] == 1
+    monkeypatch.setattr(ipc_server, '_last_simulation', None)
+    third = ipc_server.run_simulation_handler({**settings, "proteins": {"C": {"lossRate": 2.0}}})
+    assert not third["cached"] and third["solver"]["reintegrated"] == 3
+
+
+def test_extend_and_window_resume_from_checkpoints(monkeypatch):
+    from backend.protein import Protein, Gate
+    from backend.simulate import CheckpointStore
+
+    proteins = [
+        Protein(0, "A", 1.0, 1.0, [], beta=1),
+        Protein(1, "B", 0.0, 0.5, [Gate("act_hill", firstInput=0)], beta=2),
+    ]
+    monkeypatch.setattr(ipc_server, 'parse_circuit', lambda data: proteins)
+    monkeypatch.setattr(ipc_server, '_checkpoints', CheckpointStore())
+    settings = {"simulationDuration": 10, "numTimePoints": 101, "rtol": 1e-10, "atol": 1e-10}
+    first = ipc_server.run_simulation_handler({"circuitSettings": settings})
+
+    extended = ipc_server.extend_simulation_handler({"circuitSettings": {**settings, "simulationDuration": 30}})
+    assert extended["ok"] and extended["solver"]["resumedFrom"] == 10
+    assert extended["data"]["timePoints"][0] == 10 and extended["data"]["timePoints"][-1] == 30
+    assert np.allclose(extended["data"]["concentrations"][0], first["data"]["concentrations"][-1])
+
+    window = ipc_server.simulate_window_handler({
+        "circuitSettings": settings, "window": {"start": 25, "end": 26, "numTimePoints": 11}
+    })
+    assert window["ok"] and 20 <= window["solver"]["resumedFrom"] <= 25
+    assert len(window["data"]["timePoints"]) == 11
+    # B decays like exp(-0.5 t) once A is gone
+    b = np.array(window["data"]["concentrations"])[:, 1]
+    assert np.allclose(b[1:] / b[:-1], np.exp(-0.05), rtol=1e-3)
+
+    bad = ipc_server.simulate_window_handler({"circuitSettings": settings, "window": {"start": 5}})
+    assert not bad["ok"] and "window" in bad["error"]
+
+
+@pytest.mark.parametrize("settings", [{"solver": "euler"}, {"rtol": 0}, {"maxStep": -1}])
+def test_invalid_solver_settings_return_error(monkeypatch, settings):
+    monkeypatch.setattr(ipc_server, 'parse_circuit', lambda data: [MockProtein('A')])
+
+    result = ipc_server.run_simulation_handler({"circuitSettings": settings})
+
+    assert result["ok"] is False
+    assert "circuitSettings" in result["error"] or "Unknown solver" in result["error"]
+
+
+@pytest.mark.parametrize("num_points", [1, 5, 1000, 2500])
+def test_output_grids(num_points):
+    t, data_idx, plot_idx = ipc_server._output_grids(20, num_points)
+
+    assert np.array_equal(t[data_idx], np.linspace(0, 20, num_points))
+    assert len(plot_idx) == max(num_points, ipc_server.PLOT_POINTS)
+    assert np.all(np.diff(t) > 0)
+    # No oversampling beyond the data grid plus the plot grid
+    assert len(t) <= num_points + ipc_server.PLOT_POINTS
+
+
+def test_simulation_integrates_only_needed_points(monkeypatch):
+    monkeypatch.setattr(ipc_server, 'parse_circuit', lambda data: [MockProtein('A')])
+    seen = {}
+
+    def fake_run_simulation(t, protein_array, full_output=False, **kwargs):
+        seen["t"] = t
+        return t[:, np.newaxis] * 2.0, {"solver": "odeint", "nfev": 1, "njev": 0}
+
+    monkeypatch.setattr(ipc_server, 'run_simulation', fake_run_simulation)
+
+    result = ipc_server.run_simulation_handler({"circuitSettings": {"simulationDuration": 1000, "numTimePoints": 5000}})
+
+    assert len(seen["t"]) == 5000
+    assert result["data"]["timePoints"] == np.linspace(0, 1000, 5000).tolist()
+    assert np.allclose(np.array(result["data"]["concentrations"])[:, 0], np.linspace(0, 2000, 5000))
+
+
 def test_exception_is_caught_and_returned(monkeypatch):
     def bad_parse(data):
         raise RuntimeError('boom')
@@ -168,11 +306,11 @@ def test_main_loop_command_run_simulation(monkeypatch):
     monkeypatch.setattr(ipc_server, 'parse_circuit', lambda data: proteins)
 
     # Prepare t and concentrations expected by the handler
-    def fake_run_simulation(t, protein_array):
+    def fake_run_simulation(t, protein_array, full_output=False, **kwargs):
         # Return an array shaped (len(t), len(protein_array))
         a = np.linspace(0, 1, len(t))
         b = np.linspace(1, 0, len(t))
-        return np.vstack([a, b]).T
+        return np.vstack([a, b]).T, {"solver": kwargs.get("solver", "odeint"), "nfev": 0, "njev": 0}
 
     monkeypatch.setattr(ipc_server, 'run_simulation', fake_run_simulation)
     
@@ -267,4 +405,260 @@ def test_main_loop_sys_exit(monkeypatch):
     with pytest.raises(SystemExit) as e:
         ipc_server.main()
 
-    assert e.value.code == 1  # check that it exited with code 1
\ No newline at end of file
+    assert e.value.code == 1  # check that it exited with code 1
+
+
+def test_main_loop_command_run_sweep_streams_chunks(monkeypatch):
+    def fake_run_sweep(circuit_json, parameters, values, t, **kwargs):
+        for start in range(0, len(values), 2):
+            indices = np.arange(start, min(start + 2, len(values)))
+            yield {
+                "proteinNames": ["A", "B"],
+                "indices": indices,
+                "values": values[indices],
+                "concentrations": np.zeros((len(indices), 2)),
+                "info": {"solver": "odeint", "nfev": 1, "njev": 0},
+            }
+
+    monkeypatch.setattr(ipc_server, 'run_sweep', fake_run_sweep)
+
+    message = {"command": "run_sweep", "requestId": 7, "data": {
+        "circuitSettings": {"simulationDuration": 10, "numTimePoints": 5},
+        "sweep": {"axes": [{"target": "A", "parameter": "beta", "values": [1, 2, 3]}]},
+    }}
+    message_bytes = json.dumps(message).encode("utf-8")
+    fake_stdin = MockStdio(len(message_bytes).to_bytes(4, byteorder="little") + message_bytes)
+    fake_stdout = MockStdio()
+
+    monkeypatch.setattr(sys, "stdin", fake_stdin)
+    monkeypatch.setattr(sys, "stdout", fake_stdout)
+
+    thread = threading.Thread(target=ipc_server.main)
+    thread.start()
+    thread.join(timeout=2)
+
+    fake_stdout.buffer.seek(0)
+    responses = []
+    while True:
+        length_bytes = fake_stdout.buffer.read(4)
+        if not length_bytes:
+            break
+        responses.append(json.loads(fake_stdout.buffer.read(int.from_bytes(length_bytes, "little"))))
+
+    assert [r["partial"] for r in responses] == [True, True, False]
+    assert all(r["requestId"] == 7 for r in responses)
+    assert responses[0]["chunk"]["indices"] == [0, 1]
+    assert responses[1]["chunk"]["values"] == [[3.0]]
+    assert responses[2]["numPoints"] == 3
+    assert responses[2]["proteinNames"] == ["A", "B"]
+
+def test_steady_state_handler(monkeypatch):
+    proteins = [MockProtein('A'), MockProtein('B')]
+    monkeypatch.setattr(ipc_server, 'parse_circuit', lambda data: proteins)
+    calls = {}
+
+    def fake_find_steady_state(protein_array, **kwargs):
+        calls.update(kwargs)
+        return {
+            "concentrations": np.array([0.2, 4.8]),
+            "converged": True,
+            "eigenvalues": np.array([-1 + 0.5j, -1 - 0.5j]),
+            "stable": True,
+            "residual": 1e-12,
+            "bursts": 0,
+        }
+
+    monkeypatch.setattr(ipc_server, 'find_steady_state', fake_find_steady_state)
+    response = ipc_server.steady_state_handler({
+        "circuitSettings": {"simulationDuration": 50, "solver": "BDF"},
+        "steadyState": {"tol": 1e-6},
+    })
+    assert response["ok"]
+    assert response["proteinNames"] == ["A", "B"]
+    assert response["concentrations"] == [0.2, 4.8]
+    assert response["eigenvalues"] == {"real": [-1, -1], "imag": [0.5, -0.5]}
+    assert calls["t"] == 50 and calls["tol"] == 1e-6 and calls["solver"] == "BDF"
+    json.dumps(response)
+
+def test_run_stochastic_handler(monkeypatch):
+    proteins = [MockProtein('A'), MockProtein('B')]
+    monkeypatch.setattr(ipc_server, 'parse_circuit', lambda data: proteins)
+    calls = {}
+
+    def fake_run_stochastic(t, protein_array, **kwargs):
+        calls.update(kwargs)
+        return {
+            "mean": np.ones((len(t), 2)),
+            "variance": np.zeros((len(t), 2)),
+            "trajectories": np.ones((kwargs["num_raw"], len(t), 2)),
+            "steps": 12,
+        }
+
+    monkeypatch.setattr(ipc_server, 'run_stochastic', fake_run_stochastic)
+    response = ipc_server.run_stochastic_handler({
+        "circuitSettings": {"simulationDuration": 10, "numTimePoints": 5},
+        "stochastic": {"method": "tau_leaping", "trajectories": 300, "seed": 4, "rawTrajectories": 2},
+    })
+    assert response["ok"]
+    assert response["timePoints"] == [0, 2.5, 5, 7.5, 10]
+    assert len(response["mean"]) == 5 and len(response["trajectories"]) == 2
+    assert calls["method"] == "tau_leaping" and calls["num_trajectories"] == 300 and calls["seed"] == 4
+
+    response = ipc_server.run_stochastic_handler({"stochastic": {"method": "euler"}})
+    assert not response["ok"]
+
+def test_run_sensitivity_handler(monkeypatch):
+    from backend.protein import Protein, Gate
+    from backend.simulate import steady_state
+
+    proteins = [
+        Protein(0, "A", 0.0, 0.0, [], steady_state, [1.0]),
+        Protein(1, "B", 0.0, 0.5, [Gate("act_hill", firstInput=0)], beta=10),
+    ]
+    monkeypatch.setattr(ipc_server, 'parse_circuit', lambda data: proteins)
+    response = ipc_server.run_sensitivity_handler({
+        "circuitSettings": {"simulationDuration": 10, "numTimePoints": 5},
+        "sensitivity": {"parameters": [{"target": "B", "parameter": "beta"}]},
+    })
+    assert response["ok"]
+    assert response["parameters"] == [{"target": "B", "parameter": "beta"}]
+    assert np.array(response["sensitivities"]).shape == (5, 2, 1)
+    assert np.allclose(np.array(response["sensitivities"])[:, 1, 0], 1 - np.exp(-0.5 * np.linspace(0, 10, 5)), atol=1e-4)
+    json.dumps(response)
+
+    # Every beta, loss rate and Hill coefficient by default
+    response = ipc_server.run_sensitivity_handler({"circuitSettings": {"numTimePoints": 3}})
+    assert [p["parameter"] for p in response["parameters"]] == ["beta", "lossRate", "lossRate", "hill"]
+
+    response = ipc_server.run_sensitivity_handler({"sensitivity": {"parameters": [{"target": "B", "parameter": "volume"}]}})
+    assert not response["ok"]
+
+
+def test_fit_parameters_handler(monkeypatch):
+    from backend import parser
+    from backend.simulate import run_simulation
+
+    monkeypatch.setattr(ipc_server, 'parse_circuit', parser.parse_circuit)
+    with open(os.path.join(os.path.dirname(__file__), "parser_test_data", "toggle_switch_input.json")) as f:
+        circuit_json = json.load(f)
+    circuit_json["proteins"]["Protein B"]["initialConcentration"] = 0.1
+    t = np.linspace(0, 10, 11)
+    y = run_simulation(t, parser.parse_circuit(circuit_json))
+    circuit_json["fit"] = {
+        "data": {"Protein A": {"time": t[1:].tolist(), "values": y[1:, 0].tolist()}},
+        "parameters": [{"target": "Protein A", "parameter": "beta", "min": 1, "max": 10, "initial": 2}],
+        "starts": 1,
+        "workers": 1,
+    }
+    response = ipc_server.fit_parameters_handler(circuit_json)
+    assert response["ok"]
+    assert response["parameters"] == [{"target": "Protein A", "parameter": "beta"}]
+    assert response["values"][0] == pytest.approx(5.0, rel=1e-3)
+    assert len(response["residuals"]["Protein A"]) == 10
+    assert response["history"] and "seconds" in response["history"][0]
+    json.dumps(response)
+
+    circuit_json["fit"]["method"] = "newton"
+    assert not ipc_server.fit_parameters_handler(circuit_json)["ok"]
+
+
+def test_global_sensitivity_handler(monkeypatch):
+    def fake_global_sensitivity(circuit_json, axes, t, outputs=None, progress=None, **kwargs):
+        progress(3, 6)
+        progress(6, 6)
+        return {
+            "method": "sobol",
+            "parameters": [("A", "beta")],
+            "outputs": [("A", "period")],
+            "numEvaluations": 6,
+            "info": {"solver": "odeint", "nfev": 10, "njev": 0},
+            "S1": np.array([[np.nan]]), "S1Conf": np.zeros((1, 1)), "ST": np.ones((1, 1)), "STConf": np.zeros((1, 1)),
+            "numValid": np.array([0]),
+        }
+
+    monkeypatch.setattr(ipc_server, 'global_sensitivity', fake_global_sensitivity)
+    emitted = []
+    response = ipc_server.global_sensitivity_handler(
+        {"globalSensitivity": {"parameters": [{"target": "A", "parameter": "beta", "min": 1, "max": 2}]}}, emitted.append
+    )
+    assert [m["progress"]["done"] for m in emitted] == [3, 6]
+    assert response["ok"] and not response["partial"]
+    assert response["outputs"] == [{"protein": "A", "metric": "period"}]
+    assert response["S1"] == [[None]]
+    assert response["ST"] == [[1.0]]
+    json.dumps(response, allow_nan=False)
+
+    monkeypatch.setattr(ipc_server, 'global_sensitivity', lambda *args, **kwargs: 1 / 0)
+    assert not ipc_server.global_sensitivity_handler({}, emitted.append)["ok"]
+
+
+def test_circuit_cache_skips_parse_and_compile(monkeypatch):
+    from backend.protein import Protein, Gate
+
+    parsed = []
+
+    def counting_parse(data):
+        parsed.append(data)
+        beta = data["proteins"]["B"]["beta"]
+        return [Protein(0, "A", 1.0, 1.0, [], beta=1), Protein(1, "B", 0.0, 0.5, [Gate("act_hill", firstInput=0)], beta=beta)]
+
+    monkeypatch.setattr(ipc_server, 'parse_circuit', counting_parse)
+    monkeypatch.setattr(ipc_server, '_circuits', ipc_server.CircuitCache(maxCircuits=2))
+
+    def payload(beta, duration=10, **fields):
+        # Key order and settings do not matter, only the circuit fields
+        return {"circuitSettings": {"simulationDuration": duration, "numTimePoints": 20},
+                **fields, "proteins": {"B": {"beta": beta}}, "nodes": [], "edges": []}
+
+    first = ipc_server.run_simulation_handler(payload(2))
+    again = ipc_server.run_simulation_handler(dict(reversed(list(payload(2, duration=5).items()))))
+    assert first["ok"] and again["ok"]
+    assert len(parsed) == 1
+    assert ipc_server.steady_state_handler(payload(2))["ok"]
+    assert ipc_server.run_sensitivity_handler(payload(2))["ok"]
+    assert len(parsed) == 1
+
+    # A changed circuit is parsed again, and the least recently used circuit is evicted
+    ipc_server.run_simulation_handler(payload(3))
+    ipc_server.run_simulation_handler(payload(4))
+    assert len(parsed) == 3
+    ipc_server.run_simulation_handler(payload(2, hillCoefficients=[{"id": "A-B", "value": 2}]))
+    assert len(parsed) == 4
+
+    # beta=4 only reintegrates B on the grid of beta=3, and reintegrated results are not stored
+    response = ipc_server.cache_stats_handler({"clear": True})
+    assert response["results"]["writes"] == 3
+    assert response["circuits"] == {
+        "entries": 2, "maxEntries": 2, "hits": 3, "misses": 4, "evictions": 2, "hitRate": 3 / 7,
+    }
+    assert ipc_server.cache_stats_handler({})["circuits"]["entries"] == 0
+    json.dumps(response)
+
+
+def test_result_cache_returns_stored_simulation(monkeypatch, tmp_path):
+    from backend.protein import Protein, Gate
+
+    monkeypatch.setattr(ipc_server, 'parse_circuit', lambda data: [
+        Protein(0, "A", 1.0, 1.0, [], beta=1), Protein(1, "B", 0.0, 0.5, [Gate("act_hill", firstInput=0)], beta=2),
+    ])
+    payload = {"circuitSettings": {"simulationDuration": 10, "numTimePoints": 20}}
+    first = ipc_server.run_simulation_handler(payload)
+    assert first["ok"] and not first["cached"]
+
+    # A later session with a new in-memory circuit cache reads the result back without simulating
+    monkeypatch.setattr(ipc_server, '_circuits', ipc_server.CircuitCache())
+    monkeypatch.setattr(ipc_server, '_results', ipc_server.ResultCache(str(tmp_path / "results")))
+    monkeypatch.setattr(ipc_server, 'run_simulation', lambda *args, **kwargs: 1 / 0)
+    second = ipc_server.run_simulation_handler(payload)
+    assert second["cached"]
+    assert {key: value for key, value in second.items() if key != "cached"} == \
+        {key: value for key, value in first.items() if key != "cached"}
+    json.dumps(second)
+
+    # Other solver settings, or turning the cache off, simulate again
+    for settings in ({"solver": "BDF"}, {"numTimePoints": 21}, {"cacheResults": False}):
+        response = ipc_server.run_simulation_handler(
+            {"circuitSettings": {**payload["circuitSettings"], **settings}}
+        )
+        assert not response["ok"] and "division by zero" in response["error"]
+    assert ipc_server.cache_stats_handler({})["results"]["hits"] == 1
@@ -2,6 +2,9 @@ import sys
 import os
 import pytest
 import json
+import numpy as np
+from backend.compiler import compile_circuit
+from backend.inputs import table_input
 from backend.parser import parse_circuit
 from backend.protein import Protein, Gate
 from backend.simulate import x_pulse, steady_state
@@ -110,3 +113,34 @@ def test_missing_gate_connections():
 
     with pytest.raises(ValueError, match=r"must have exactly two inputs"):
         parse_circuit(bad_json)
+
+def test_table_input(tmp_path):
+    times = np.arange(0.0, 3600.0)
+    values = 1 + np.sin(times / 300)
+    np.save(tmp_path / "iptg.npy", np.column_stack((times, values)))
+    with open(tmp_path / "iptg.csv", "w") as f:
+        f.write("time,IPTG\n")
+        np.savetxt(f, np.column_stack((times, values)), delimiter=",")
+
+    circuit = load_json("toggle_switch_input.json")
+    tables = {
+        "npy": {"file": str(tmp_path / "iptg.npy")},
+        "csv": {"file": str(tmp_path / "iptg.csv"), "timeColumn": "time", "valueColumn": "IPTG"},
+        "inline": {"times": times.tolist(), "values": values.tolist()},
+    }
+    hashes = set()
+    for data in tables.values():
+        circuit["proteins"]["Protein A"]["inputFunctionType"] = "table"
+        circuit["proteins"]["Protein A"]["inputFunctionData"] = data
+        proteins = parse_circuit(circuit)
+        protein_a = next(p for p in proteins if p.mName == "Protein A")
+        assert protein_a.mExtConcFunc is table_input
+        (table,) = protein_a.mExtConcFuncArgs
+        assert np.allclose(table(np.array([0.5, 1800.25])), np.interp([0.5, 1800.25], times, values))
+        hashes.add(compile_circuit(proteins).getHash())
+    # The same samples give the same circuit wherever they come from
+    assert len(hashes) == 1
+
+    circuit["proteins"]["Protein A"]["inputFunctionData"] = {"file": str(tmp_path / "iptg.txt")}
+    with pytest.raises(ValueError, match=r"\.npy or \.csv"):
+        parse_circuit(circuit)
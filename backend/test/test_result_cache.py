@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+from backend import result_cache
+from backend.result_cache import CACHE_DIR_VARIABLE, ResultCache, default_cache_dir, source_digest
+
+
+def test_round_trip(tmp_path):
+    cache = ResultCache(str(tmp_path / "results"))
+    key = cache.key("run_simulation", "circuit", 10.0, {"solver": "odeint"})
+    assert key == cache.key("run_simulation", "circuit", 10.0, {"solver": "odeint"})
+    assert key != cache.key("run_simulation", "circuit", 10.0, {"solver": "BDF"})
+
+    assert cache.get(key) is None
+    assert cache.put(key, concentrations=np.arange(6.0).reshape(3, 2), names=np.array(["A", "B"]))
+    entry = cache.get(key)
+    assert np.array_equal(entry["concentrations"], np.arange(6.0).reshape(3, 2))
+    assert entry["names"].tolist() == ["A", "B"]
+    # Nothing but the entry is left behind by the write
+    assert os.listdir(tmp_path / "results") == [key + ".npz"]
+
+    stats = cache.getStats()
+    assert (stats["entries"], stats["hits"], stats["misses"], stats["writes"]) == (1, 1, 1, 1)
+    cache.clear()
+    assert cache.get(key) is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    data = np.random.default_rng(0).random(1000)
+    probe = ResultCache(str(tmp_path / "probe"))
+    probe.put("probe", data=data)
+    size = probe.getStats()["bytes"]
+
+    cache = ResultCache(str(tmp_path / "results"), maxBytes=int(2.5 * size))
+    for k, key in enumerate("abc"):
+        cache.put(key, data=data)
+        # Modification times an hour apart, as the order of use
+        os.utime(cache._path(key), (k * 3600, k * 3600))
+        if key == "b":
+            cache.get("a")
+            os.utime(cache._path("a"), (1.5 * 3600, 1.5 * 3600))
+    # a was used after b, so b goes first
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.getStats()["evictions"] == 1
+    assert cache.getStats()["bytes"] <= cache.mMaxBytes
+
+
+def test_corrupt_entry_is_a_miss(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    with open(cache._path("bad"), "wb") as f:
+        f.write(b"not a zip file")
+    assert cache.get("bad") is None
+    assert not os.path.exists(cache._path("bad"))
+
+
+def test_disabled_and_unwritable(tmp_path):
+    disabled = ResultCache(str(tmp_path), maxBytes=0)
+    assert not disabled.put("key", data=np.zeros(3))
+    assert disabled.get("key") is None
+
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    assert not ResultCache(str(blocker / "results")).put("key", data=np.zeros(3))
+
+
+def test_default_cache_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv(CACHE_DIR_VARIABLE, str(tmp_path))
+    assert default_cache_dir() == str(tmp_path)
+    monkeypatch.delenv(CACHE_DIR_VARIABLE)
+    assert default_cache_dir().endswith(os.path.join("genecircuits", "results"))
+
+
+def test_key_follows_backend_code(monkeypatch):
+    key = ResultCache.key("run_simulation", "circuit")
+    assert len(source_digest()) == 64 and source_digest() == source_digest()
+    # An edited kernel gives another digest, and with it another key
+    monkeypatch.setattr(result_cache, '_source_digest', "0" * 64)
+    assert ResultCache.key("run_simulation", "circuit") != key
@@ -0,0 +1,196 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from backend.compiler import compile_circuit
+from backend.protein import Protein, Gate
+from backend.compiler import parameter_slots
+from backend.sensitivity import (MAX_FULL_DEFAULT_PROTEINS, SensitivitySystem, TrajectoryMetrics, default_parameters,
+                                 global_sensitivity, morris_indices, morris_samples, run_sensitivity, saltelli_rows,
+                                 saltelli_samples, sobol_indices)
+from backend.simulate import run_simulation, steady_state, x_pulse
+
+
+def pulsed_circuit(beta=3.0, loss=0.5, hill=2.0, init=0.1):
+    """Pulse-driven A with a positive feedback through B, so every parameter matters."""
+    return [
+        Protein(0, "In", 0.0, 0.5, [], x_pulse, (5, 30, 10, 2, 0.5)),
+        Protein(1, "A", init, loss, [Gate("ar_and", firstInput=0, secondInput=2, firstHill=hill, secondHill=2)], beta=beta),
+        Protein(2, "B", 0.2, 1.0, [Gate("act_hill", firstInput=1, firstHill=3)], beta=2),
+    ]
+
+
+class TestSensitivity:
+    """Forward sensitivities against closed forms and finite differences"""
+
+    def test_birth_death_closed_form(self):
+        # B' = 10 act_hill(A) - 0.5 B with A = 1: B = 10 (1 - exp(-t/2)), linear in beta
+        proteins = [
+            Protein(0, "A", 0.0, 0.0, [], steady_state, [1.0]),
+            Protein(1, "B", 0.0, 0.5, [Gate("act_hill", firstInput=0)], beta=10),
+        ]
+        t = np.linspace(0, 20, 41)
+        result = run_sensitivity(t, proteins, [("B", "beta"), ("B", "lossRate"), ("A-B", "hill")], rtol=1e-10, atol=1e-12)
+        decay = 1 - np.exp(-0.5 * t)
+        assert np.allclose(result["concentrations"][:, 1], 10 * decay)
+        assert np.allclose(result["sensitivities"][:, 1, 0], decay)
+        # dB/d(loss) = -5 / 0.5**2 (1 - exp(-t/2)) + 5 / 0.5 t exp(-t/2)
+        assert np.allclose(result["sensitivities"][:, 1, 1], -20 * decay + 10 * t * np.exp(-0.5 * t), atol=1e-6)
+        # act_hill(1) = 1/2 for every Hill coefficient
+        assert np.allclose(result["sensitivities"][:, 1, 2], 0.0)
+        assert np.allclose(result["sensitivities"][:, 0], 0.0)
+        # beta scales B proportionally, so its index is RMS(B) / max(B); the input depends on no parameter
+        assert result["indices"][1, 0] == pytest.approx(np.sqrt(np.mean(decay ** 2)) / decay.max())
+        assert np.all(result["indices"][0] == 0)
+        assert result["values"].tolist() == [10.0, 0.5, 1.0]
+
+    @pytest.mark.parametrize("solver", ["odeint", "BDF", "RK45"])
+    def test_matches_finite_differences(self, solver):
+        t = np.linspace(0, 40, 200)
+        parameters = [("A", "beta"), ("A", "lossRate"), ("In-A", "hill"), ("A", "initialConcentration")]
+        keywords = ["beta", "loss", "hill", "init"]
+        result = run_sensitivity(t, pulsed_circuit(), parameters, solver=solver, rtol=1e-9, atol=1e-11)
+        base = {"beta": 3.0, "loss": 0.5, "hill": 2.0, "init": 0.1}
+        for j, keyword in enumerate(keywords):
+            h = 1e-5
+            up = run_simulation(t, pulsed_circuit(**{**base, keyword: base[keyword] + h}), rtol=1e-11, atol=1e-12)
+            down = run_simulation(t, pulsed_circuit(**{**base, keyword: base[keyword] - h}), rtol=1e-11, atol=1e-12)
+            assert np.allclose(result["sensitivities"][:, :, j], (up - down) / (2 * h), atol=1e-5), keyword
+        assert np.allclose(result["concentrations"], run_simulation(t, pulsed_circuit(), rtol=1e-11, atol=1e-12), atol=1e-6)
+
+    def test_default_parameters(self):
+        circuit = compile_circuit(pulsed_circuit())
+        assert default_parameters(circuit) == [
+            ("A", "beta"), ("B", "beta"),
+            ("In", "lossRate"), ("A", "lossRate"), ("B", "lossRate"),
+            ("A-B", "hill"), ("In-A", "hill"), ("B-A", "hill"),
+        ]
+        result = run_sensitivity(np.linspace(0, 10, 11), circuit)
+        assert result["sensitivities"].shape == (11, 3, 8)
+        assert result["indices"].shape == (3, 8)
+
+    def test_block_jacobian_storage(self):
+        circuit = compile_circuit(pulsed_circuit())
+        parameters = [("A", "beta"), ("In-A", "hill")]
+        slots = [parameter_slots(circuit, *pair) for pair in parameters]
+        system = SensitivitySystem(circuit, parameters, slots, np.array([3.0, 2.0]))
+        z = np.linspace(0.1, 0.9, system.getNumStates())
+        expected = np.kron(np.eye(3), circuit.calcJacobian(z[:3], 1.0))
+        assert np.allclose(system.calcSparseJacobian(z, 1.0).toarray(), expected)
+        lower, upper = system.getBandwidth()
+        band = system.calcBandedJacobian(z, 1.0)
+        rows, columns = np.nonzero(expected)
+        assert np.allclose(band[rows - columns + upper, columns], expected[rows, columns])
+        assert band.shape == (lower + upper + 1, 9)
+
+    def test_large_circuit_defaults_to_betas(self):
+        n = MAX_FULL_DEFAULT_PROTEINS + 1
+        proteins = [Protein(i, f"P{i}", 0.1, 1.0, [Gate("rep_hill", firstInput=(i - 1) % n)], beta=2) for i in range(n)]
+        assert default_parameters(compile_circuit(proteins)) == [(f"P{i}", "beta") for i in range(n)]
+
+    def test_fast_pulse_next_to_slow_pulse(self):
+        # The fast pulse is too fast to split at, so neither input may be frozen between the slow one's edges
+        proteins = [
+            Protein(0, "Fast", 0.0, 0.5, [], x_pulse, (0, 120, 0.1, 1.0, 0.5)),
+            Protein(1, "Slow", 0.0, 0.5, [], x_pulse, (10, 100, 40, 1.0, 0.5)),
+            Protein(2, "C", 0.0, 1.0, [Gate("act_hill", firstInput=0, firstHill=2)], beta=1),
+        ]
+        t = np.linspace(0, 130, 1301)
+        result = run_sensitivity(t, proteins, [("C", "beta")], max_step=0.01)
+        assert np.allclose(result["concentrations"], run_simulation(t, proteins, max_step=0.01), atol=1e-4)
+        assert result["sensitivities"][1199, 2, 0] > 0.2
+
+    def test_unknown_parameter(self):
+        with pytest.raises(ValueError):
+            run_sensitivity(np.linspace(0, 1, 3), pulsed_circuit(), [("A", "volume")])
+        with pytest.raises(ValueError):
+            run_sensitivity(np.linspace(0, 1, 3), pulsed_circuit(), solver="euler")
+
+
+def ishigami(unit):
+    x = -np.pi + 2 * np.pi * unit
+    return np.sin(x[:, 0]) + 7 * np.sin(x[:, 1]) ** 2 + 0.1 * x[:, 2] ** 4 * np.sin(x[:, 0])
+
+
+class TestGlobalSensitivity:
+    """Sobol and Morris estimators, trajectory metrics and the sampled circuit path"""
+
+    def test_sobol_indices_ishigami(self):
+        A, B = saltelli_samples(3, 4000, seed=0)
+        assert A.shape == (4096, 3)
+        f = ishigami(saltelli_rows(A, B))[:, np.newaxis]
+        n = len(A)
+        s1, s1_conf, st, st_conf, valid = sobol_indices(f[:n], f[n:2 * n], f[2 * n:].reshape(3, n, 1), seed=0)
+        assert np.allclose(s1[0], [0.314, 0.442, 0.0], atol=0.03)
+        assert np.allclose(st[0], [0.558, 0.442, 0.244], atol=0.03)
+        assert np.all(s1_conf > 0) and np.all(st_conf > 0)
+        assert valid.tolist() == [n]
+
+        # Rows with a failed evaluation are left out
+        f[5] = np.nan
+        assert sobol_indices(f[:n], f[n:2 * n], f[2 * n:].reshape(3, n, 1), resamples=0)[4].tolist() == [n - 1]
+
+    def test_morris_linear(self):
+        unit, order, delta = morris_samples(2, 20, levels=4, seed=1)
+        assert unit.shape == (60, 2)
+        assert np.all((unit >= 0) & (unit <= 1))
+        mu, mu_star, sigma, conf = morris_indices((3 * unit[:, 0] - unit[:, 1])[:, np.newaxis], order, delta)
+        assert np.allclose(mu, [[3, -1]])
+        assert np.allclose(mu_star, [[3, 1]])
+        assert np.allclose(sigma, 0) and np.allclose(conf, 0)
+        with pytest.raises(ValueError):
+            morris_samples(2, 4, levels=3)
+
+    def test_trajectory_metrics(self):
+        t = np.linspace(0, 40 * np.pi, 4001)
+        concentrations = np.stack([np.column_stack((np.sin(t), np.full_like(t, 2.0)))])
+        metrics = TrajectoryMetrics([0, 0, 0, 1, 1], ["period", "amplitude", "mean", "final", "period"])
+        out = metrics(t, concentrations)
+        assert out[0, 0] == pytest.approx(2 * np.pi, rel=1e-4)
+        assert out[0, 1] == pytest.approx(2.0, rel=1e-3)
+        assert out[0, 2] == pytest.approx(0.0, abs=1e-6)
+        assert out[0, 3] == 2.0
+        assert np.isnan(out[0, 4])
+        with pytest.raises(ValueError):
+            TrajectoryMetrics([0], ["median"])
+
+    @pytest.mark.parametrize("method", ["sobol", "morris"])
+    def test_toggle_switch(self, method):
+        with open(os.path.join(os.path.dirname(__file__), "parser_test_data", "toggle_switch_input.json")) as f:
+            circuit_json = json.load(f)
+        circuit_json["proteins"]["Protein B"]["initialConcentration"] = 0.1
+        axes = [
+            {"target": "Protein A", "parameter": "beta", "min": 3, "max": 6},
+            {"target": "Protein B", "parameter": "lossRate", "min": 0.5, "max": 1.5},
+        ]
+        outputs = [{"protein": "Protein A", "metric": "final"}, {"protein": "Protein B", "metric": "max"}]
+        calls = []
+        result = global_sensitivity(circuit_json, axes, np.linspace(0, 10, 51), outputs, method=method, samples=32,
+                                    seed=2, chunk_size=16, workers=2, progress=lambda done, total: calls.append((done, total)))
+        assert result["parameters"] == [("Protein A", "beta"), ("Protein B", "lossRate")]
+        assert result["outputs"] == [("Protein A", "final"), ("Protein B", "max")]
+        assert result["numEvaluations"] == (32 * 4 if method == "sobol" else 32 * 3)
+        assert calls[-1] == (result["numEvaluations"], result["numEvaluations"])
+        assert result["info"]["nfev"] > 0
+        if method == "sobol":
+            assert result["S1"].shape == result["ST"].shape == (2, 2)
+            # The final level of A rises with its own production rate
+            assert result["ST"][0, 0] > 0.2
+        else:
+            assert result["muStar"].shape == (2, 2)
+            assert result["mu"][0, 0] > 0
+
+    def test_bad_specification(self):
+        with open(os.path.join(os.path.dirname(__file__), "parser_test_data", "toggle_switch_input.json")) as f:
+            circuit_json = json.load(f)
+        t = np.linspace(0, 1, 3)
+        axis = {"target": "Protein A", "parameter": "beta", "min": 1, "max": 2}
+        with pytest.raises(ValueError):
+            global_sensitivity(circuit_json, [axis], t, method="fast")
+        with pytest.raises(ValueError):
+            global_sensitivity(circuit_json, [], t)
+        with pytest.raises(ValueError):
+            global_sensitivity(circuit_json, [{**axis, "max": 1}], t)
+        with pytest.raises(ValueError):
+            global_sensitivity(circuit_json, [axis], t, [{"protein": "Protein C", "metric": "final"}])
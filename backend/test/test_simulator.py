@@ -2,7 +2,10 @@ import sys
 import os
 import numpy as np
 import pytest
-from backend.simulate import run_simulation, x_pulse
+from backend.simulate import run_simulation, run_ensemble, integrate_circuit, input_breakpoints, pulse_breakpoints, x_pulse, \
+    find_steady_state, steady_state, integrate_components, prune_circuit, \
+    CheckpointStore, simulate_window, extend_simulation
+from backend.compiler import compile_circuit
 from backend.protein import Protein, Gate
 import bokeh.plotting as bp
 from   bokeh.io import output_file
@@ -678,6 +681,378 @@ def test_c1_ffl_and_or_simulation():
     assert np.allclose(final_concentrations, expected_concentrations, atol=2e-1) # Tolerance is 0.2 since harder to exactly simulate using ffl_plot
 
 
+def test_vectorized_matches_reference_xor():
+    # The compiled right-hand side should reproduce the object-based reference path
+    t = np.linspace(0, 80, 1000)
+    a_args = (0, 40, 30, 2, 0.5)
+    b_args = (15, 50, 20, 2, 1)
+    proteinArray = [
+        Protein(0, "Protein A", 0.0, 0.0, [], x_pulse, a_args),
+        Protein(1, "Protein B", 0.0, 0.00, [],  x_pulse, b_args),
+        Protein(2, "Protein C", 0.0, 0.1, [Gate("aa_and", firstInput=0, secondInput=1)]),
+        Protein(3, "Protein D", 0.0, 0.1, [Gate("aa_or", firstInput=0, secondInput=1)]),
+        Protein(4, "Protein E", 0.0, 0.2, [Gate("ar_and", firstInput=3, secondInput=2, firstHill=2, secondHill=2)])
+    ]
+
+    vectorized = run_simulation(t, proteinArray)
+    reference = run_simulation(t, proteinArray, vectorized=False)
+
+    assert np.allclose(vectorized, reference, atol=1e-6)
+
+
+@pytest.mark.parametrize("method", ["BDF", "Radau"])
+def test_sparse_implicit_solvers_match_odeint(method):
+    t = np.linspace(0, 10, 200)
+    proteinArray = [
+        Protein(0, "Protein 1", 1, 1, [Gate("rep_hill", firstInput=2, firstHill=3)], None, None, 5),
+        Protein(1, "Protein 2", 1, 1, [Gate("rep_hill", firstInput=0, firstHill=3)], None, None, 5),
+        Protein(2, "Protein 3", 1.2, 1, [Gate("rep_hill", firstInput=1, firstHill=3)], None, None, 5),
+    ]
+    circuit = compile_circuit(proteinArray)
+
+    expected = integrate_circuit(circuit, t)
+    actual = integrate_circuit(circuit, t, method=method)
+    finite_difference = integrate_circuit(circuit, t, method=method, jacobian=False)
+
+    assert actual.shape == expected.shape
+    # solve_ivp runs at its default rtol=1e-3, so only loose agreement with odeint is expected
+    assert np.allclose(actual, expected, atol=5e-2)
+    assert np.allclose(actual, finite_difference, atol=1e-6)
+
+
+@pytest.mark.parametrize("solver", ["odeint", "LSODA", "BDF", "Radau", "RK45", "DOP853"])
+def test_run_simulation_reports_solver_info(solver):
+    t = np.linspace(0, 30, 300)
+    proteins = [
+        Protein(0, "A", 1.0, 1.0, [Gate("rep_hill", firstInput=1, firstHill=3)], None, None, 1.5),
+        Protein(1, "B", 1.2, 1.0, [Gate("rep_hill", firstInput=0, firstHill=3)], None, None, 1.5),
+    ]
+
+    expected = run_simulation(t, proteins)
+    conc, info = run_simulation(t, proteins, solver=solver, rtol=1e-8, atol=1e-10, max_step=1.0, full_output=True)
+
+    assert info["solver"] == solver
+    assert info["nfev"] > 0
+    assert np.allclose(conc, expected, atol=1e-4)
+
+
+def test_run_simulation_unknown_solver():
+    proteins = [Protein(0, "A", 1.0, 1.0, [])]
+    with pytest.raises(ValueError):
+        run_simulation(np.linspace(0, 1, 10), proteins, solver="euler")
+
+
+def test_pulse_breakpoints():
+    # Period 30, on for the first half, stops at t=40 (before the second period would end at 45)
+    edges = pulse_breakpoints(0, 80, 0, 40, 30, 2, 0.5)
+    assert np.allclose(edges, [15, 30, 40])
+
+    # Always-on pulse only switches at t_0 and t_f
+    assert np.allclose(pulse_breakpoints(0, 80, 15, 50, 20, 2, 1), [15, 50])
+
+    # Edges outside the simulated window are dropped
+    assert np.allclose(pulse_breakpoints(0, 20, 10, 60, 10, 1, 0.5), [10, 15])
+    assert len(pulse_breakpoints(0, 10, 20, 30, 5, 1, 0.5)) == 0
+
+    # x_pulse is constant between consecutive edges
+    edges = np.concatenate(([0], pulse_breakpoints(0, 80, 0, 40, 30, 2, 0.5), [80]))
+    for a, b in zip(edges[:-1], edges[1:]):
+        inside = np.linspace(a, b, 50)[1:-1]
+        assert len(np.unique(x_pulse(inside, 0, 40, 30, 2, 0.5))) == 1
+
+
+def test_split_at_pulses_saves_evaluations():
+    t = np.linspace(0, 80, 1000)
+    proteinArray = [
+        Protein(0, "Protein A", 0.0, 0.0, [], x_pulse, (0, 40, 30, 2, 0.5)),
+        Protein(1, "Protein B", 0.0, 0.00, [],  x_pulse, (15, 50, 20, 2, 1)),
+        Protein(2, "Protein C", 0.0, 0.1, [Gate("aa_and", firstInput=0, secondInput=1)]),
+        Protein(3, "Protein D", 0.0, 0.1, [Gate("aa_or", firstInput=0, secondInput=1)]),
+        Protein(4, "Protein E", 0.0, 0.2, [Gate("ar_and", firstInput=3, secondInput=2, firstHill=2, secondHill=2)])
+    ]
+    assert np.allclose(input_breakpoints(compile_circuit(proteinArray), 0, 80), [15, 30, 40, 50])
+
+    split, split_info = run_simulation(t, proteinArray, full_output=True)
+    unsplit, unsplit_info = run_simulation(t, proteinArray, full_output=True, split_at_pulses=False)
+    accurate = run_simulation(t, proteinArray, rtol=1e-12, atol=1e-12)
+
+    assert split_info["nfev"] < unsplit_info["nfev"]
+    assert np.allclose(split, accurate, atol=1e-6)
+    assert np.allclose(split, unsplit, atol=1e-5)
+
+
+def test_split_at_nearly_coincident_edges():
+    # Pulses whose edges differ by rounding (5.15 and 5.1499999999999995), next to an output time
+    t = np.linspace(0, 50, 5001)
+    proteinArray = [Protein(i, f"In {i}", 0.0, 0.5, [], x_pulse, (1 + i, 40, 2 + 0.1 * i, 1, 0.5)) for i in range(5)]
+    proteinArray += [
+        Protein(5 + i, f"Out {i}", 0.0, 1.0, [Gate("act_hill", firstInput=i, firstHill=2)], beta=2) for i in range(5)
+    ]
+    edges = input_breakpoints(compile_circuit(proteinArray), 0, 50)
+    assert np.all(np.diff(edges) > 1e-9)
+
+    split = run_simulation(t, proteinArray)
+    unsplit = run_simulation(t, proteinArray, split_at_pulses=False, rtol=1e-10, atol=1e-10)
+    assert np.all(np.isfinite(split))
+    assert np.allclose(split, unsplit, atol=1e-4)
+
+
+def test_fast_pulse_is_not_frozen_next_to_slow_pulse():
+    # The fast pulse has more edges than MAX_PULSE_BREAKPOINTS, so only the slow one splits the run
+    t = np.linspace(0, 130, 1301)
+    proteinArray = [
+        Protein(0, "Fast", 0.0, 0.5, [], x_pulse, (0, 120, 0.1, 1.0, 0.5)),
+        Protein(1, "Slow", 0.0, 0.5, [], x_pulse, (10, 100, 40, 1.0, 0.5)),
+        Protein(2, "C", 0.0, 1.0, [Gate("act_hill", firstInput=0, firstHill=2)], beta=1),
+    ]
+    assert 0 < len(input_breakpoints(compile_circuit(proteinArray), 0, 130)) < 10
+    # A step limit below the pulse width keeps the solver from stepping over pulses
+    split = run_simulation(t, proteinArray, max_step=0.01)
+    unsplit = run_simulation(t, proteinArray, split_at_pulses=False, max_step=0.01)
+    assert split[1199, 2] > 0.2
+    assert np.allclose(split, unsplit, atol=1e-4)
+
+
+def test_precompiled_circuit():
+    t = np.linspace(0, 20, 200)
+    proteinArray = [
+        Protein(0, "Protein 0", 0.0, 1, [], x_pulse, (0, 15.0, 6, 1.0, 0.5)),
+        Protein(1, "Protein 1", 0.0, 1, [Gate("act_hill", firstInput=0, firstHill=3)]),
+    ]
+    circuit = compile_circuit(proteinArray)
+    assert np.array_equal(run_simulation(t, circuit), run_simulation(t, proteinArray))
+    with pytest.raises(ValueError):
+        run_simulation(t, circuit, vectorized=False)
+
+
+@pytest.mark.parametrize("solver", ["BDF", "RK45"])
+def test_split_at_pulses_with_solve_ivp(solver):
+    t = np.linspace(0, 20, 500)
+    proteinArray = [
+        Protein(0, "Protein 0", 0.0, 1, [], x_pulse, (0, 15.0, 6, 1.0, 0.5)),
+        Protein(1, "Protein 1", 0.0, 1, [Gate("act_hill", firstInput=0, firstHill=3)]),
+        Protein(2, "Protein 2", 0.0, 1, [Gate("aa_and", firstInput=0, secondInput=1, firstHill=3, secondHill=3)]),
+    ]
+    expected = run_simulation(t, proteinArray, rtol=1e-10, atol=1e-10)
+    actual = run_simulation(t, proteinArray, solver=solver, rtol=1e-6, atol=1e-8)
+    assert np.allclose(actual, expected, atol=1e-4)
+
+
+@pytest.mark.parametrize("solver", ["odeint", "LSODA", "BDF", "RK45"])
+def test_run_ensemble_matches_individual_runs(solver):
+    t = np.linspace(0, 80, 400)
+
+    def xor_circuit(loss_c=0.1, hill_de=2, beta_e=1):
+        return [
+            Protein(0, "Protein A", 0.0, 0.0, [], x_pulse, (0, 40, 30, 2, 0.5)),
+            Protein(1, "Protein B", 0.0, 0.00, [],  x_pulse, (15, 50, 20, 2, 1)),
+            Protein(2, "Protein C", 0.0, loss_c, [Gate("aa_and", firstInput=0, secondInput=1)]),
+            Protein(3, "Protein D", 0.0, 0.1, [Gate("aa_or", firstInput=0, secondInput=1)]),
+            Protein(4, "Protein E", 0.0, 0.2, [Gate("ar_and", firstInput=3, secondInput=2, firstHill=hill_de, secondHill=2)], beta=beta_e)
+        ]
+
+    parameters = [("Protein C", "lossRate"), ("Protein D-Protein E", "hill"), ("Protein E", "beta")]
+    values = np.array([[0.1, 2, 1], [0.05, 1, 2], [0.3, 4, 0.5], [0.2, 3, 1.5]])
+
+    ensemble = run_ensemble(t, xor_circuit(), parameters, values, solver=solver)
+
+    assert ensemble.shape == (4, len(t), 5)
+    for member, row in zip(ensemble, values):
+        expected = run_simulation(t, xor_circuit(*row), rtol=1e-10, atol=1e-10)
+        assert np.allclose(member, expected, atol=1e-4 if solver == "odeint" else 2e-2)
+
+
+def toggle_switch(a0, b0):
+    return [
+        Protein(0, "Protein A", a0, 1, [Gate("rep_hill", firstInput=1, firstHill=2)], beta=5),
+        Protein(1, "Protein B", b0, 1, [Gate("rep_hill", firstInput=0, firstHill=2)], beta=5),
+    ]
+
+@pytest.mark.parametrize("initial", [(0.5, 3.0), (1.0, 1.2), (2.0, 1.9), (4.0, 0.0)])
+def test_find_steady_state_matches_long_integration(initial):
+    result = find_steady_state(toggle_switch(*initial))
+    expected = run_simulation(np.linspace(0, 1000, 100), toggle_switch(*initial))[-1]
+
+    assert result["converged"] and result["stable"]
+    assert result["residual"] <= 1e-8
+    assert np.allclose(result["concentrations"], expected, atol=1e-6)
+    assert np.all(result["eigenvalues"].real < 0)
+
+def test_find_steady_state_symmetric_toggle_is_a_saddle():
+    result = find_steady_state(toggle_switch(1.0, 1.0))
+    assert result["converged"] and not result["stable"]
+    assert result["concentrations"][0] == pytest.approx(result["concentrations"][1])
+    # One direction grows, the other decays
+    assert np.min(result["eigenvalues"].real) < 0 < np.max(result["eigenvalues"].real)
+
+def test_find_steady_state_freezes_inputs():
+    proteins = [
+        Protein(0, "Protein A", 0.0, 0.0, [], steady_state, [2.0]),
+        Protein(1, "Protein B", 0.0, 0.5, [Gate("act_hill", firstInput=0, firstHill=2)], beta=3),
+    ]
+    result = find_steady_state(proteins, t=100)
+    assert result["converged"]
+    # B = beta / degradation * A^2 / (1 + A^2)
+    assert np.allclose(result["concentrations"], [2.0, 6 * 4 / 5])
+
+def test_find_steady_state_unknown_solver():
+    with pytest.raises(ValueError):
+        find_steady_state(toggle_switch(1, 2), solver="euler")
+
+
+def test_decomposed_simulation_matches_full():
+    # Pulse-driven toggle switch feeding an incoherent feed-forward pair; C, D and E are all downstream
+    t = np.linspace(0, 60, 600)
+    proteins = [
+        Protein(0, "In", 0.0, 0.0, [], x_pulse, (10, 40, 20, 2, 0.5)),
+        Protein(1, "A", 1.0, 1.0, [Gate("ar_and", firstInput=0, secondInput=2, firstHill=1, secondHill=2)], beta=5),
+        Protein(2, "B", 0.5, 1.0, [Gate("rep_hill", firstInput=1, firstHill=2)], beta=5),
+        Protein(3, "C", 0.0, 0.3, [Gate("act_hill", firstInput=2, firstHill=2)]),
+        Protein(4, "D", 0.2, 0.5, [Gate("ar_and", firstInput=2, secondInput=3, firstHill=2, secondHill=2)], beta=2),
+        Protein(5, "E", 0.7, 0.2, []),
+    ]
+    expected = run_simulation(t, proteins, rtol=1e-10, atol=1e-10)
+    for solver in ("odeint", "BDF"):
+        result, info = run_simulation(t, proteins, solver=solver, decompose=True, rtol=1e-8, atol=1e-10, full_output=True)
+        assert info["components"] == 5
+        assert np.allclose(result, expected, atol=1e-5)
+
+def test_integrate_components_closed_form_for_unregulated_proteins():
+    proteins = [Protein(0, "A", 2.0, 0.5, []), Protein(1, "B", 0.0, 0.0, [], steady_state, [1.5])]
+    circuit = compile_circuit(proteins)
+    t = np.linspace(0, 10, 21)
+    internal, info = integrate_components(circuit, t, full_output=True)
+    assert info["nfev"] == 0
+    assert np.allclose(internal[:, 0], 2.0 * np.exp(-0.5 * t))
+    assert np.allclose(internal[:, 1], 0.0)
+
+
+def test_pruned_integration_matches_full_state():
+    # A is a constant input, so act_hill(A) on B folds; P is a decaying pulse input and E only decays
+    t = np.linspace(0, 40, 400)
+    proteins = [
+        Protein(0, "A", 0.0, 0.5, [], steady_state, [1.5]),
+        Protein(1, "P", 0.8, 0.4, [], x_pulse, (5, 30, 10, 2, 0.5)),
+        Protein(2, "B", 0.1, 1.0, [Gate("act_hill", firstInput=0, firstHill=2), Gate("rep_hill", firstInput=3, firstHill=2)], beta=3),
+        Protein(3, "C", 0.0, 0.5, [Gate("ar_and", firstInput=1, secondInput=2, firstHill=2, secondHill=1)], beta=2),
+        Protein(4, "E", 0.6, 0.3, []),
+    ]
+    circuit = compile_circuit(proteins)
+    reduced, members = prune_circuit(circuit, 0.0, circuit.getInitialConcentrations())
+    assert members.tolist() == [2, 3]
+    assert reduced.getNumStates() == 2
+    # rep_hill(C) and ar_and(P, B) remain
+    assert len(reduced.mGateTable[0]) == 2
+
+    breakpoints = input_breakpoints(circuit, t[0], t[-1])
+    for solver in ("odeint", "BDF"):
+        expected = integrate_circuit(circuit, t, method=solver, rtol=1e-10, atol=1e-10, breakpoints=breakpoints, prune=False)
+        internal, info = integrate_circuit(circuit, t, method=solver, rtol=1e-10, atol=1e-10, breakpoints=breakpoints,
+                                           full_output=True)
+        assert info["states"] == 2
+        assert internal.shape == (len(t), 5)
+        assert np.allclose(internal, expected, atol=1e-6)
+    assert np.allclose(internal[:, 4], 0.6 * np.exp(-0.3 * t))
+
+    # Resuming from a state where A has built up internal concentration keeps A's gate time-dependent
+    initial = np.array([1.0, 0.0, 0.5, 0.5, 0.0])
+    reduced, _ = prune_circuit(circuit, 10.0, initial)
+    assert len(reduced.mGateTable[0]) == 3
+    window = np.linspace(10, 20, 50)
+    assert np.allclose(
+        integrate_circuit(circuit, window, initial=initial, rtol=1e-10, atol=1e-10),
+        integrate_circuit(circuit, window, initial=initial, rtol=1e-10, atol=1e-10, prune=False), atol=1e-6
+    )
+
+    # Nothing to prune when every protein has gates
+    assert prune_circuit(compile_circuit(toggle_switch(1, 2)), 0.0, np.zeros(2)) is None
+
+
+def test_previous_run_is_reused_downstream_of_an_edit():
+    t = np.linspace(0, 60, 600)
+
+    def circuit(loss_rate):
+        return [
+            Protein(0, "In", 0.0, 0.0, [], x_pulse, (10, 40, 20, 2, 0.5)),
+            Protein(1, "A", 1.0, 1.0, [Gate("ar_and", firstInput=0, secondInput=2, firstHill=1, secondHill=2)], beta=5),
+            Protein(2, "B", 0.5, 1.0, [Gate("rep_hill", firstInput=1, firstHill=2)], beta=5),
+            Protein(3, "C", 0.0, 0.3, [Gate("act_hill", firstInput=2, firstHill=2)]),
+            Protein(4, "D", 0.2, loss_rate, [Gate("ar_and", firstInput=2, secondInput=3, firstHill=2, secondHill=2)], beta=2),
+        ]
+
+    _, info = run_simulation(t, circuit(0.5), full_output=True, rtol=1e-10, atol=1e-10)
+    assert info["reintegrated"] == 5
+    result, edited = run_simulation(t, circuit(0.9), full_output=True, rtol=1e-10, atol=1e-10, previous=info["record"])
+    assert edited["reintegrated"] == 1
+    assert np.allclose(result, run_simulation(t, circuit(0.9), rtol=1e-10, atol=1e-10), atol=1e-6)
+
+    # Nothing to reuse on another time grid or with other solver settings
+    _, other = run_simulation(t[:300], circuit(0.9), full_output=True, previous=info["record"])
+    assert other["reintegrated"] == 5
+    _, other = run_simulation(t, circuit(0.9), full_output=True, solver="BDF", previous=info["record"])
+    assert other["reintegrated"] == 5
+
+
+def test_reintegration_falls_back_on_a_coarse_grid():
+    def circuit(loss_rate):
+        return [
+            Protein(0, "A", 1.0, 1.0, [Gate("rep_hill", firstInput=2, firstHill=3)], beta=10),
+            Protein(1, "B", 0.0, 1.0, [Gate("rep_hill", firstInput=0, firstHill=3)], beta=10),
+            Protein(2, "C", 0.0, 1.0, [Gate("rep_hill", firstInput=1, firstHill=3)], beta=10),
+            Protein(3, "D", 0.0, loss_rate, [Gate("act_hill", firstInput=0, firstHill=2)], beta=2),
+        ]
+
+    # Dense enough: only D is integrated again, from the replayed repressilator
+    t = np.linspace(0, 20, 1000)
+    _, info = run_simulation(t, circuit(1.0), full_output=True, rtol=1e-10, atol=1e-10)
+    result, edited = run_simulation(t, circuit(2.0), full_output=True, rtol=1e-10, atol=1e-10, previous=info["record"])
+    assert edited["reintegrated"] == 1
+    assert np.allclose(result, run_simulation(t, circuit(2.0), rtol=1e-10, atol=1e-10), atol=1e-5)
+
+    # Many oscillations per output point: the replay would be inexact, so everything is integrated
+    t = np.linspace(0, 1000, 1000)
+    _, info = run_simulation(t, circuit(1.0), full_output=True, rtol=1e-10, atol=1e-10)
+    result, edited = run_simulation(t, circuit(2.0), full_output=True, rtol=1e-10, atol=1e-10, previous=info["record"])
+    assert edited["reintegrated"] == 4
+    assert np.array_equal(result, run_simulation(t, circuit(2.0), rtol=1e-10, atol=1e-10))
+
+
+def test_window_and_extension_resume_from_checkpoints():
+    proteins = [
+        Protein(0, "In", 0.0, 0.0, [], x_pulse, (10, 40, 20, 2, 0.5)),
+        Protein(1, "A", 1.0, 1.0, [Gate("ar_and", firstInput=0, secondInput=2, firstHill=1, secondHill=2)], beta=5),
+        Protein(2, "B", 0.5, 1.0, [Gate("rep_hill", firstInput=1, firstHill=2)], beta=5),
+    ]
+    options = {"rtol": 1e-10, "atol": 1e-10}
+    store = CheckpointStore()
+    run_simulation(np.linspace(0, 20, 201), proteins, checkpoints=store, **options)
+    reference = np.linspace(0, 200, 2001)
+    expected = run_simulation(reference, proteins, **options)
+
+    extended, info = extend_simulation(200, proteins, store, num_points=1801, full_output=True, **options)
+    assert info["resumedFrom"] == 20
+    assert np.allclose(extended, expected[200:], atol=1e-7)
+
+    window, info = simulate_window(reference[1500:1601], proteins, store, full_output=True, **options)
+    assert 140 <= info["resumedFrom"] <= 150
+    assert np.allclose(window, expected[1500:1601], atol=1e-7)
+
+    # Checkpoints belong to one set of solver settings
+    _, info = simulate_window(reference[1500:1601], proteins, store, solver="BDF", full_output=True)
+    assert info["resumedFrom"] == 0
+
+def test_checkpoint_store_keeps_recent_circuits():
+    store = CheckpointStore(maxCircuits=2)
+    circuits = [compile_circuit([Protein(0, "A", value, 1.0, [])]) for value in (1.0, 2.0, 3.0)]
+    t = np.linspace(0, 10, 101)
+    for circuit in circuits:
+        store.add(circuit, (), t, np.zeros((len(t), 1)))
+    assert store.latest(circuits[0], ()) is None
+    time, state = store.latest(circuits[2], (), 5.05)
+    assert 4 < time <= 5.05 and state.shape == (1,)
+    assert store.latest(circuits[2], (), -1) is None
+
+
 # TODO: handle command line args, to run individual tests if desired
 def main():
     print("Running all test cases...")
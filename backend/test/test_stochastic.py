@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from backend.protein import Protein, Gate
+from backend.simulate import run_simulation, steady_state, x_pulse
+from backend.stochastic import run_stochastic, STOCHASTIC_METHODS
+
+
+def birth_death(input_args=(1.0,), input_func=steady_state):
+    """B is produced at a constant rate 10 * act_hill(A) = 5 while A = 1 and degraded at rate 0.5."""
+    return [
+        Protein(0, "A", 0.0, 0.0, [], input_func, input_args),
+        Protein(1, "B", 0.0, 0.5, [Gate("act_hill", firstInput=0)], beta=10),
+    ]
+
+
+class TestStochastic:
+    """Statistics of run_stochastic against known distributions and the deterministic model"""
+
+    @pytest.mark.parametrize("method", STOCHASTIC_METHODS)
+    def test_birth_death_is_poisson(self, method):
+        t = np.linspace(0, 20, 41)
+        volume = 10
+        result = run_stochastic(t, birth_death(), 2000, method, seed=0, volume=volume)
+        # Stationary copy number is Poisson with mean volume * 5 / 0.5, i.e. concentration mean 10, variance 10 / volume
+        assert result["mean"][-1, 1] == pytest.approx(10, rel=0.02)
+        assert result["variance"][-1, 1] == pytest.approx(10 / volume, rel=0.15)
+        # Inputs are reported like run_simulation: internal copy number plus the external value
+        assert np.allclose(result["mean"][:, 0], 1.0)
+        assert np.allclose(result["variance"][:, 0], 0.0)
+
+    @pytest.mark.parametrize("method", STOCHASTIC_METHODS)
+    def test_mean_follows_deterministic_model(self, method):
+        t = np.linspace(0, 20, 41)
+        proteins = birth_death()
+        result = run_stochastic(t, proteins, 2000, method, seed=1, volume=10, tau=0.05)
+        assert np.allclose(result["mean"], run_simulation(t, proteins), atol=0.1)
+
+    def test_ssa_stops_at_input_switches(self):
+        # Nothing can happen before the pulse starts, so SSA must not draw one infinite waiting time
+        t = np.linspace(0, 30, 61)
+        result = run_stochastic(t, birth_death((10, 30, 40, 1.0, 1), x_pulse), 500, "ssa", seed=2, volume=10)
+        assert np.all(result["mean"][t < 10, 1] == 0)
+        assert result["mean"][-1, 1] == pytest.approx(10 * (1 - np.exp(-0.5 * 20)), rel=0.03)
+
+    def test_ssa_stops_at_every_edge_of_a_fast_pulse(self):
+        # 3800 edges, more than the ODE solver restarts at; the pulse starts off, with every propensity 0
+        proteins = [
+            Protein(0, "In", 0.0, 0.5, [], x_pulse, (1, 50, 0.01, 1.0, 0.5)),
+            Protein(1, "B", 0.0, 1.0, [Gate("act_hill", firstInput=0, firstHill=2)], beta=10),
+        ]
+        t = np.linspace(0, 20, 21)
+        result = run_stochastic(t, proteins, 500, "ssa", seed=3)
+        expected = run_simulation(t, proteins, solver="RK45", max_step=0.001)
+        assert np.mean(result["mean"][10:, 1]) == pytest.approx(np.mean(expected[10:, 1]), rel=0.05)
+
+    @pytest.mark.parametrize("method", STOCHASTIC_METHODS)
+    def test_seed_reproducibility(self, method):
+        t = np.linspace(0, 5, 11)
+        first = run_stochastic(t, birth_death(), 50, method, seed=42, num_raw=5)
+        second = run_stochastic(t, birth_death(), 50, method, seed=42, num_raw=5)
+        other = run_stochastic(t, birth_death(), 50, method, seed=43, num_raw=5)
+        assert np.array_equal(first["trajectories"], second["trajectories"])
+        assert not np.array_equal(first["trajectories"], other["trajectories"])
+
+    def test_raw_trajectories(self):
+        t = np.linspace(0, 5, 11)
+        result = run_stochastic(t, birth_death(), 20, "ssa", seed=0, volume=4, num_raw=3)
+        assert result["trajectories"].shape == (3, 11, 2)
+        # Copy numbers are integers, reported as copy number / volume
+        assert np.allclose(result["trajectories"][..., 1] * 4, np.round(result["trajectories"][..., 1] * 4))
+        assert result["trajectories"][:, 0, 1].tolist() == [0, 0, 0]
+
+    def test_invalid_arguments(self):
+        t = np.linspace(0, 1, 3)
+        with pytest.raises(ValueError):
+            run_stochastic(t, birth_death(), 10, "euler")
+        with pytest.raises(ValueError):
+            run_stochastic(t, birth_death(), 10, volume=0)
+        with pytest.raises(ValueError):
+            run_stochastic(t, birth_death(), 10, "tau_leaping", tau=-1)
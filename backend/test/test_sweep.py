@@ -0,0 +1,115 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from backend.parser import parse_circuit
+from backend.sensitivity import TrajectoryMetrics
+from backend.simulate import run_ensemble
+from backend.sweep import axis_values, grid_samples, latin_hypercube_samples, run_sweep, sweep_points
+
+TOGGLE_SWITCH = os.path.join(os.path.dirname(__file__), "parser_test_data", "toggle_switch_input.json")
+
+
+def load_circuit():
+    with open(TOGGLE_SWITCH) as f:
+        return json.load(f)
+
+
+def protein_names(circuit_json):
+    return [p.getName() for p in parse_circuit(circuit_json)]
+
+
+class TestSweepPoints:
+    """Unit tests for sweep specification parsing"""
+
+    def test_axis_values(self):
+        assert np.allclose(axis_values({"values": [1, 2, 4]}), [1, 2, 4])
+        assert np.allclose(axis_values({"min": 0, "max": 1, "num": 3}), [0, 0.5, 1])
+        with pytest.raises(ValueError):
+            axis_values({"target": "A", "parameter": "beta"})
+        with pytest.raises(ValueError):
+            axis_values({"values": []})
+
+    def test_grid_samples(self):
+        samples = grid_samples([{"values": [1, 2]}, {"values": [10, 20, 30]}])
+        assert samples.shape == (6, 2)
+        assert np.allclose(samples[:3], [[1, 10], [1, 20], [1, 30]])
+
+    def test_latin_hypercube_samples(self):
+        axes = [{"min": 0, "max": 1}, {"values": [5, 7, 6]}]
+        samples = latin_hypercube_samples(axes, 50, seed=3)
+        assert samples.shape == (50, 2)
+        assert samples[:, 0].min() >= 0 and samples[:, 0].max() <= 1
+        assert samples[:, 1].min() >= 5 and samples[:, 1].max() <= 7
+        # One sample per stratum in every dimension
+        assert len(np.unique(np.floor(samples[:, 0] * 50))) == 50
+        assert np.allclose(samples, latin_hypercube_samples(axes, 50, seed=3))
+
+    def test_sweep_points(self):
+        sweep = {"axes": [{"target": "A", "parameter": "beta", "values": [1, 2]},
+                          {"target": "B", "parameter": "lossRate", "min": 0.5, "max": 1.5, "num": 3}]}
+        parameters, values = sweep_points(sweep)
+        assert parameters == [("A", "beta"), ("B", "lossRate")]
+        assert values.shape == (6, 2)
+
+        _, values = sweep_points({**sweep, "mode": "latin_hypercube", "samples": 7, "seed": 1})
+        assert values.shape == (7, 2)
+
+        with pytest.raises(ValueError):
+            sweep_points({"axes": []})
+        with pytest.raises(ValueError):
+            sweep_points({**sweep, "mode": "sobol"})
+
+
+class TestRunSweep:
+    """Process-pool sweeps against in-process ensembles"""
+
+    def test_sweep_matches_ensemble(self):
+        circuit_json = load_circuit()
+        names = protein_names(circuit_json)
+        parameters = [(names[0], "beta"), (names[1], "initialConcentration")]
+        values = grid_samples([{"values": [0.5, 1.0, 2.0]}, {"values": [0.0, 1.0, 3.0]}])
+        t = np.linspace(0, 10, 50)
+
+        chunks = list(run_sweep(circuit_json, parameters, values, t, chunk_size=4, workers=2, output="trajectory"))
+        assert len(chunks) == 3
+        result = np.empty((len(values), len(t), len(names)))
+        for chunk in chunks:
+            assert chunk["proteinNames"] == names
+            assert np.allclose(chunk["values"], values[chunk["indices"]])
+            result[chunk["indices"]] = chunk["concentrations"]
+            json.dumps(chunk["info"])
+
+        expected = run_ensemble(t, parse_circuit(circuit_json), parameters, values)
+        assert np.allclose(result, expected, atol=1e-4)
+
+    def test_final_output(self):
+        circuit_json = load_circuit()
+        names = protein_names(circuit_json)
+        values = [[0.5], [2.0]]
+        t = np.linspace(0, 10, 50)
+        (chunk,) = run_sweep(circuit_json, [(names[0], "lossRate")], values, t, workers=1)
+        assert chunk["concentrations"].shape == (2, len(names))
+
+    def test_reduced_output(self):
+        circuit_json = load_circuit()
+        names = protein_names(circuit_json)
+        values = np.linspace(0.5, 2.0, 12)[:, np.newaxis]
+        t = np.linspace(0, 10, 50)
+        reduce = TrajectoryMetrics([0, 1], ["max", "final"])
+        # More chunks than can be in flight at once
+        chunks = list(run_sweep(circuit_json, [(names[0], "lossRate")], values, t, chunk_size=1, workers=2, output=reduce))
+        assert len(chunks) == 12
+        reduced = np.empty((12, 2))
+        for chunk in chunks:
+            reduced[chunk["indices"]] = chunk["concentrations"]
+        expected = run_ensemble(t, parse_circuit(circuit_json), [(names[0], "lossRate")], values)
+        assert np.allclose(reduced[:, 0], expected[:, :, 0].max(axis=1))
+        assert np.allclose(reduced[:, 1], expected[:, -1, 1])
+
+    def test_unknown_parameter(self):
+        with pytest.raises(ValueError):
+            next(run_sweep(load_circuit(), [("NotAProtein", "beta")], [[1.0]], np.linspace(0, 1, 5)))
+        with pytest.raises(ValueError):
+            next(run_sweep(load_circuit(), [], [[1.0]], np.linspace(0, 1, 5), output="mean"))
@@ -1,6 +1,12 @@
 interface CircuitSettingsType {
     projectName: string,
     simulationDuration: number,
-    numTimePoints: number
+    numTimePoints: number,
+    solver?: 'odeint' | 'LSODA' | 'BDF' | 'Radau' | 'RK45' | 'DOP853',
+    rtol?: number,
+    atol?: number,
+    maxStep?: number,
+    decompose?: boolean,
+    cacheResults?: boolean
 }
 export default CircuitSettingsType;
\ No newline at end of file
@@ -6,7 +6,7 @@ interface ProteinData extends Record<string, unknown>{
     // delay: number;
     inputs: number;
     outputs: number;
-    inputFunctionType: 'steady-state' | 'pulse';
+    inputFunctionType: 'steady-state' | 'pulse' | 'table';
     inputFunctionData: {
         steadyStateValue: number;
         timeStart: number;
@@ -14,6 +14,13 @@ interface ProteinData extends Record<string, unknown>{
         pulsePeriod: number;
         amplitude: number;
         dutyCycle: number;
+        // 'table' inputs: a .npy/.csv file or inline samples
+        file?: string;
+        timeColumn?: number | string;
+        valueColumn?: number | string;
+        times?: number[];
+        values?: number[];
+        interpolation?: 'linear' | 'cubic';
     }
 }
 